@@ -47,4 +47,137 @@ def check_and_migrate_tables():
                 except Exception as e:
                     print(f"[Migration] Error adding automation_enabled: {e}")
 
+        # 3b. Check 'clients' for inbound_turn_at / outbound_turn_at (response-time pairing)
+        if inspector.has_table("clients"):
+            columns = [col["name"] for col in inspector.get_columns("clients")]
+            for column in ("inbound_turn_at", "outbound_turn_at"):
+                if column not in columns:
+                    print(f"[Migration] Adding missing column: clients.{column}")
+                    try:
+                        conn.execute(text(f"ALTER TABLE clients ADD COLUMN {column} TIMESTAMP WITH TIME ZONE"))
+                        conn.commit()
+                    except Exception as e:
+                        print(f"[Migration] Error adding {column}: {e}")
+
+        # 4. Check 'messages' for 'ai_generated' (daily rollups split AI vs human)
+        if inspector.has_table("messages"):
+            columns = [col["name"] for col in inspector.get_columns("messages")]
+            if "ai_generated" not in columns:
+                print("[Migration] Adding missing column: messages.ai_generated")
+                try:
+                    conn.execute(text("ALTER TABLE messages ADD COLUMN ai_generated BOOLEAN DEFAULT FALSE"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding ai_generated: {e}")
+
+        # 4b. Check 'conversation_states' for 'stage_entered_at' (time-in-stage analytics)
+        if inspector.has_table("conversation_states"):
+            columns = [col["name"] for col in inspector.get_columns("conversation_states")]
+            if "stage_entered_at" not in columns:
+                print("[Migration] Adding missing column: conversation_states.stage_entered_at")
+                try:
+                    conn.execute(text("ALTER TABLE conversation_states ADD COLUMN stage_entered_at TIMESTAMP WITH TIME ZONE"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding stage_entered_at: {e}")
+
+        # 4c. Check 'media_assets' for transcode job columns
+        if inspector.has_table("media_assets"):
+            columns = [col["name"] for col in inspector.get_columns("media_assets")]
+            for column, ddl in (("status", "VARCHAR DEFAULT 'ready'"), ("source_filename", "VARCHAR")):
+                if column not in columns:
+                    print(f"[Migration] Adding missing column: media_assets.{column}")
+                    try:
+                        conn.execute(text(f"ALTER TABLE media_assets ADD COLUMN {column} {ddl}"))
+                        conn.commit()
+                    except Exception as e:
+                        print(f"[Migration] Error adding {column}: {e}")
+
+        # 4d. Check 'agent_turn_metrics' for prompt cache / history token columns
+        if inspector.has_table("agent_turn_metrics"):
+            columns = [col["name"] for col in inspector.get_columns("agent_turn_metrics")]
+            for column in ("cached_tokens", "history_tokens"):
+                if column not in columns:
+                    print(f"[Migration] Adding missing column: agent_turn_metrics.{column}")
+                    try:
+                        conn.execute(text(f"ALTER TABLE agent_turn_metrics ADD COLUMN {column} INTEGER DEFAULT 0"))
+                        conn.commit()
+                    except Exception as e:
+                        print(f"[Migration] Error adding {column}: {e}")
+
+        # 4e. Check 'conversation_states' for 'summary_until' (rolling history summary)
+        if inspector.has_table("conversation_states"):
+            columns = [col["name"] for col in inspector.get_columns("conversation_states")]
+            if "summary_until" not in columns:
+                print("[Migration] Adding missing column: conversation_states.summary_until")
+                try:
+                    conn.execute(text("ALTER TABLE conversation_states ADD COLUMN summary_until TIMESTAMP WITH TIME ZONE"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding summary_until: {e}")
+
+        # 4f. Check 'agent_turn_metrics' for 'first_message_ms' (streamed replies)
+        if inspector.has_table("agent_turn_metrics"):
+            columns = [col["name"] for col in inspector.get_columns("agent_turn_metrics")]
+            if "first_message_ms" not in columns:
+                print("[Migration] Adding missing column: agent_turn_metrics.first_message_ms")
+                try:
+                    conn.execute(text("ALTER TABLE agent_turn_metrics ADD COLUMN first_message_ms FLOAT"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding first_message_ms: {e}")
+
+        # 4g. Check 'message_daily_stats' for 'bulk_count' (kept across rollup rebuilds)
+        if inspector.has_table("message_daily_stats"):
+            columns = [col["name"] for col in inspector.get_columns("message_daily_stats")]
+            if "bulk_count" not in columns:
+                print("[Migration] Adding missing column: message_daily_stats.bulk_count")
+                try:
+                    conn.execute(text("ALTER TABLE message_daily_stats ADD COLUMN bulk_count INTEGER NOT NULL DEFAULT 0"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding bulk_count: {e}")
+
+        # 4h. Check 'import_jobs' for 'heartbeat_at' (lease of the worker running a job)
+        if inspector.has_table("import_jobs"):
+            columns = [col["name"] for col in inspector.get_columns("import_jobs")]
+            if "heartbeat_at" not in columns:
+                print("[Migration] Adding missing column: import_jobs.heartbeat_at")
+                try:
+                    conn.execute(text("ALTER TABLE import_jobs ADD COLUMN heartbeat_at TIMESTAMP"))
+                    conn.commit()
+                except Exception as e:
+                    print(f"[Migration] Error adding heartbeat_at: {e}")
+
+        # 5. Indexes used by the analytics dashboard (create_all skips existing tables)
+        for index_name, table, columns in [
+            ("ix_messages_user_sent_at", "messages", "user_id, sent_at"),
+            ("ix_client_tags_tag_id", "client_tags", "tag_id"),
+        ]:
+            if inspector.has_table(table):
+                existing = [ix["name"] for ix in inspector.get_indexes(table)]
+                if index_name not in existing:
+                    print(f"[Migration] Creating index: {index_name}")
+                    try:
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
+                        conn.commit()
+                    except Exception as e:
+                        print(f"[Migration] Error creating index {index_name}: {e}")
+
+    # 6. Backfill message_daily_stats the first time it exists next to existing history
+    if inspector.has_table("messages"):
+        from app.db.session import SessionLocal
+        from app.models import Message, MessageDailyStat
+        from app.services.message_stats import rebuild_daily_stats
+        db = SessionLocal()
+        try:
+            if db.query(MessageDailyStat.id).first() is None and db.query(Message.id).first() is not None:
+                print("[Migration] Backfilling message_daily_stats from message history...")
+                rows = rebuild_daily_stats(db)
+                print(f"[Migration] message_daily_stats backfilled ({rows} rows).")
+        except Exception as e:
+            print(f"[Migration] Error backfilling message_daily_stats: {e}")
+        finally:
+            db.close()
+
     print("[Migration] Schema check complete.")
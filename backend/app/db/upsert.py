@@ -0,0 +1,20 @@
+"""
+Dialect-aware INSERT ... ON CONFLICT helpers.
+PostgreSQL (production) and SQLite (local dev/tests) share the same API.
+"""
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Session, table):
+    """
+    Return an INSERT construct for the session's dialect that supports
+    .on_conflict_do_update() / .on_conflict_do_nothing() and .excluded.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert not supported for dialect: {dialect}")
+    return insert(table)
@@ -30,6 +30,33 @@ async def startup_event():
     except Exception as e:
         print(f"Migration Error: {e}")
 
+    # 2b. Resume client imports interrupted by the last restart
+    try:
+        from app.services.import_jobs import resume_pending_jobs
+        resumed = resume_pending_jobs()
+        if resumed:
+            print(f"[Startup] Resumed {resumed} import job(s)")
+    except Exception as e:
+        print(f"[Startup] Import job resume failed: {e}")
+
+    # 2c. Re-queue media conversions interrupted by the last restart
+    try:
+        from app.services.media_jobs import resume_pending_transcodes
+        from app.services.media_store import MEDIA_DIR
+        resumed = resume_pending_transcodes(MEDIA_DIR)
+        if resumed:
+            print(f"[Startup] Resumed {resumed} media conversion(s)")
+    except Exception as e:
+        print(f"[Startup] Media conversion resume failed: {e}")
+
+    # 2d. Media retention sweeper (unreferenced uploads, leftovers, quotas)
+    try:
+        from app.services.scheduler import schedule_interval_job
+        from app.services.media_retention import run_media_sweep, MEDIA_SWEEP_INTERVAL_HOURS
+        schedule_interval_job("media_retention_sweep", run_media_sweep, MEDIA_SWEEP_INTERVAL_HOURS)
+    except Exception as e:
+        print(f"[Startup] Media sweeper scheduling failed: {e}")
+
     # 3. Auto-Sync Inventory (Railway Fix - INLINE to avoid import issues)
     try:
         print("[Startup] Syncing Inventory from Vercel...")
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, Date, Float, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, Date, Float, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import uuid
@@ -53,6 +53,10 @@ class Client(Base):
     # Relationship Score
     relationship_score = Column(Float, default=50.0)  # 0-100 warmth score
     
+    # Start of the latest inbound/outbound turn - pairs messages for response-time metrics
+    inbound_turn_at = Column(DateTime(timezone=True), nullable=True)
+    outbound_turn_at = Column(DateTime(timezone=True), nullable=True)
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -90,6 +94,10 @@ class ClientTag(Base):
     tag_id = Column(String, ForeignKey("tags.id", ondelete="CASCADE"), nullable=False)
     assigned_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_client_tags_tag_id", "tag_id"),
+    )
+
 
 # Default pipeline tags (created per user on first login)
 DEFAULT_TAGS = [
@@ -122,12 +130,150 @@ class Message(Base):
     # Status
     status = Column(String, default="sent")  # sent, delivered, read, failed
     whatsapp_message_id = Column(String, nullable=True)  # ID from WhatsApp
+    ai_generated = Column(Boolean, default=False)  # Sent by the AI Sales Clone
     
     # Timestamps
     sent_at = Column(DateTime(timezone=True), server_default=func.now())
     delivered_at = Column(DateTime(timezone=True), nullable=True)
     read_at = Column(DateTime(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # Dashboard/analytics scans filter by owner and time window
+        Index("ix_messages_user_sent_at", "user_id", "sent_at"),
+    )
+
+
+class MessageDailyStat(Base):
+    """
+    Daily message rollup per user. Maintained incrementally on message writes
+    so analytics read a few hundred rows instead of scanning `messages`.
+    Rebuild from history with `python rebuild_message_stats.py`.
+    """
+    __tablename__ = "message_daily_stats"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    direction = Column(String, nullable=False)  # 'outbound' or 'inbound'
+    channel = Column(String, nullable=False, default="whatsapp")
+    ai_generated = Column(Boolean, nullable=False, default=False)
+    count = Column(Integer, nullable=False, default=0)
+    # Part of `count` from bulk sends, which leave no `messages` rows; kept by rebuilds
+    bulk_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "direction", "channel", "ai_generated", name="uq_message_daily_stats_key"),
+    )
+
+
+class ResponseTimeStat(Base):
+    """
+    Running response-time metrics, updated in O(1) per inbound/outbound pair.
+    scope='client' rows are per conversation, scope='user' rows aggregate a
+    salesperson's account. `responder` is who answered: 'ai', 'human',
+    'automation' (automation-rule sends), 'first' (first reply a lead ever got) or 'client' (lead answering us).
+    """
+    __tablename__ = "response_time_stats"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    scope = Column(String, nullable=False)      # 'user' | 'client'
+    scope_id = Column(String, nullable=False)   # user_id or client_id
+    responder = Column(String, nullable=False)  # 'ai' | 'human' | 'automation' | 'first' | 'client'
+    count = Column(Integer, nullable=False, default=0)
+    mean_seconds = Column(Float, nullable=False, default=0.0)
+    min_seconds = Column(Float, nullable=True)
+    max_seconds = Column(Float, nullable=True)
+    histogram = Column(JSON, nullable=True)     # Log-bucket counts, see services/response_times.py
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("scope", "scope_id", "responder", name="uq_response_time_stats_key"),
+        Index("ix_response_time_stats_user", "user_id"),
+    )
+
+
+class ImportJob(Base):
+    """
+    Background client import. The upload is kept on disk until the worker
+    finishes; counters are updated after every chunk so clients can poll.
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=True)    # Original upload name
+    file_path = Column(String, nullable=True)   # Spooled upload on disk
+    error_file_path = Column(String, nullable=True)
+    status = Column(String, default="queued")   # queued, running, completed, failed
+    parsed = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    message = Column(Text, nullable=True)       # Fatal error, if any
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Lease of the worker running it, renewed per chunk
+
+
+class ImportColumnMapping(Base):
+    """
+    Learned header -> Client column mapping per user, keyed by a signature of
+    the normalized header set, so repeat imports of the same export format
+    skip the LLM. Headers are stored normalized (see services/client_import.py).
+    """
+    __tablename__ = "import_column_mappings"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    header_signature = Column(String, nullable=False)
+    headers = Column(JSON, nullable=True)      # Normalized headers, for reference
+    mapping = Column(JSON, nullable=False)     # {target_column: normalized_header}
+    source = Column(String, default="ai")      # 'synonyms' | 'ai'
+    use_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "header_signature", name="uq_import_column_mappings_signature"),
+    )
+
+
+class MediaAsset(Base):
+    """
+    One stored media file, addressed by the SHA-256 of the uploaded bytes.
+    Identical uploads share the asset; the stored file is named
+    `<sha256>.<ext>` (ext of the served file, e.g. .mp4 after transcoding).
+    """
+    __tablename__ = "media_assets"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    sha256 = Column(String, unique=True, nullable=False)
+    filename = Column(String, nullable=False)      # Stored/served file name
+    mimetype = Column(String, nullable=True)
+    media_type = Column(String, nullable=True)     # image, video, audio, document
+    size_bytes = Column(Integer, default=0)
+    upload_count = Column(Integer, default=1)
+    status = Column(String, default="ready")           # processing, ready, failed (transcode jobs)
+    source_filename = Column(String, nullable=True)    # Original kept on disk while processing / if it failed
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MediaUpload(Base):
+    """Every upload request, deduplicated or not - feeds storage/dedupe reporting"""
+    __tablename__ = "media_uploads"
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    asset_id = Column(String, ForeignKey("media_assets.id", ondelete="CASCADE"), nullable=False, index=True)
+    original_filename = Column(String, nullable=True)
+    size_bytes = Column(Integer, default=0)
+    deduplicated = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 
 class Automation(Base):
     """Automation Rules (If X then Y)"""
@@ -229,6 +375,7 @@ class ConversationState(Base):
     # ===== STATE MACHINE =====
     stage = Column(String, default="INTAKE")  
     # Stages: INTAKE, CREDIT_PROFILE, DEAL_TYPE, OFFER_BUILD, RECOMMENDATION, APPOINTMENT, WRAP
+    stage_entered_at = Column(DateTime(timezone=True), nullable=True)  # When the current stage began
     
     status_color = Column(String, default="yellow")  # green, yellow, red
     # 🟢 green = appointment scheduled
@@ -267,7 +414,8 @@ class ConversationState(Base):
     last_message_at = Column(DateTime(timezone=True), nullable=True)
     
     # ===== CONVERSATION SUMMARY =====
-    conversation_summary = Column(Text, nullable=True)  # "Moraleja" for human seller
+    conversation_summary = Column(Text, nullable=True)  # "Moraleja" for human seller; rolling summary of turns outside the agent's history window
+    summary_until = Column(DateTime(timezone=True), nullable=True)  # sent_at of the last message folded into the summary
     key_objections = Column(JSON, nullable=True)  # List of objections raised
     
     # ===== CALCULATED OFFERS =====
@@ -278,6 +426,53 @@ class ConversationState(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class ConversationStageEvent(Base):
+    """
+    Append-only log of stage transitions (one row each time a conversation
+    enters a stage). Feeds funnel, time-in-stage and cohort analytics.
+    """
+    __tablename__ = "conversation_stage_events"
+    __table_args__ = (
+        Index("ix_conversation_stage_events_user_entered", "user_id", "entered_at"),
+    )
+    
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    client_id = Column(String, ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    from_stage = Column(String, nullable=True)  # None for the first stage
+    stage = Column(String, nullable=False)
+    entered_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class AgentTurnMetric(Base):
+    """
+    One RAY agent turn: which mode answered, how many LLM calls and tokens it
+    cost and how long the buyer waited. memory_* columns are filled in later
+    by the background memory update when it needs its own extraction call.
+    """
+    __tablename__ = "agent_turn_metrics"
+    __table_args__ = (
+        Index("ix_agent_turn_metrics_user_created", "user_id", "created_at"),
+    )
+
+    id = Column(String, primary_key=True, default=get_uuid)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    client_id = Column(String, ForeignKey("clients.id", ondelete="CASCADE"), nullable=True)
+    mode = Column(String, nullable=False)              # unified | classic | cache
+    llm_calls = Column(Integer, default=0)             # Reply path only
+    tool_calls = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)         # Prompt tokens hit in the provider prefix cache
+    history_tokens = Column(Integer, default=0)        # Part of the prompt taken by conversation history
+    memory_llm_calls = Column(Integer, default=0)      # Insight extraction, if it ran
+    memory_tokens = Column(Integer, default=0)
+    reply_ms = Column(Float, nullable=True)
+    first_message_ms = Column(Float, nullable=True)    # Streamed turns: until the first chunk was sent
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 # Stage constants for reference
 CONVERSATION_STAGES = [
     "INTAKE",           # 0 - Identify what they want + first buyer?
@@ -1,11 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from app.db.session import get_db
 from app.deps import get_current_user
 from app.models import User, Client, Message, Tag, ClientTag
+from app.utils.cache import dashboard_cache
+from app.services.funnel_analytics import get_funnel, get_cohorts
+from app.services.response_times import get_response_time_report
+from app.services.message_stats import get_daily_totals
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
@@ -14,78 +19,76 @@ async def get_dashboard_metrics(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get aggregated metrics for the dashboard"""
-    
-    # 1. Pipeline Distribution (Clients by Tag)
-    # Get all tags for user to ensure we include 0 counts
-    user_tags = db.query(Tag).filter(Tag.user_id == current_user.id).order_by(Tag.order).all()
-    
-    pipeline_data = []
-    total_tagged_clients = 0
-    
-    for tag in user_tags:
-        count = db.query(func.count(ClientTag.client_id)).filter(
-            ClientTag.tag_id == tag.id
-        ).scalar()
-        
-        pipeline_data.append({
-            "tag_id": tag.id,
-            "tag_name": tag.name,
-            "color": tag.color,
-            "count": count
-        })
-        total_tagged_clients += count
+    """Get aggregated metrics for the dashboard (cached per user for a short TTL)"""
+    user_id = str(current_user.id)
+    cached = dashboard_cache.get(user_id)
+    if cached is not None:
+        return cached
+    
+    payload = build_dashboard_metrics(db, user_id)
+    dashboard_cache.set(user_id, payload)
+    return payload
 
-    # 2. Total Clients count
-    total_clients = db.query(Client).filter(Client.user_id == current_user.id).count()
-    
-    # 3. Message Stats (Last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    
-    # Sent messages
-    sent_count = db.query(Message).filter(
-        Message.user_id == current_user.id,
-        Message.direction == "outbound",
-        Message.sent_at >= thirty_days_ago
-    ).count()
-    
-    # Received messages (Clients don't map perfectly one-to-one sometimes, but we filter by user_id if attached or client owned)
-    # Since Message.user_id is the owner, inbound messages are also stored with user_id
-    received_count = db.query(Message).filter(
-        Message.user_id == current_user.id,
-        Message.direction == "inbound",
-        Message.sent_at >= thirty_days_ago
-    ).count()
-    
-    # 4. Daily Message Activity (Last 7 days)
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    
-    daily_stats = db.query(
-        func.date(Message.sent_at).label('date'),
-        func.sum(case((Message.direction == 'outbound', 1), else_=0)).label('sent'),
-        func.sum(case((Message.direction == 'inbound', 1), else_=0)).label('received')
+
+def build_dashboard_metrics(db: Session, user_id: str) -> Dict[str, Any]:
+    """Assemble the dashboard payload with a fixed number of grouped queries"""
+    
+    # 1. Pipeline Distribution (Clients by Tag) - single grouped query.
+    # Outer join keeps tags with 0 clients.
+    tag_rows = db.query(
+        Tag.id,
+        Tag.name,
+        Tag.color,
+        func.count(ClientTag.client_id).label('count')
+    ).outerjoin(
+        ClientTag, ClientTag.tag_id == Tag.id
     ).filter(
-        Message.user_id == current_user.id,
-        Message.sent_at >= seven_days_ago
-    ).group_by(func.date(Message.sent_at)).all()
+        Tag.user_id == user_id
+    ).group_by(
+        Tag.id, Tag.name, Tag.color, Tag.order
+    ).order_by(Tag.order).all()
+    
+    pipeline_data = [
+        {
+            "tag_id": row.id,
+            "tag_name": row.name,
+            "color": row.color,
+            "count": row.count
+        }
+        for row in tag_rows
+    ]
+
+    # 2. Total Clients count
+    total_clients = db.query(func.count(Client.id)).filter(Client.user_id == user_id).scalar() or 0
+    
+    # 3. Message Stats - read from the daily rollup (a few rows per day)
+    # instead of scanning raw messages. See app/services/message_stats.py
+    now = datetime.utcnow()
+    thirty_days_ago = (now - timedelta(days=29)).date()
+    
+    daily_rows = get_daily_totals(db, user_id, since=thirty_days_ago)
+    
+    # day is a date on PostgreSQL and may come back as a string on SQLite
+    daily_stats = {str(row.day)[:10]: row for row in daily_rows}
+    sent_count = sum(int(row.sent or 0) for row in daily_rows)
+    received_count = sum(int(row.received or 0) for row in daily_rows)
     
-    # Format daily stats to ensure all days are present
+    # 4. Daily Message Activity (Last 7 days) - dict lookup per day
     activity_chart = []
     for i in range(7):
-        day = (datetime.utcnow() - timedelta(days=6-i)).date()
-        day_stat = next((s for s in daily_stats if s.date == day), None)
+        day = (now - timedelta(days=6-i)).strftime("%Y-%m-%d")
+        day_stat = daily_stats.get(day)
         activity_chart.append({
-            "date": day.strftime("%Y-%m-%d"),
-            "sent": day_stat.sent if day_stat else 0,
-            "received": day_stat.received if day_stat else 0
+            "date": day,
+            "sent": int(day_stat.sent or 0) if day_stat else 0,
+            "received": int(day_stat.received or 0) if day_stat else 0
         })
 
-    # 5. Conversion Rate (Clients with "Compró" tag / Total Clients with tags)
-    # Assuming 'Compró' is a standard name, or we check based on is_default and name
-    won_count = 0
-    won_tag = next((t for t in user_tags if t.name == "Compró" or t.name == "Won"), None)
-    if won_tag:
-        won_count = next((p["count"] for p in pipeline_data if p["tag_id"] == won_tag.id), 0)
+    # 5. Conversion Rate (Clients with "Compró" tag / Total Clients)
+    won_count = next(
+        (p["count"] for p in pipeline_data if p["tag_name"] in ("Compró", "Won")),
+        0
+    )
     
     conversion_rate = 0
     if total_clients > 0:
@@ -104,49 +107,118 @@ async def get_dashboard_metrics(
     }
 
 
+@router.get("/funnel")
+async def get_stage_funnel(
+    days: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Stage funnel over RAY conversations: clients reaching each stage,
+    conversion to the next stage and hours spent in each stage.
+    Optional `days` limits to conversations started in the last N days.
+    """
+    if days is not None and days < 1:
+        raise HTTPException(status_code=400, detail="days must be >= 1")
+    return await run_in_threadpool(get_funnel, db, str(current_user.id), days)
+
+
+@router.get("/cohorts")
+async def get_lead_cohorts(
+    weeks: int = 12,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Weekly lead cohorts: leads created per week and how far they progressed"""
+    if not 1 <= weeks <= 104:
+        raise HTTPException(status_code=400, detail="weeks must be between 1 and 104")
+    return await run_in_threadpool(get_cohorts, db, str(current_user.id), weeks)
+
+
+@router.get("/response-times")
+def get_response_times(
+    client_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Reply latency from the incrementally maintained stats: first-response
+    time to new leads, AI vs human reply time and how fast clients answer.
+    Pass `client_id` for a single conversation instead of the whole account.
+    """
+    return get_response_time_report(db, str(current_user.id), client_id)
+
+
 @router.get("/export")
 async def export_data(
     format: str = "csv",
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    dataset: str = "clients",
+    columns: Optional[str] = None,
+    compression: str = "zstd",
+    current_user: User = Depends(get_current_user)
 ):
-    """Export client data in CSV format"""
-    import csv
-    import io
+    """
+    Export account data.
+    - csv: client list (streamed in constant memory)
+    - parquet / arrow: columnar export of clients, messages, appointments or
+      conversation_states, with optional `columns=a,b,c` and `compression`.
+    """
     from fastapi.responses import StreamingResponse
+    from app.services.exports import stream_clients_csv, ANALYTICS_CLIENT_FIELDS, COLUMNAR_FORMATS
     
-    # Fetch all clients for user
-    clients = db.query(Client).filter(Client.user_id == current_user.id).all()
-    
-    # Prepare CSV data
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Header
-    writer.writerow(['ID', 'Name', 'Phone', 'Email', 'Notes', 'Status', 'Created At', 'Tags'])
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    for client in clients:
-        # Get tags
-        tags = db.query(Tag).join(ClientTag).filter(ClientTag.client_id == client.id).all()
-        tag_names = ", ".join([t.name for t in tags])
-        
-        writer.writerow([
-            client.id,
-            client.name,
-            client.phone,
-            client.email or "",
-            client.notes.replace('\n', ' ') if client.notes else "",
-            client.status or "",
-            client.created_at.strftime("%Y-%m-%d %H:%M:%S") if client.created_at else "",
-            tag_names
-        ])
+    if format in COLUMNAR_FORMATS:
+        return await run_in_threadpool(
+            _columnar_export_response, str(current_user.id), dataset, format, columns, compression, timestamp
+        )
     
-    output.seek(0)
+    if format != "csv":
+        raise HTTPException(status_code=400, detail=f"Invalid format. Use: csv, {', '.join(COLUMNAR_FORMATS)}")
+    if dataset != "clients":
+        raise HTTPException(status_code=400, detail="CSV export only supports dataset=clients. Use parquet or arrow.")
     
-    filename = f"clients_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    filename = f"clients_export_{timestamp}.csv"
     
     return StreamingResponse(
-        iter([output.getvalue()]),
+        stream_clients_csv(str(current_user.id), ANALYTICS_CLIENT_FIELDS, include_tags=True),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+
+def _columnar_export_response(user_id: str, dataset: str, fmt: str, columns: Optional[str], compression: str, timestamp: str):
+    """Write the export to a temp file in record batches, then hand it to FileResponse"""
+    import os
+    import tempfile
+    from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
+    from app.db.session import SessionLocal
+    from app.services.exports import write_columnar_export, COLUMNAR_FORMATS
+    
+    ext, media_type, _ = COLUMNAR_FORMATS[fmt]
+    fd, path = tempfile.mkstemp(suffix=ext, prefix="autoai_export_")
+    os.close(fd)
+    
+    db = SessionLocal()
+    try:
+        rows = write_columnar_export(db, user_id, dataset, fmt, path, columns=columns, compression=compression)
+    except ValueError as e:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail=str(e))
+    except ImportError:
+        os.remove(path)
+        raise HTTPException(status_code=500, detail="Columnar export requires pyarrow")
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        db.close()
+    
+    print(f"[Export] {dataset} -> {fmt} ({compression}): {rows} rows for user {user_id}")
+    return FileResponse(
+        path,
+        media_type=media_type,
+        filename=f"{dataset}_export_{timestamp}{ext}",
+        background=BackgroundTask(os.remove, path)
+    )
@@ -179,7 +179,8 @@ def execute_action(db: Session, user_id: str, action: AutomationAction, context:
             
             # Use the internal helper to send
             from app.routers.whatsapp_web import send_message_internal
-            send_message_internal(db, user_id, client_phone, final_message)
+            from app.services.response_times import RESPONDER_AUTOMATION
+            send_message_internal(db, user_id, client_phone, final_message, responder=RESPONDER_AUTOMATION)
             
         elif action.action_type == "WAIT":
              delay_minutes = int(action.action_payload.get("delay_minutes", 0))
@@ -1,16 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.deps import get_current_user
-from app.models import User, Client
-import pandas as pd
-import io
+from app.models import User, Client, ImportJob
 import datetime
 import traceback
 import os
-import json
-from openai import OpenAI
+from app.services.client_import import import_clients_file, IMPORT_EXTENSIONS
+from app.services.import_jobs import create_job, save_upload, submit_job, job_to_dict
 
 def log_debug(msg):
     log_path = r"c:\Users\RAYSA\Documents\autoai\backend\debug_import.log"
@@ -22,241 +20,117 @@ def log_debug(msg):
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-# Helper functions defined at module level to avoid redefinition
-def safe_date(val):
-    if pd.isna(val) or val is None: return None
-    s = str(val).strip()
-    if not s: return None
-    try:
-        # Try pandas first (handles most formats automatically)
-        dt = pd.to_datetime(s, errors='coerce')
-        if pd.notnull(dt):
-            return dt.date() # Return python date object
-        return None
-    except:
-        return None
-
-def safe_int(val):
-    if pd.isna(val) or val is None: return None
-    s = str(val).strip()
-    if not s: return None
-    try:
-        return int(float(s))
-    except:
-        return None
-
 @router.post("/import-clients")
 def import_clients(
     file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Import clients from CSV/Excel file (Bulk mode)"""
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    allowed_extensions = {'.csv', '.xlsx', '.xls'}
+    """Import clients from CSV/Excel file (Bulk mode, streamed in chunks)"""
     ext = "." + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
     
-    if ext not in allowed_extensions:
-        raise HTTPException(status_code=400, detail=f"Invalid file. Use: {', '.join(allowed_extensions)}")
+    if ext not in IMPORT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid file. Use: {', '.join(IMPORT_EXTENSIONS)}")
 
-    count = 0
-    errors = []
-    
     try:
-        # Read file synchronously (safe in 'def' route running in threadpool)
-        content = file.file.read()
-        
-        # Load DataFrame
-        if ext == '.csv':
-            df = pd.read_csv(io.BytesIO(content), dtype=str)
-        else:
-            df = pd.read_excel(io.BytesIO(content), dtype=str)
-        
-        df = df.fillna('')  # Handle NaNs
-        
-        if df.empty:
-            return {"imported_count": 0, "errors": ["File is empty"]}
-
-        # 1. AI Column Mapping
-        headers = list(df.columns)
-        prompt = f"""
-        Map these CSV headers to my database columns.
-        CSV Headers: {json.dumps(headers)}
-        
-        Target Columns:
-        - name (Required. If multiple, choose the one with full name)
-        - phone (Required)
-        - email
-        - address
-        - notes (or description/comments)
-        - car_make
-        - car_model
-        - car_year
-        - birth_date (Format: YYYY-MM-DD or similar)
-        - purchase_date (Date of vehicle purchase)
-        
-        Return JSON Key-Value pair: {{"target_column": "csv_header_name"}}
-        Only include found mappings. ignore others.
-        """
-        
-        completion = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are a data mapping assistant. Return strict JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={ "type": "json_object" }
-        )
-        
-        mapping = json.loads(completion.choices[0].message.content)
-        print(f"[Import] Column Mapping: {mapping}")
-        
-        # Validate critical columns
-        if 'name' not in mapping or 'phone' not in mapping:
-            # Fallback: exact match try
-            lower_headers = {h.lower(): h for h in headers}
-            if 'name' not in mapping and 'name' in lower_headers: mapping['name'] = lower_headers['name']
-            if 'name' not in mapping and 'nombre' in lower_headers: mapping['name'] = lower_headers['nombre']
-            if 'phone' not in mapping and 'phone' in lower_headers: mapping['phone'] = lower_headers['phone']
-            if 'phone' not in mapping and 'telefono' in lower_headers: mapping['phone'] = lower_headers['telefono']
-            
-            if 'name' not in mapping or 'phone' not in mapping:
-                 return {"imported_count": 0, "errors": [f"Could not find Name/Phone columns. Headers: {headers}"]}
-
-        # 2. Process Rows
-        for index, row in df.iterrows():
-            try:
-                # Extract data using mapping
-                name = str(row[mapping['name']]).strip()
-                phone_raw = str(row[mapping['phone']]).strip()
-                
-                if not name or not phone_raw:
-                    continue
-                    
-                # Clean Phone
-                phone_clean = ''.join(filter(lambda x: x.isdigit() or x == '+', phone_raw))
-                if len(phone_clean) < 7: # Basic validation
-                    continue
-
-                # Check Duplicate
-                existing = db.query(Client).filter(Client.user_id == current_user.id, Client.phone == phone_clean).first()
-                if existing:
-                    # Update info if found in import (Upsert Logic)
-                    updated = False
-                    
-                    # Update Name if different (and not empty)
-                    if name and existing.name != name:
-                        existing.name = name
-                        updated = True
-                        
-                    # Helper to update if new val is present
-                    def update_if_present(obj, attr, val):
-                        if val and getattr(obj, attr) != val:
-                            setattr(obj, attr, val)
-                            return True
-                        return False
-
-                    # Update fields
-                    if 'email' in mapping: updated |= update_if_present(existing, 'email', str(row[mapping['email']]).strip())
-                    if 'address' in mapping: updated |= update_if_present(existing, 'address', str(row[mapping['address']]).strip())
-                    if 'notes' in mapping: 
-                        new_note = str(row[mapping['notes']]).strip()
-                        if new_note and new_note not in (existing.notes or ""):
-                            existing.notes = (existing.notes or "") + f"\n[{datetime.date.today()}] {new_note}"
-                            updated = True
-
-                    # Car Details
-                    if 'car_make' in mapping: updated |= update_if_present(existing, 'car_make', str(row[mapping['car_make']]).strip())
-                    if 'car_model' in mapping: updated |= update_if_present(existing, 'car_model', str(row[mapping['car_model']]).strip())
-                    if 'car_year' in mapping: updated |= update_if_present(existing, 'car_year', safe_int(row[mapping['car_year']]))
-                    
-                    # Dates
-                    if 'birth_date' in mapping:
-                         bdate = safe_date(row[mapping.get('birth_date')])
-                         if bdate: 
-                             existing.birth_date = bdate
-                             updated = True
-                    
-                    if 'purchase_date' in mapping:
-                         pdate = safe_date(row[mapping.get('purchase_date')])
-                         if pdate: 
-                             existing.purchase_date = pdate
-                             updated = True
-                    
-                    if updated:
-                        count += 1
-                    continue
-
-                # Create Client
-                new_client = Client(
-                    user_id=current_user.id,
-                    name=name,
-                    phone=phone_clean,
-                    email=str(row[mapping.get('email', '')]).strip() if 'email' in mapping else None,
-                    address=str(row[mapping.get('address', '')]).strip() if 'address' in mapping else None,
-                    car_make=str(row[mapping.get('car_make', '')]).strip() if 'car_make' in mapping else None,
-                    car_model=str(row[mapping.get('car_model', '')]).strip() if 'car_model' in mapping else None,
-                    car_year=safe_int(row[mapping.get('car_year')]) if 'car_year' in mapping else None,
-                    notes=str(row[mapping.get('notes', '')]).strip() if 'notes' in mapping else f"Imported {datetime.date.today()}",
-                    status="imported",
-                    birth_date=safe_date(row[mapping.get('birth_date')]) if 'birth_date' in mapping else None,
-                    purchase_date=safe_date(row[mapping.get('purchase_date')]) if 'purchase_date' in mapping else None,
-                    created_at=datetime.datetime.utcnow()
-                )
-                db.add(new_client)
-                count += 1
-                
-                # Batch commit every 50 to avoid memory issues
-                if count % 50 == 0:
-                    db.commit()
-
-            except Exception as row_e:
-                errors.append(f"Row {index}: {str(row_e)}")
-
-        db.commit() # Final commit
-
+        # The upload is already spooled to disk; read it in chunks from there
+        stats = import_clients_file(db, str(current_user.id), file.file, ext)
+    except ValueError as e:
+        return {"imported_count": 0, "errors": [str(e)]}
     except Exception as e:
         print(f"Import Error: {e}")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+    print(f"[Import] User {current_user.id}: {stats.as_dict()}")
     return {
-        "imported_count": count,
-        "errors": errors[:10] # Return first 10 errors
+        **stats.as_dict(),
+        "errors": stats.errors[:10] # Return first 10 errors
     }
 
-@router.get("/export-backup")
-async def export_backup(
+
+# ============================================
+# BACKGROUND IMPORT JOBS
+# ============================================
+
+@router.post("/import-clients/jobs")
+async def create_import_job(
+    file: UploadFile = File(...),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Download all my clients as CSV"""
-    clients = db.query(Client).filter(Client.user_id == current_user.id).all()
-    
-    writer = pd.DataFrame([
-        {
-            "ID": c.id,
-            "Name": c.name,
-            "Last Name": c.last_name,
-            "Phone": c.phone,
-            "Email": c.email,
-            "Address": c.address,
-            "Car Make": c.car_make,
-            "Car Model": c.car_model,
-            "Car Year": c.car_year,
-            "Status": c.status,
-            "Notes": c.notes,
-            "Created At": c.created_at
-        } for c in clients
-    ])
-    
-    # Use pandas to write CSV to string buffer
-    output = io.StringIO()
-    writer.to_csv(output, index=False)
-    output.seek(0)
+    """Queue a client import: saves the upload and returns a job ID immediately"""
+    ext = "." + file.filename.split('.')[-1].lower() if '.' in file.filename else ''
+    if ext not in IMPORT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid file. Use: {', '.join(IMPORT_EXTENSIONS)}")
+
+    job = create_job(db, str(current_user.id), file.filename, ext)
+    try:
+        size = await save_upload(file, Path(job.file_path))
+    except Exception as e:
+        job.status = "failed"
+        job.message = f"Upload failed: {e}"
+        db.commit()
+        raise HTTPException(status_code=500, detail=job.message)
+
+    submit_job(job.id)
+    print(f"[ImportJob] Queued {job.id} for user {current_user.id} ({size} bytes)")
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/import-clients/jobs")
+def list_import_jobs(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Recent import jobs of the current user"""
+    jobs = db.query(ImportJob).filter(
+        ImportJob.user_id == str(current_user.id)
+    ).order_by(ImportJob.created_at.desc()).limit(20).all()
+    return [job_to_dict(job) for job in jobs]
+
+
+def _get_user_job(db: Session, job_id: str, user: User) -> ImportJob:
+    job = db.query(ImportJob).filter(
+        ImportJob.id == job_id,
+        ImportJob.user_id == str(user.id)
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.get("/import-clients/jobs/{job_id}")
+def get_import_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Live progress: rows parsed, inserted, updated, skipped and errors"""
+    return job_to_dict(_get_user_job(db, job_id, current_user))
+
+
+@router.get("/import-clients/jobs/{job_id}/errors")
+def download_import_errors(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """CSV with the spreadsheet row and reason for every rejected row"""
+    job = _get_user_job(db, job_id, current_user)
+    if not job.error_file_path or not os.path.exists(job.error_file_path):
+        raise HTTPException(status_code=404, detail="No error file for this job")
+    return FileResponse(job.error_file_path, media_type="text/csv", filename=f"import_errors_{job.id}.csv")
+
+@router.get("/export-backup")
+async def export_backup(
+    current_user: User = Depends(get_current_user)
+):
+    """Download all my clients as CSV (streamed in constant memory)"""
+    from app.services.exports import stream_clients_csv, BACKUP_CLIENT_FIELDS
     
     response = StreamingResponse(
-        io.StringIO(output.getvalue()),
+        stream_clients_csv(str(current_user.id), BACKUP_CLIENT_FIELDS),
         media_type="text/csv"
     )
     response.headers["Content-Disposition"] = f"attachment; filename=backup_clientes_{datetime.date.today()}.csv"
@@ -266,14 +140,25 @@ async def export_backup(
 # ============================================
 # MEDIA UPLOAD FOR WHATSAPP
 # ============================================
-import uuid
-import shutil
-import subprocess
 from pathlib import Path
 from fastapi.staticfiles import StaticFiles
+from app.services.media_store import (
+    MEDIA_DIR, store_upload, public_media_url, get_media_stats, uploads_by_user,
+    MediaQuotaExceeded, user_storage_bytes
+)
+from app.services import media_store, media_retention
+from app.services.media_jobs import wait_for_asset
+from app.utils.media_response import media_file_response, IMMUTABLE_CACHE_CONTROL
+from app.services import image_variants
+from app.services.storage import get_storage
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from app.models import MediaAsset
+
+# How long a media download waits for an in-flight conversion before serving the original
+MEDIA_WAIT_SECONDS = float(os.getenv("MEDIA_WAIT_SECONDS", "30"))
 
 # Media storage directory
-MEDIA_DIR = Path("uploads/media")
 MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
 # Allowed media types
@@ -296,6 +181,7 @@ ALLOWED_MEDIA_TYPES = {
 @router.post("/upload-media")
 async def upload_media(
     file: UploadFile = File(...),
+    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload media file for WhatsApp sending. Returns public URL."""
@@ -309,75 +195,138 @@ async def upload_media(
         )
     
     media_type = ALLOWED_MEDIA_TYPES[content_type]
-    
-    # Generate unique filename
-    ext = file.filename.split('.')[-1] if '.' in file.filename else 'bin'
-    unique_name = f"{uuid.uuid4()}.{ext}"
-    file_path = MEDIA_DIR / unique_name
-    
-    # Save file
-    try:
-        with open(file_path, 'wb') as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Convert WebM Audio to MP4 (AAC) - More compatible
-        if content_type == 'audio/webm':
-            if shutil.which('ffmpeg') is None:
-                print("🚨 CRITICAL: FFMPEG NOT INSTALLED IN CONTAINER")
-            
-            try:
-                mp4_name = f"{uuid.uuid4()}.mp4"
-                mp4_path = MEDIA_DIR / mp4_name
-                
-                # FFmpeg conversion to AAC (MP4)
-                subprocess.run([
-                    'ffmpeg', '-i', str(file_path),
-                    '-vn', # No video
-                    '-acodec', 'aac',
-                    '-y',
-                    str(mp4_path)
-                ], check=True, capture_output=True)
-                
-                # If successful, use the new file
-                if mp4_path.exists():
-                    os.remove(file_path) # Delete original webm
-                    unique_name = mp4_name
-                    final_mime = "audio/mp4" # Force MP4 mime
-                    
-            except Exception as e:
-                print(f"Audio conversion failed: {e}")
-                # Continue with original file if conversion fails
-                pass
 
+    # Stored by content hash: re-uploading the same file returns the existing URL
+    try:
+        asset, deduplicated = await store_upload(db, current_user.id, file, content_type, media_type, MEDIA_DIR)
+    except MediaQuotaExceeded as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Media storage quota reached ({e.used // (1024 * 1024)} of {e.quota // (1024 * 1024)} MB used)"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    # Get base URL from environment or use Railway URL
-    base_url = os.getenv("BACKEND_PUBLIC_URL", "https://auto-ai-production-b99a.up.railway.app")
-    media_url = f"{base_url}/files/media/{unique_name}"
-    
-    # Determine final mimetype (if not set by conversion)
-    if 'final_mime' not in locals():
-        final_mime = content_type
+
+    media_url = public_media_url(asset.filename)
+    variants = {}
+    if media_type == "image" and image_variants.variants_enabled():
+        if not deduplicated:
+            image_variants.pregenerate(asset.filename, MEDIA_DIR)
+        variants = {name: image_variants.variant_url(media_url, name) for name in image_variants.VARIANTS}
 
     return {
         "status": "uploaded",
         "media_url": media_url,
+        # thumbnail / whatsapp (send this one) / original; empty if variants are unavailable
+        "variants": variants,
         "media_type": media_type,
-        "mimetype": final_mime,
-        "filename": unique_name,
-        "size": Path(MEDIA_DIR / unique_name).stat().st_size
+        "mimetype": asset.mimetype,
+        "filename": asset.filename,
+        "size": asset.size_bytes,
+        # Only the caller's own earlier uploads count; a match with another tenant is not disclosed
+        "deduplicated": deduplicated and uploads_by_user(db, current_user.id, asset.id) > 1,
+        # "processing" while the voice note converts; the URL waits for the result
+        "asset_status": asset.status
+    }
+
+
+@router.get("/media/stats")
+def media_stats(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """The caller's media storage use, dedupe hit rate and quota, plus the last retention sweep"""
+    return {
+        "user": get_media_stats(db, current_user.id),
+        "quota": {
+            "used_bytes": user_storage_bytes(db, current_user.id),
+            "quota_bytes": media_store.MEDIA_QUOTA_BYTES or None,
+        },
+        # When the retention sweep last ran in this process; its counters are deployment-wide and stay in the logs
+        "last_sweep_at": (media_retention.last_sweep_report or {}).get("finished_at"),
+    }
+
+
+@router.get("/media/{filename}/status")
+def media_status(
+    filename: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Conversion status of an uploaded asset"""
+    asset = db.query(MediaAsset).filter(MediaAsset.filename == filename).first()
+    # Other tenants' assets look like missing ones
+    if not asset or not uploads_by_user(db, current_user.id, asset.id):
+        raise HTTPException(status_code=404, detail="File not found")
+    return {
+        "filename": asset.filename,
+        "status": asset.status,
+        "mimetype": asset.mimetype,
+        "size": asset.size_bytes,
+        "media_url": public_media_url(asset.filename),
     }
 
 
-@router.get("/media/{filename}")
-async def serve_media(filename: str):
-    """Serve uploaded media files"""
+@router.api_route("/media/variants/{variant}/{filename}", methods=["GET", "HEAD"])
+async def serve_media_variant(variant: str, filename: str, request: Request):
+    """Resized, EXIF-free JPEG of an uploaded image; the original if it can't be rendered"""
+    if variant not in image_variants.VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown variant")
+
+    path = await image_variants.local_variant(filename, variant, MEDIA_DIR)
+    if path is not None:
+        # Rendered from content-addressed bytes, so it never changes either
+        return media_file_response(request, path, "image/jpeg", cache_control=IMMUTABLE_CACHE_CONTROL)
+
+    original = MEDIA_DIR / filename
+    if not original.is_file():
+        raise HTTPException(status_code=404, detail="File not found")
+    return media_file_response(request, original, f"image/{filename.rsplit('.', 1)[-1].lower().replace('jpg', 'jpeg')}")
+
+
+@router.get("/image-proxy/{variant}")
+async def image_proxy(variant: str, url: str, request: Request):
+    """Variant of an allow-listed remote image (inventory primary_image_url)"""
+    if variant not in image_variants.VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown variant")
+    if not image_variants.proxy_allowed(url):
+        raise HTTPException(status_code=400, detail="Image host not allowed")
+
+    path = await image_variants.remote_variant(url, variant)
+    if path is None:
+        # Can't render: let the client fetch the original directly
+        return RedirectResponse(url, status_code=307)
+    return media_file_response(request, path, "image/jpeg", cache_control="public, max-age=86400")
+
+
+# HEAD too: the WhatsApp bridge and browsers probe size/type before downloading
+@router.api_route("/media/{filename}", methods=["GET", "HEAD"])
+async def serve_media(filename: str, request: Request, db: Session = Depends(get_db)):
+    """Serve uploaded media files (conditional GET, byte ranges, immutable caching)"""
     file_path = MEDIA_DIR / filename
-    
+
+    storage = get_storage()
+    if storage.is_remote:
+        # Durable copy lives in object storage: send the client straight there
+        if not await run_in_threadpool(storage.exists, filename):
+            await wait_for_asset(filename, MEDIA_WAIT_SECONDS)
+        if await run_in_threadpool(storage.exists, filename):
+            url = await run_in_threadpool(storage.url, filename)
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": "private, max-age=300"})
+
     if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
-    
+        # Converted file may still be on its way
+        await wait_for_asset(filename, MEDIA_WAIT_SECONDS)
+
+    if not file_path.exists():
+        # Conversion failed or not finished: fall back to the original upload.
+        # Not cacheable - the URL will serve the converted file once it exists.
+        asset = db.query(MediaAsset).filter(MediaAsset.filename == filename).first()
+        source = MEDIA_DIR / asset.source_filename if asset and asset.source_filename else None
+        if not source or not source.exists():
+            raise HTTPException(status_code=404, detail="File not found")
+        return media_file_response(request, source, "audio/webm", cache_control="no-cache")
+
     # Determine content type from extension
     ext = filename.split('.')[-1].lower()
     content_types = {
@@ -390,14 +339,13 @@ async def serve_media(filename: str):
         'mov': 'video/quicktime',
         'mp3': 'audio/mpeg',
         'm4a': 'audio/mp4',
+        'ogg': 'audio/ogg',
+        'webm': 'audio/webm',
         'pdf': 'application/pdf',
         'doc': 'application/msword',
         'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
     }
-    
+
     media_type = content_types.get(ext, 'application/octet-stream')
-    
-    return StreamingResponse(
-        open(file_path, 'rb'),
-        media_type=media_type
-    )
+
+    return media_file_response(request, file_path, media_type)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.db.session import get_db
 from app.deps import get_current_user
 from app.models import User, InventoryItem
+from app.services.response_cache import invalidate_response_cache
 from pydantic import BaseModel
 from typing import Optional
 
@@ -41,6 +42,7 @@ async def create_inventory_item(item: InventoryCreate, current_user: User = Depe
     db.add(new_item)
     db.commit()
     db.refresh(new_item)
+    invalidate_response_cache(current_user.id)
     return new_item
 
 @router.post("/seed")
@@ -77,6 +79,7 @@ async def seed_inventory(current_user: User = Depends(get_current_user), db: Ses
         db.add(new_item)
         
     db.commit()
+    invalidate_response_cache(current_user.id)
     return {"message": f"Seeded {len(sample_cars)} cars"}
 
 @router.post("/resync")
@@ -125,6 +128,7 @@ async def resync_inventory(current_user: User = Depends(get_current_user), db: S
                 item.status = "available"
         
         db.commit()
+        invalidate_response_cache(current_user.id)
         
         return {
             "status": "success",
@@ -7,6 +7,9 @@ from datetime import datetime
 from app.db.session import get_db
 from app.deps import get_current_user
 from app.models import Message, Client, User, get_uuid
+from app.utils.cache import invalidate_dashboard
+from app.services.message_stats import record_message
+from app.services.response_times import RESPONDER_HUMAN, record_response
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
@@ -171,9 +174,10 @@ def save_outbound_message(
     media_url: str = None,
     media_type: str = None,
     client_id: str = None,
-    whatsapp_message_id: str = None
+    whatsapp_message_id: str = None,
+    responder: str = RESPONDER_HUMAN
 ) -> Message:
-    """Save an outbound message to the database"""
+    """Save an outbound message to the database. `responder` feeds the response-time stats."""
     # If no client_id, try to find by phone
     if not client_id:
         # 1. Try exact match
@@ -198,6 +202,8 @@ def save_outbound_message(
         
         if client:
             client_id = client.id
+    else:
+        client = db.query(Client).filter(Client.id == client_id).first()
     
     message = Message(
         id=get_uuid(),
@@ -213,7 +219,10 @@ def save_outbound_message(
     )
     
     db.add(message)
+    record_message(db, user_id, "outbound", commit=False)
+    record_response(db, client, "outbound", responder=responder)
     db.commit()
     db.refresh(message)
+    invalidate_dashboard(user_id)
     
     return message
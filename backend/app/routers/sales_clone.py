@@ -104,6 +104,9 @@ def update_sales_clone(
         
         db.commit()
         db.refresh(clone)
+        # Cached agent replies were written in the old personality
+        from app.services.response_cache import invalidate_response_cache
+        invalidate_response_cache(current_user.id)
         
         return clone
     except Exception as e:
@@ -223,6 +226,20 @@ def get_clone_status(
     }
 
 
+@router.get("/metrics")
+def get_agent_metrics(
+    days: int = 7,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Per-mode LLM calls, tokens and time-to-reply of agent turns, plus response cache stats"""
+    from app.services.agent_metrics import summarize_turns
+    from app.services.response_cache import response_cache
+    summary = summarize_turns(db, current_user.id, days=max(1, min(days, 90)))
+    summary["response_cache"] = response_cache.stats_for(current_user.id)
+    return summary
+
+
 @router.post("/test/reset")
 def reset_test_arena(
     current_user: User = Depends(get_current_user),
@@ -5,6 +5,7 @@ from pydantic import BaseModel
 from app.db.session import get_db
 from app.deps import get_current_user
 from app.models import Tag, ClientTag, Client, User, DEFAULT_TAGS, get_uuid
+from app.utils.cache import invalidate_dashboard
 
 router = APIRouter(prefix="/tags", tags=["tags"])
 
@@ -151,6 +152,7 @@ def delete_tag(
     
     db.delete(tag)
     db.commit()
+    invalidate_dashboard(current_user.id)
     return {"message": "Tag deleted"}
 
 
@@ -199,6 +201,7 @@ def assign_tag_to_client(
     )
     db.add(client_tag)
     db.commit()
+    invalidate_dashboard(current_user.id)
     
     # TRIGGER AUTOMATION (Phase 3.1)
     try:
@@ -248,6 +251,7 @@ def remove_tag_from_client(
     if client_tag:
         db.delete(client_tag)
         db.commit()
+        invalidate_dashboard(current_user.id)
     
     return {"message": "Tag removed"}
 
@@ -7,6 +7,9 @@ from app.models import User, Client, get_uuid
 from app.deps import get_current_user
 from app.utils.reliability import message_rate_limiter
 from app.routers.messages import save_outbound_message
+from app.utils.cache import invalidate_dashboard
+from app.services.message_stats import record_message, StatsBatch
+from app.services.response_times import RESPONDER_HUMAN, record_response
 from pydantic import BaseModel
 import os
 
@@ -16,6 +19,9 @@ router = APIRouter(prefix="/whatsapp", tags=["whatsapp"])
 WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://127.0.0.1:3005")
 print(f"[Backend] WhatsApp Service URL: {WHATSAPP_SERVICE_URL}")
 
+# AI auto-replies below this confidence are not sent
+MIN_REPLY_CONFIDENCE = 0.3
+
 import socket
 import requests
 
@@ -61,6 +67,22 @@ def send_whatsapp_message_sync(user_id: str, phone_number: str, message: str, cl
         print(f"[Backend] Error sending message: {str(e)}")
         raise e
 
+def send_whatsapp_presence_sync(user_id: str, phone_number: str, state: str = "composing") -> bool:
+    """
+    Show "typing..." (composing) or clear it (paused) in the buyer's chat.
+    Cosmetic: failures are logged and ignored.
+    """
+    try:
+        resp = requests.post(
+            f"{WHATSAPP_SERVICE_URL}/api/whatsapp/presence",
+            json={"userId": user_id, "phoneNumber": phone_number, "state": state},
+            timeout=3
+        )
+        return resp.status_code == 200
+    except Exception as e:
+        print(f"[Backend] Presence update failed: {e}")
+        return False
+
 @router.get("/debug-connectivity")
 def debug_connectivity():
     """Debug endpoint to test connectivity from within the server process"""
@@ -163,12 +185,12 @@ def get_whatsapp_status(
 
 
 
-def send_message_internal(db: Session, user_id: str, phone: str, message: str, attachment: dict = None, client_id: str = None, media_url: str = None, caption: str = None):
+def send_message_internal(db: Session, user_id: str, phone: str, message: str, attachment: dict = None, client_id: str = None, media_url: str = None, caption: str = None, responder: str = RESPONDER_HUMAN):
     """
     Internal helper to send messages via Node service and save to DB.
     Used by:
     - POST /send endpoint
-    - Automation engine
+    - Automation engine (responder=RESPONDER_AUTOMATION)
     """
     WHATSAPP_SERVICE_URL = os.getenv("WHATSAPP_SERVICE_URL", "http://127.0.0.1:3005")
     
@@ -197,7 +219,8 @@ def send_message_internal(db: Session, user_id: str, phone: str, message: str, a
             media_url=media_url,
             media_type='image' if media_url else None,
             whatsapp_message_id=result.get('messageId'),
-            client_id=client_id
+            client_id=client_id,
+            responder=responder
         )
         return result
 
@@ -326,7 +349,10 @@ def whatsapp_webhook(
         status="received"
     )
     db.add(message)
+    record_message(db, user_id, "inbound", commit=False)
+    record_response(db, client, "inbound")
     db.commit()
+    invalidate_dashboard(user_id)
     print(f"[Webhook] Message saved for client {client.name}")
     
     # 4. Trigger Automation: MESSAGE_RECEIVED
@@ -344,6 +370,9 @@ def whatsapp_webhook(
         from app.utils.ai_response import check_clone_status
         from app.utils.sales_agent import process_message_with_agent
         from app.models import Message as MessageModel
+        from app.services.conversation_context import load_history, submit_summary
+        from app.services.reply_stream import STREAM_REPLIES, ReplyStream
+        from sqlalchemy.orm import sessionmaker
         
         clone_status = check_clone_status(db, user_id)
         print(f"[Webhook DEBUG] Clone Status for {user_id}: {clone_status}", flush=True)
@@ -359,16 +388,18 @@ def whatsapp_webhook(
             
             print(f"[AI Clone + Memory] User {user_id} has active clone, generating response with memory...", flush=True)
             
-            # Get recent conversation history for context
-            recent_messages = db.query(MessageModel).filter(
-                MessageModel.client_id == client.id
-            ).order_by(MessageModel.sent_at.desc()).limit(10).all()
+            # Recent history within the token budget (the message being answered
+            # is passed separately); older turns live in the rolling summary
+            window = load_history(db, client.id, exclude_message_id=message.id)
+            print(f"[AI Clone + Memory] History: {len(window.messages)} messages, {window.tokens} tokens ({window.dropped} older left out)")
             
-            # Convert to format expected by the agent
-            conversation_history = []
-            for msg in reversed(recent_messages):
-                role = "buyer" if msg.direction == "inbound" else "assistant"
-                conversation_history.append({"role": role, "text": msg.content})
+            # Streaming: typing indicator now, reply sent sentence by sentence as it is generated
+            reply_stream = None
+            if STREAM_REPLIES:
+                reply_stream = ReplyStream(
+                    send=lambda chunk: send_whatsapp_message_sync(user_id, sender_phone, chunk, client.id),
+                    presence=lambda state: send_whatsapp_presence_sync(user_id, sender_phone, state)
+                )
             
             # Use the NEW process_message_with_agent (includes Memory System!)
             ai_result = process_message_with_agent(
@@ -376,8 +407,11 @@ def whatsapp_webhook(
                 clone=clone,
                 client_id=client.id,
                 buyer_message=text,
-                conversation_history=conversation_history
+                conversation_history=window.messages,
+                reply_stream=reply_stream
             )
+            # Fold what fell out of the window into the summary, off the reply path
+            submit_summary(client.id, window, sessionmaker(bind=db.get_bind(), autoflush=False))
             
             ai_response = ai_result.get("response", "")
             confidence = ai_result.get("confidence", 0)
@@ -388,8 +422,51 @@ def whatsapp_webhook(
             print(f"[AI Clone + Memory] Response: {ai_response[:100]}...")
             print(f"[AI Clone + Memory] 📷 MEDIA URL: {media_url}")
             
+            def save_ai_message(content, sent_media_url=None):
+                db.add(MessageModel(
+                    id=get_uuid(),
+                    user_id=user_id,
+                    client_id=client.id,
+                    phone=sender_phone,
+                    direction="outbound",
+                    content=content,
+                    media_url=sent_media_url,
+                    media_type='image' if sent_media_url else None,
+                    status="sent",
+                    ai_generated=True
+                ))
+                record_message(db, user_id, "outbound", ai_generated=True, commit=False)
+            
+            delivered = ai_result.get("delivered")
+            if delivered is not None:
+                # Streamed: the text is already with the buyer, one message per chunk.
+                # Confidence is only known once the turn is done, so the gate
+                # below can only hold back the media follow-up.
+                send_media = bool(media_url) and confidence >= MIN_REPLY_CONFIDENCE
+                try:
+                    for chunk in delivered:
+                        save_ai_message(chunk)
+                    if send_media:
+                        send_whatsapp_message_sync(
+                            user_id=user_id,
+                            phone_number=sender_phone,
+                            message=media_caption or "Imagen enviada",
+                            client_id=client.id,
+                            media_url=media_url,
+                            caption=media_caption
+                        )
+                        save_ai_message(media_caption or "Imagen enviada", media_url)
+                    if delivered or send_media:
+                        record_response(db, client, "outbound", ai_generated=True)
+                    db.commit()
+                    invalidate_dashboard(user_id)
+                    print(f"[AI Clone + Memory] Streamed {len(delivered)} messages to {sender_phone} "
+                          f"(first after {ai_result['timings'].get('first_message_ms')} ms)")
+                except Exception as send_error:
+                    print(f"[AI Clone + Memory] Failed to finish streamed response: {send_error}")
+            
             # Only send if we have a response and decent confidence
-            if (ai_response or media_url) and confidence >= 0.3:
+            elif (ai_response or media_url) and confidence >= MIN_REPLY_CONFIDENCE:
                 # Send the AI response via WhatsApp
                 try:
                     send_result = send_whatsapp_message_sync(
@@ -402,19 +479,10 @@ def whatsapp_webhook(
                     )
                     
                     # Save AI response as outbound message
-                    ai_message = MessageModel(
-                        id=get_uuid(),
-                        user_id=user_id,
-                        client_id=client.id,
-                        phone=sender_phone,
-                        direction="outbound",
-                        content=ai_response or media_caption or "Imagen enviada",
-                        media_url=media_url,
-                        media_type='image' if media_url else None,
-                        status="sent"
-                    )
-                    db.add(ai_message)
+                    save_ai_message(ai_response or media_caption or "Imagen enviada", media_url)
+                    record_response(db, client, "outbound", ai_generated=True)
                     db.commit()
+                    invalidate_dashboard(user_id)
                     
                     print(f"[AI Clone + Memory] Auto-response sent successfully to {sender_phone}")
                     
@@ -490,6 +558,10 @@ def process_bulk_send(
     
     import time
     import random
+    from app.db.session import SessionLocal
+
+    stats_db = SessionLocal()
+    stats = StatsBatch(stats_db)
 
     with httpx.Client(trust_env=False, timeout=60.0) as client:
         for phone in target_phones:
@@ -517,6 +589,7 @@ def process_bulk_send(
                     client.post(url, json=payload).raise_for_status()
                 
                 success_count += 1
+                stats.add(user_id, "outbound")
                 
                 # Rate limit / Stability delay
                 time.sleep(random.uniform(0.5, 1.5))
@@ -524,6 +597,9 @@ def process_bulk_send(
             except Exception as e:
                 print(f"[BulkWorker] Error sending to {phone}: {e}")
                 fail_count += 1
+    
+    stats.flush()
+    stats_db.close()
                 
     print(f"[BulkWorker] Completed. Success: {success_count}, Failed: {fail_count}")
 
@@ -0,0 +1,115 @@
+"""
+Per-turn cost and latency of the RAY agent.
+
+Every agent turn records an AgentTurnMetric row (mode, LLM calls, tool calls,
+tokens, time-to-reply). The background memory update adds the cost of its
+extraction call to the same row, so "unified" and "classic" turns can be
+compared on total cost, not just the reply path. `cached_token_rate` shows
+how much of the prompt the provider served from its prefix cache. Streamed
+turns also record when their first chunk reached the buyer.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import AgentTurnMetric
+
+
+def new_usage() -> Dict[str, Any]:
+    return {
+        "llm_calls": 0, "tool_calls": 0, "prompt_tokens": 0,
+        "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0,
+        "history_tokens": 0,  # Estimated share of prompt_tokens spent on history
+        "tools": [],  # Names of the tools that ran
+    }
+
+
+def record_turn(
+    db: Session,
+    user_id: str,
+    client_id: Optional[str],
+    mode: str,
+    usage: Dict[str, Any],
+    reply_ms: float,
+    first_message_ms: Optional[float] = None
+) -> Optional[str]:
+    """Store one turn. Returns the row id, or None if it could not be saved."""
+    try:
+        metric = AgentTurnMetric(
+            user_id=user_id,
+            client_id=client_id,
+            mode=mode,
+            llm_calls=usage.get("llm_calls", 0),
+            tool_calls=usage.get("tool_calls", 0),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            cached_tokens=usage.get("cached_tokens", 0),
+            history_tokens=usage.get("history_tokens", 0),
+            reply_ms=round(reply_ms, 1),
+            first_message_ms=round(first_message_ms, 1) if first_message_ms is not None else None,
+        )
+        db.add(metric)
+        db.commit()
+        return metric.id
+    except Exception as e:
+        db.rollback()
+        print(f"[AgentMetrics] Could not record turn: {e}")
+        return None
+
+
+def add_memory_usage(db: Session, metric_id: Optional[str], usage: Dict[str, int]) -> None:
+    """Charge the memory update's extraction call to its turn"""
+    if not metric_id or not usage.get("llm_calls"):
+        return
+    metric = db.get(AgentTurnMetric, metric_id)
+    if metric is None:
+        return
+    metric.memory_llm_calls = (metric.memory_llm_calls or 0) + usage["llm_calls"]
+    metric.memory_tokens = (metric.memory_tokens or 0) + usage.get("total_tokens", 0)
+    db.commit()
+
+
+def summarize_turns(db: Session, user_id: str, days: int = 7) -> Dict[str, Any]:
+    """Averages per mode over the last `days` days"""
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.query(
+        AgentTurnMetric.mode,
+        func.count(AgentTurnMetric.id),
+        func.avg(AgentTurnMetric.llm_calls + AgentTurnMetric.memory_llm_calls),
+        func.avg(AgentTurnMetric.total_tokens + AgentTurnMetric.memory_tokens),
+        func.avg(AgentTurnMetric.reply_ms),
+        func.max(AgentTurnMetric.reply_ms),
+        func.sum(AgentTurnMetric.tool_calls),
+        func.sum(AgentTurnMetric.prompt_tokens),
+        func.sum(AgentTurnMetric.cached_tokens),
+        func.avg(AgentTurnMetric.prompt_tokens),
+        func.avg(AgentTurnMetric.history_tokens),
+        func.count(AgentTurnMetric.first_message_ms),
+        func.avg(AgentTurnMetric.first_message_ms),
+    ).filter(
+        AgentTurnMetric.user_id == user_id,
+        AgentTurnMetric.created_at >= since
+    ).group_by(AgentTurnMetric.mode).all()
+
+    modes = {}
+    for (mode, turns, calls, tokens, avg_ms, max_ms, tool_calls, prompt_tokens, cached, avg_prompt, avg_history,
+         streamed, avg_first_ms) in rows:
+        modes[mode] = {
+            "turns": turns,
+            "avg_llm_calls": round(float(calls or 0), 2),
+            "avg_tokens": round(float(tokens or 0), 1),
+            "avg_reply_ms": round(float(avg_ms or 0), 1),
+            "max_reply_ms": round(float(max_ms or 0), 1),
+            "tool_calls": int(tool_calls or 0),
+            # Share of reply-path prompt tokens served from the provider's prefix cache
+            "cached_token_rate": round(float(cached or 0) / prompt_tokens, 3) if prompt_tokens else 0.0,
+            "avg_prompt_tokens": round(float(avg_prompt or 0), 1),
+            "avg_history_tokens": round(float(avg_history or 0), 1),
+            # Streamed turns only: how long until the buyer saw the first chunk
+            "streamed_turns": int(streamed or 0),
+            "avg_first_message_ms": round(float(avg_first_ms), 1) if avg_first_ms is not None else None,
+        }
+    return {"days": days, "modes": modes}
@@ -2,10 +2,9 @@
 AI Service for extracting client data from messages using GPT.
 Automatically identifies: name, email, phone, interest level, urgency, sentiment.
 """
-import os
 import json
 from typing import Optional
-from openai import OpenAI
+from app.services.llm_client import chat_completion, llm_available
 from pydantic import BaseModel
 
 class ExtractedClientData(BaseModel):
@@ -34,12 +33,10 @@ def analyze_message(message_content: str, client_context: dict = None) -> Extrac
     Returns:
         ExtractedClientData with extracted information
     """
-    if not os.getenv("OPENAI_API_KEY"):
+    if not llm_available():
         print("[AI] Warning: OPENAI_API_KEY not set, returning empty extraction")
         return ExtractedClientData()
     
-    client = OpenAI()
-    
     context_str = ""
     if client_context:
         context_str = f"""
@@ -74,7 +71,7 @@ Responde SOLO con el JSON, sin explicaciones adicionales.
 """
 
     try:
-        completion = client.chat.completions.create(
+        completion = chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Eres un asistente CRM experto en análisis de mensajes de clientes. Respondes solo en JSON válido."},
@@ -197,11 +194,9 @@ def generate_smart_reply(message_content: str, client_name: str = None, context:
     """
     Generate a suggested reply using Ray's persona and tools.
     """
-    if not os.getenv("OPENAI_API_KEY"):
+    if not llm_available():
         return ""
     
-    client = OpenAI()
-    
     # Context setup
     inputs = f"Cliente: {client_name or 'Desconocido'}\nContexto: {context}\nÚltimo mensaje: {message_content}"
     
@@ -212,7 +207,7 @@ def generate_smart_reply(message_content: str, client_name: str = None, context:
     
     try:
         # First call: Check if tools are needed
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4o-mini",
             messages=messages,
             tools=RAY_TOOLS,
@@ -265,7 +260,7 @@ def generate_smart_reply(message_content: str, client_name: str = None, context:
                 })
             
             # Second call: Get final answer with tool data
-            final_response = client.chat.completions.create(
+            final_response = chat_completion(
                 model="gpt-4o-mini",
                 messages=messages,
                 temperature=0.7 # Slight creativity for phrasing
@@ -290,11 +285,9 @@ def categorize_client(messages_history: list, current_tags: list = None) -> dict
     Returns:
         Dict with suggested_tag, confidence, and reason
     """
-    if not os.getenv("OPENAI_API_KEY") or not messages_history:
+    if not llm_available() or not messages_history:
         return {"suggested_tag": None, "confidence": 0, "reason": "No data"}
     
-    client = OpenAI()
-    
     messages_text = "\n".join([f"- {m}" for m in messages_history[-10:]])  # Last 10 messages
     current_tags_str = ", ".join(current_tags) if current_tags else "Ninguna"
     
@@ -320,7 +313,7 @@ Responde en JSON con:
 """
 
     try:
-        completion = client.chat.completions.create(
+        completion = chat_completion(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "Eres un CRM inteligente. Categorizas clientes basándote en su historial."},
@@ -0,0 +1,534 @@
+"""
+Streaming client importer.
+
+Reads CSV uploads in chunks (Excel is sliced into chunks after loading),
+cleanses phones, dates and numbers column-wise, resolves duplicates against
+an index of the user's normalized phones fetched once per import, splits
+each chunk into inserts and updates with pandas and writes them with one
+bulk INSERT and one bulk UPDATE per chunk.
+"""
+import datetime
+import hashlib
+import json
+import re
+import unicodedata
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from app.db.upsert import dialect_insert
+from app.models import Client, ImportColumnMapping, get_uuid
+from app.utils.phone import normalize_phone
+
+# Rows per chunk read from the file and written per bulk statement
+IMPORT_CHUNK_ROWS = 5000
+
+# Max errors kept in memory for the response
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_EXTENSIONS = {'.csv', '.xlsx', '.xls'}
+
+TEXT_FIELDS = ["email", "address", "car_make", "car_model"]
+DATE_FIELDS = ["birth_date", "purchase_date"]
+
+# Layouts tried (vectorized, in order) before per-value inference
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%m/%d/%Y", "%m/%d/%y", "%m/%d/%Y %H:%M",
+    "%Y/%m/%d", "%m-%d-%Y", "%d/%m/%Y",
+]
+
+# car_year values outside this range are treated as invalid
+MIN_CAR_YEAR = 1900
+MAX_CAR_YEAR = 2100
+
+# Columns fetched for clients that already exist, to decide what changes
+EXISTING_COLUMNS = ["id", "name", "notes", "car_year"] + TEXT_FIELDS + DATE_FIELDS
+
+
+class ImportStats:
+    """Running counters for one import (also used for job progress)"""
+
+    def __init__(self, on_error: Optional[Callable[[Optional[str], str], None]] = None):
+        self.parsed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors: List[str] = []
+        self.on_error = on_error  # Receives every error, e.g. to write an error file
+
+    def add_error(self, message: str, row: Optional[str] = None) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row}: {message}" if row else message)
+        if self.on_error:
+            self.on_error(row, message)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "parsed": self.parsed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "skipped": self.skipped,
+            "error_count": self.error_count,
+            "imported_count": self.inserted + self.updated,
+        }
+
+
+def read_chunks(source: BinaryIO, ext: str, chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the upload as DataFrames of string cells, chunk_rows at a time"""
+    if ext == '.csv':
+        try:
+            reader = pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+        except pd.errors.EmptyDataError:
+            return
+        for chunk in reader:
+            yield chunk
+        return
+
+    # openpyxl/xlrd can't stream, but the rest of the pipeline still runs per chunk
+    df = pd.read_excel(source, dtype=str).fillna('')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def map_columns_with_ai(headers: List[str]) -> Dict[str, str]:
+    """Ask the LLM to map file headers onto Client columns"""
+    from app.services.llm_client import chat_completion
+
+    prompt = f"""
+        Map these CSV headers to my database columns.
+        CSV Headers: {json.dumps(headers)}
+
+        Target Columns:
+        - name (Required. If multiple, choose the one with full name)
+        - phone (Required)
+        - email
+        - address
+        - notes (or description/comments)
+        - car_make
+        - car_model
+        - car_year
+        - birth_date (Format: YYYY-MM-DD or similar)
+        - purchase_date (Date of vehicle purchase)
+
+        Return JSON Key-Value pair: {{"target_column": "csv_header_name"}}
+        Only include found mappings. ignore others.
+        """
+
+    completion = chat_completion(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": "You are a data mapping assistant. Return strict JSON."},
+            {"role": "user", "content": prompt}
+        ],
+        response_format={ "type": "json_object" }
+    )
+    return json.loads(completion.choices[0].message.content)
+
+
+# Known header spellings per target column (normalized: lowercase, no accents/punctuation)
+COLUMN_SYNONYMS = {
+    "name": ["name", "nombre", "full name", "nombre completo", "client name", "customer name",
+             "cliente", "customer", "contact name", "contacto"],
+    "phone": ["phone", "telefono", "tel", "phone number", "numero de telefono", "celular", "cel",
+              "cell", "cell phone", "mobile", "movil", "whatsapp", "numero"],
+    "email": ["email", "e mail", "correo", "correo electronico", "mail", "email address"],
+    "address": ["address", "direccion", "domicilio", "street address"],
+    "notes": ["notes", "notas", "note", "nota", "comments", "comentarios", "description",
+              "descripcion", "observaciones"],
+    "car_make": ["car make", "make", "marca", "brand", "vehicle make"],
+    "car_model": ["car model", "model", "modelo", "vehicle model", "vehiculo"],
+    "car_year": ["car year", "year", "ano", "anio", "model year", "vehicle year", "ano del vehiculo"],
+    "birth_date": ["birth date", "birthdate", "birthday", "date of birth", "dob",
+                   "fecha de nacimiento", "nacimiento", "cumpleanos", "cumple"],
+    "purchase_date": ["purchase date", "fecha de compra", "fecha compra", "sold date",
+                      "sale date", "fecha de venta", "fecha venta"],
+}
+
+
+def normalize_header(header: str) -> str:
+    """'Teléfono Celular ' -> 'telefono celular'"""
+    text = unicodedata.normalize("NFKD", str(header)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def header_signature(headers: List[str]) -> str:
+    """Stable key for a file layout: hash of the sorted normalized header set"""
+    normalized = sorted({normalize_header(h) for h in headers})
+    return hashlib.sha1("|".join(normalized).encode()).hexdigest()
+
+
+def match_synonyms(headers: List[str]) -> Dict[str, str]:
+    """Deterministic mapping from known header spellings (each header used once)"""
+    by_normalized = {}
+    for header in headers:
+        by_normalized.setdefault(normalize_header(header), header)
+
+    mapping, used = {}, set()
+    for target, synonyms in COLUMN_SYNONYMS.items():
+        for synonym in synonyms:
+            header = by_normalized.get(synonym)
+            if header is not None and header not in used:
+                mapping[target] = header
+                used.add(header)
+                break
+    return mapping
+
+
+def _load_cached_mapping(db: Session, user_id: str, headers: List[str]) -> Optional[Dict[str, str]]:
+    cached = db.query(ImportColumnMapping).filter(
+        ImportColumnMapping.user_id == user_id,
+        ImportColumnMapping.header_signature == header_signature(headers)
+    ).first()
+    if not cached:
+        return None
+
+    # Stored headers are normalized; map back to this file's spelling
+    by_normalized = {normalize_header(h): h for h in headers}
+    mapping = {t: by_normalized[h] for t, h in (cached.mapping or {}).items() if h in by_normalized}
+    if 'name' not in mapping or 'phone' not in mapping:
+        return None
+
+    cached.use_count = (cached.use_count or 0) + 1
+    cached.last_used_at = datetime.datetime.utcnow()
+    db.commit()
+    return mapping
+
+
+def _store_mapping(db: Session, user_id: str, headers: List[str], mapping: Dict[str, str], source: str) -> None:
+    stmt = dialect_insert(db, ImportColumnMapping.__table__).values(
+        id=get_uuid(),
+        user_id=user_id,
+        header_signature=header_signature(headers),
+        headers=sorted({normalize_header(h) for h in headers}),
+        mapping={target: normalize_header(header) for target, header in mapping.items()},
+        source=source,
+        use_count=1,
+        last_used_at=datetime.datetime.utcnow()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "header_signature"],
+        set_={"mapping": stmt.excluded.mapping, "source": stmt.excluded.source}
+    ))
+    db.commit()
+
+
+def resolve_column_mapping(
+    headers: List[str],
+    db: Optional[Session] = None,
+    user_id: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Column mapping for an import; raises ValueError without name/phone.
+    Order: this user's cached mapping for the same layout, then the synonym
+    matcher, then the LLM. New mappings are cached for the next import.
+    """
+    use_cache = db is not None and user_id is not None
+    if use_cache:
+        cached = _load_cached_mapping(db, user_id, headers)
+        if cached:
+            print(f"[Import] Column Mapping (cached): {cached}")
+            return cached
+
+    mapping = match_synonyms(headers)
+    source = "synonyms"
+
+    if 'name' not in mapping or 'phone' not in mapping:
+        try:
+            ai_mapping = map_columns_with_ai(headers)
+            # Ignore hallucinated headers; synonyms fill whatever the LLM missed
+            ai_mapping = {t: h for t, h in ai_mapping.items() if t in COLUMN_SYNONYMS and h in headers}
+            mapping = {**mapping, **ai_mapping}
+            source = "ai"
+        except Exception as e:
+            print(f"[Import] AI column mapping failed, using synonyms only: {e}")
+    print(f"[Import] Column Mapping ({source}): {mapping}")
+
+    if 'name' not in mapping or 'phone' not in mapping:
+        raise ValueError(f"Could not find Name/Phone columns. Headers: {headers}")
+
+    if use_cache:
+        try:
+            _store_mapping(db, user_id, headers, mapping, source)
+        except Exception as e:
+            db.rollback()
+            print(f"[Import] Could not cache column mapping: {e}")
+    return mapping
+
+
+def load_phone_index(db: Session, user_id: str) -> Dict[str, str]:
+    """normalized phone -> client id for every client of the user (one query)"""
+    index = {}
+    for client_id, phone in db.query(Client.id, Client.phone).filter(Client.user_id == user_id).yield_per(10000):
+        key = normalize_phone(phone)
+        if key:
+            index.setdefault(key, client_id)
+    return index
+
+
+def clean_phone_column(values: pd.Series) -> pd.Series:
+    """Keep digits and '+' only (vectorized)"""
+    return values.str.replace(r'[^\d+]', '', regex=True)
+
+
+def parse_date_column(values: pd.Series) -> pd.Series:
+    """
+    Vectorized date parsing (month-first like pandas' default inference).
+    Each known layout is tried over all still-unparsed cells at once; whatever
+    remains goes through pandas' per-value inference, once per distinct value.
+    Returns datetime64 with NaT for empty/unparseable cells.
+    """
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[us]")
+    pending = values != ''
+
+    for fmt in DATE_FORMATS:
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(values[pending], format=fmt, errors="coerce")
+        hit = attempt.index[attempt.notna()]
+        parsed[hit] = attempt[hit]
+        pending[hit] = False
+
+    if pending.any():
+        rest = values[pending]
+        uniques = rest.unique()
+        try:
+            # utc=True lets aware ("...Z") and naive values share one column
+            inferred = pd.to_datetime(pd.Series(uniques), format="mixed", errors="coerce", utc=True).dt.tz_localize(None)
+            lookup = dict(zip(uniques, inferred))
+        except (ValueError, TypeError, OverflowError):
+            lookup = {value: _parse_date_value(value) for value in uniques}
+        parsed[rest.index] = rest.map(lookup)
+    return parsed
+
+
+def _parse_date_value(value: str):
+    """One value on its own; NaT (reported as a row issue) if pandas can't read it"""
+    try:
+        result = pd.to_datetime(value, errors="coerce", utc=True)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+    return pd.NaT if pd.isna(result) else result.tz_localize(None)
+
+
+def parse_int_column(values: pd.Series) -> pd.Series:
+    """Vectorized int coercion ('2019', '2019.0' -> 2019); NA where not numeric"""
+    numbers = pd.to_numeric(values, errors="coerce")
+    numbers = numbers.where(np.isfinite(numbers))
+    return np.trunc(numbers).astype("Int64")
+
+
+def _to_python(values: pd.Series) -> pd.Series:
+    """object column with None for missing, ready for the DB driver"""
+    return values.astype(object).where(values.notna(), None)
+
+
+def prepare_chunk(chunk: pd.DataFrame, mapping: Dict[str, str]) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Column-wise cleansing of one chunk in a single pass. Returns:
+      rows   - one row per valid client, typed values + `phone_key` (digits only)
+      issues - message per problem, by row index: dropped rows (missing name,
+               missing/invalid phone) and ignored cells (bad dates/years)
+    """
+    def column(target):
+        return chunk[mapping[target]].fillna('').astype(str).str.strip()
+
+    rows = pd.DataFrame(index=chunk.index)
+    rows["name"] = column("name")
+    rows["phone"] = clean_phone_column(column("phone"))
+    rows["phone_key"] = rows["phone"].str.replace('+', '', regex=False)
+
+    for field in TEXT_FIELDS:
+        if field in mapping:
+            rows[field] = column(field)
+    if "notes" in mapping:
+        rows["notes"] = column("notes")
+
+    # Invalid optional cells are dropped (left empty) but reported
+    cell_issues = []
+    if "car_year" in mapping:
+        raw = column("car_year")
+        years = parse_int_column(raw)
+        bad = (raw != '') & years.isna()
+        out_of_range = years.notna() & ((years < MIN_CAR_YEAR) | (years > MAX_CAR_YEAR))
+        years = years.mask(out_of_range)
+        cell_issues.append("Invalid car_year '" + raw[bad] + "'")
+        cell_issues.append("car_year out of range '" + raw[out_of_range.fillna(False)] + "'")
+        rows["car_year"] = _to_python(years)
+    for field in DATE_FIELDS:
+        if field in mapping:
+            raw = column(field)
+            dates = parse_date_column(raw)
+            cell_issues.append(f"Invalid {field} '" + raw[(raw != '') & dates.isna()] + "'")
+            rows[field] = _to_python(dates.dt.date.where(dates.notna()))
+
+    reasons = pd.Series(
+        np.select(
+            [rows["name"] == '', rows["phone"] == '', rows["phone"].str.len() < 7],
+            ["Missing name", "Missing phone", "Invalid phone"],
+            default=''
+        ),
+        index=rows.index
+    )
+    valid = reasons == ''
+
+    issues = pd.concat([reasons[~valid]] + [s for s in cell_issues if len(s)])
+    issues = issues.iloc[np.argsort(issues.index.to_numpy(), kind="stable")]
+    return rows[valid], issues
+
+
+def file_line(index) -> str:
+    """Spreadsheet line number of a DataFrame row (header is line 1)"""
+    return str(int(index) + 2)
+
+
+def _present(value) -> bool:
+    return value is not None and value == value and value != ''
+
+
+def _build_updates(matched: pd.DataFrame, existing: Dict[str, dict], mapping: Dict[str, str]) -> List[dict]:
+    """Per-client changed columns: non-empty values overwrite, new notes are appended"""
+    today = datetime.date.today()
+    fields = [f for f in TEXT_FIELDS + ["car_year"] + DATE_FIELDS if f in mapping]
+    updates = []
+
+    for record in matched.to_dict("records"):
+        current = existing[record["client_id"]]
+        changes = {}
+        if record["name"] and current["name"] != record["name"]:
+            changes["name"] = record["name"]
+        for field in fields:
+            value = record[field]
+            if _present(value) and current[field] != value:
+                changes[field] = value
+        if "notes" in mapping:
+            note = record["notes"]
+            if note and note not in (current["notes"] or ""):
+                changes["notes"] = (current["notes"] or "") + f"\n[{today}] {note}"
+        if changes:
+            changes["id"] = record["client_id"]
+            updates.append(changes)
+    return updates
+
+
+def _bulk_update(db: Session, updates: List[dict]) -> None:
+    """One executemany per distinct set of changed columns"""
+    groups: Dict[tuple, List[dict]] = {}
+    for values in updates:
+        groups.setdefault(tuple(sorted(values)), []).append(values)
+
+    table = Client.__table__
+    for keys, rows in groups.items():
+        columns = [k for k in keys if k != "id"]
+        stmt = update(table).where(table.c.id == bindparam("_id")).values(
+            {c: bindparam(f"_{c}") for c in columns}
+        )
+        db.execute(stmt, [{f"_{k}": v for k, v in row.items()} for row in rows])
+
+
+def import_chunk(
+    db: Session,
+    user_id: str,
+    chunk: pd.DataFrame,
+    mapping: Dict[str, str],
+    phone_index: Dict[str, str],
+    stats: ImportStats
+) -> None:
+    """
+    Split a chunk into inserts/updates and write each group in one statement.
+    Counters and the phone index only advance once the chunk is committed.
+    """
+    rows, issues = prepare_chunk(chunk, mapping)
+
+    # Same phone twice in one file: last row wins
+    rows = rows.drop_duplicates(subset="phone_key", keep="last")
+    rows = rows.assign(client_id=rows["phone_key"].map(phone_index))
+    is_update = rows["client_id"].notna()
+    new_rows, matched = rows[~is_update], rows[is_update]
+    optional_fields = [f for f in TEXT_FIELDS + ["car_year"] + DATE_FIELDS if f in mapping]
+
+    inserts = []
+    if len(new_rows):
+        now = datetime.datetime.utcnow()
+        default_notes = f"Imported {datetime.date.today()}"
+        for record in new_rows.to_dict("records"):
+            values = {
+                "id": get_uuid(),
+                "user_id": user_id,
+                "name": record["name"],
+                "phone": record["phone"],
+                "status": "imported",
+                "notes": record["notes"] if "notes" in mapping else default_notes,
+                "created_at": now,
+            }
+            # Same keys on every row keeps it a single executemany
+            for field in optional_fields:
+                values[field] = record[field] if _present(record[field]) else None
+            inserts.append(values)
+        db.execute(insert(Client), inserts)
+
+    updates = []
+    if len(matched):
+        existing_rows = db.query(*[getattr(Client, c) for c in EXISTING_COLUMNS]).filter(
+            Client.id.in_(matched["client_id"].tolist())
+        ).all()
+        existing = {row.id: row._asdict() for row in existing_rows}
+        matched = matched[matched["client_id"].isin(existing)]
+
+        updates = _build_updates(matched, existing, mapping)
+        _bulk_update(db, updates)
+
+    db.commit()
+
+    for values, key in zip(inserts, new_rows["phone_key"]):
+        phone_index[key] = values["id"]
+    stats.parsed += len(chunk)
+    stats.inserted += len(inserts)
+    stats.updated += len(updates)
+    stats.skipped += len(chunk) - len(inserts) - len(updates)
+    for index, message in issues.items():
+        stats.add_error(message, file_line(index))
+
+
+def import_clients_file(
+    db: Session,
+    user_id: str,
+    source: BinaryIO,
+    ext: str,
+    mapping: Optional[Dict[str, str]] = None,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    on_progress: Optional[Callable[[ImportStats], None]] = None,
+    stats: Optional[ImportStats] = None
+) -> ImportStats:
+    """
+    Import a CSV/Excel file of clients for a user. Each chunk is committed on
+    its own, so a failing chunk is reported and the rest still import.
+    """
+    stats = stats or ImportStats()
+    phone_index = None
+
+    for chunk_no, chunk in enumerate(read_chunks(source, ext, chunk_rows)):
+        if mapping is None:
+            mapping = resolve_column_mapping(list(chunk.columns), db, user_id)
+        if phone_index is None:
+            phone_index = load_phone_index(db, user_id)
+
+        try:
+            import_chunk(db, user_id, chunk, mapping, phone_index, stats)
+        except Exception as e:
+            db.rollback()
+            stats.parsed += len(chunk)
+            stats.skipped += len(chunk)
+            stats.add_error(str(e), f"{file_line(chunk.index[0])}-{file_line(chunk.index[-1])}")
+            print(f"[Import] Chunk {chunk_no} failed for user {user_id}: {e}")
+
+        if on_progress:
+            on_progress(stats)
+
+    if phone_index is None:
+        stats.add_error("File is empty")
+    return stats
@@ -0,0 +1,221 @@
+"""
+Token-budgeted conversation history for the RAY agent.
+
+The webhook used to pass the last 10 raw messages whatever their size: one
+pasted text or long voice-note transcript could blow up the prompt, while a
+chat of short messages lost useful context after 10 lines. Now:
+
+  - `load_history` walks back from the newest message and keeps whole turns
+    until HISTORY_TOKEN_BUDGET is used (single messages are clipped to
+    MAX_MESSAGE_TOKENS first)
+  - turns that fall out of the window are folded into
+    ConversationState.conversation_summary by `summarize_older_turns`, which
+    runs on the client's memory-worker stripe after the reply is sent;
+    `summary_until` marks how far the summary goes
+  - the agent puts the summary in its per-turn context
+
+Tokens are counted with tiktoken when it is installed, otherwise estimated.
+The encoding is loaded on the first count (it can mean a download of the BPE
+file into TIKTOKEN_CACHE_DIR), not when the module is imported.
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models import ConversationState, Message
+from app.services.llm_client import chat_completion, llm_available
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+MAX_MESSAGE_TOKENS = int(os.getenv("HISTORY_MAX_MESSAGE_TOKENS", "350"))
+
+# How far back the window looks (the budget usually stops it earlier)
+MAX_HISTORY_MESSAGES = 60
+
+# Summarize once this many messages are outside the window and not yet summarized
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", "6"))
+SUMMARY_INPUT_TOKENS = 3000
+SUMMARY_MAX_TOKENS = 300
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _get_encoding():
+    """tiktoken's gpt-4o encoding, or None to estimate instead"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o family
+                except Exception as e:  # Not installed / no encoding files: fall back to an estimate
+                    print(f"[Context] tiktoken unavailable ({type(e).__name__}), estimating tokens")
+                    _encoding = None
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, len(text) // 4)  # ~4 characters per token for Spanish/English chat text
+
+
+def clip_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the start of an over-long message (voice transcripts, pasted text)"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens]) + " […]"
+    return text[:max_tokens * 4] + " […]"
+
+
+class HistoryWindow:
+    """Messages that fit the budget (oldest first) and what was left out"""
+
+    def __init__(self, messages: List[Dict[str, str]], tokens: int, dropped: int, cutoff: Optional[datetime],
+                 more_before: bool = False):
+        self.messages = messages
+        self.tokens = tokens
+        self.dropped = dropped          # Fetched messages that did not fit
+        self.cutoff = cutoff            # sent_at of the oldest message in the window
+        self.more_before = more_before  # Older messages exist beyond MAX_HISTORY_MESSAGES
+
+
+def pack_history(
+    history: List[Dict[str, str]],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    max_message_tokens: int = MAX_MESSAGE_TOKENS
+) -> List[Dict[str, str]]:
+    """Newest messages of an agent-format history ([{role, text}]) that fit the budget"""
+    kept = []
+    used = 0
+    for item in reversed(history or []):
+        text = clip_to_tokens(item.get("text") or "", max_message_tokens)
+        cost = count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        kept.append({**item, "text": text})
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def history_tokens(history: Optional[List[Dict[str, str]]]) -> int:
+    return sum(count_tokens(item.get("text")) + MESSAGE_OVERHEAD_TOKENS for item in history or [])
+
+
+def load_history(
+    db: Session,
+    client_id: str,
+    exclude_message_id: Optional[str] = None,
+    budget: int = HISTORY_TOKEN_BUDGET
+) -> HistoryWindow:
+    """Most recent messages of the conversation within `budget` tokens"""
+    query = db.query(Message).filter(Message.client_id == client_id)
+    if exclude_message_id:
+        query = query.filter(Message.id != exclude_message_id)
+    recent = query.order_by(Message.sent_at.desc()).limit(MAX_HISTORY_MESSAGES).all()
+
+    history = [
+        {"role": "buyer" if msg.direction == "inbound" else "assistant", "text": msg.content or ""}
+        for msg in reversed(recent)
+    ]
+    kept = pack_history(history, budget)
+    dropped = len(history) - len(kept)
+    cutoff = recent[len(kept) - 1].sent_at if kept else None
+    return HistoryWindow(kept, history_tokens(kept), dropped, cutoff, len(recent) == MAX_HISTORY_MESSAGES)
+
+
+SUMMARY_PROMPT = """Mantienes el resumen de una conversación de ventas de autos por WhatsApp.
+Actualiza el resumen con los mensajes nuevos. Conserva: vehículos de interés, presupuesto,
+crédito/documentos, objeciones, acuerdos, citas y cualquier dato personal relevante.
+Máximo 120 palabras, en español, en tercera persona. Responde solo con el resumen."""
+
+
+def summarize_older_turns(
+    client_id: str,
+    cutoff: Optional[datetime],
+    session_factory: Callable[[], Session] = SessionLocal
+) -> bool:
+    """
+    Fold messages older than `cutoff` (the start of the history window) and
+    newer than `summary_until` into the running summary. True if it changed.
+    """
+    if cutoff is None or not llm_available():
+        return False
+    db = session_factory()
+    try:
+        state = db.query(ConversationState).filter(ConversationState.client_id == client_id).first()
+        if state is None:
+            return False
+
+        query = db.query(Message).filter(Message.client_id == client_id, Message.sent_at < cutoff)
+        if state.summary_until is not None:
+            query = query.filter(Message.sent_at > state.summary_until)
+        pending = query.order_by(Message.sent_at.asc()).limit(200).all()
+        if len(pending) < SUMMARY_MIN_MESSAGES:
+            return False
+
+        # Oldest first, as much as fits; the rest goes in the next run
+        lines, used, last = [], 0, None
+        for msg in pending:
+            who = "Cliente" if msg.direction == "inbound" else "Vendedor"
+            line = f"{who}: {clip_to_tokens(msg.content or '', MAX_MESSAGE_TOKENS)}"
+            cost = count_tokens(line)
+            if lines and used + cost > SUMMARY_INPUT_TOKENS:
+                break
+            lines.append(line)
+            used += cost
+            last = msg.sent_at
+
+        completion = chat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": (
+                    f"RESUMEN ACTUAL:\n{state.conversation_summary or '(vacío)'}\n\n"
+                    "MENSAJES NUEVOS:\n" + "\n".join(lines)
+                )},
+            ],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            temperature=0
+        )
+        summary = (completion.choices[0].message.content or "").strip()
+        if not summary:
+            return False
+        state.conversation_summary = summary
+        state.summary_until = last
+        db.commit()
+        print(f"[Context] Summarized {len(lines)} older messages for client {client_id}")
+        return True
+    except Exception as e:
+        db.rollback()
+        print(f"[Context] Summary failed for client {client_id}: {e}")
+        return False
+    finally:
+        db.close()
+
+
+def submit_summary(
+    client_id: str,
+    window: HistoryWindow,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> None:
+    """Queue summarization behind the client's memory updates, if anything fell out of the window"""
+    if window.dropped <= 0 and not window.more_before:
+        return
+    from app.services.memory_worker import submit_for_client
+    submit_for_client(client_id, summarize_older_turns, client_id, window.cutoff, session_factory)
@@ -0,0 +1,265 @@
+"""
+Streaming exports of account data.
+
+Rows are fetched with a server-side cursor (`yield_per`) and written to the
+response incrementally, so memory stays flat no matter how many clients an
+account has. Tags are pre-aggregated per client in a single grouped subquery
+instead of one query per client.
+"""
+import csv
+import io
+import json
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, Boolean, Date, DateTime, Float, Integer, JSON
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models import Client, Tag, ClientTag, Message, Appointment, ConversationState
+
+# Rows fetched per round-trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# Flush the CSV buffer to the client once it grows past this many characters
+CSV_CHUNK_CHARS = 64 * 1024
+
+# (header, column expression, optional formatter)
+ExportField = Tuple[str, Any, Optional[Callable[[Any], Any]]]
+
+
+def _one_line(value):
+    return value.replace('\n', ' ') if value else ""
+
+
+def _timestamp(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+# /analytics/export - original column layout
+ANALYTICS_CLIENT_FIELDS: List[ExportField] = [
+    ("ID", Client.id, None),
+    ("Name", Client.name, None),
+    ("Phone", Client.phone, None),
+    ("Email", Client.email, None),
+    ("Notes", Client.notes, _one_line),
+    ("Status", Client.status, None),
+    ("Created At", Client.created_at, _timestamp),
+]
+
+# /files/export-backup - full client backup layout
+BACKUP_CLIENT_FIELDS: List[ExportField] = [
+    ("ID", Client.id, None),
+    ("Name", Client.name, None),
+    ("Last Name", Client.last_name, None),
+    ("Phone", Client.phone, None),
+    ("Email", Client.email, None),
+    ("Address", Client.address, None),
+    ("Car Make", Client.car_make, None),
+    ("Car Model", Client.car_model, None),
+    ("Car Year", Client.car_year, None),
+    ("Status", Client.status, None),
+    ("Notes", Client.notes, None),
+    ("Created At", Client.created_at, None),
+]
+
+
+def tag_names_subquery(db: Session, user_id: str):
+    """One row per tagged client: (client_id, 'Tag A, Tag B') aggregated in SQL"""
+    if db.get_bind().dialect.name == "postgresql":
+        tag_names = func.string_agg(Tag.name, ', ')
+    else:
+        tag_names = func.group_concat(Tag.name, ', ')
+
+    return db.query(
+        ClientTag.client_id.label("client_id"),
+        tag_names.label("tag_names")
+    ).join(
+        Tag, Tag.id == ClientTag.tag_id
+    ).filter(
+        Tag.user_id == user_id
+    ).group_by(ClientTag.client_id).subquery()
+
+
+def iter_client_rows(
+    db: Session,
+    user_id: str,
+    fields: Sequence[ExportField],
+    include_tags: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[list]:
+    """Yield formatted client rows using a server-side cursor"""
+    columns = [column for _, column, _ in fields]
+    query = db.query(*columns).filter(Client.user_id == user_id)
+
+    if include_tags:
+        tags = tag_names_subquery(db, user_id)
+        query = db.query(*columns, tags.c.tag_names).outerjoin(
+            tags, tags.c.client_id == Client.id
+        ).filter(Client.user_id == user_id)
+
+    formatters = [fmt for _, _, fmt in fields]
+    for row in query.order_by(Client.created_at, Client.id).yield_per(batch_size):
+        values = [
+            fmt(value) if fmt else ("" if value is None else value)
+            for fmt, value in zip(formatters, row)
+        ]
+        if include_tags:
+            values.append(row[-1] or "")
+        yield values
+
+
+def stream_csv(header: Sequence[str], rows: Iterator[list]) -> Iterator[str]:
+    """Serialize rows to CSV text in ~64KB chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_CHARS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_clients_csv(
+    user_id: str,
+    fields: Sequence[ExportField],
+    include_tags: bool = False,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> Iterator[str]:
+    """
+    Generator for StreamingResponse. Owns its DB session because the request
+    session is closed before the response body starts streaming.
+    """
+    db = session_factory()
+    try:
+        header = [name for name, _, _ in fields] + (["Tags"] if include_tags else [])
+        yield from stream_csv(header, iter_client_rows(db, user_id, fields, include_tags))
+    finally:
+        db.close()
+
+
+# ============================================
+# COLUMNAR EXPORTS (Parquet / Arrow IPC)
+# ============================================
+
+# Datasets available for columnar export. Every table is scoped by user_id.
+COLUMNAR_DATASETS = {
+    "clients": Client,
+    "messages": Message,
+    "appointments": Appointment,
+    "conversation_states": ConversationState,
+}
+
+# format -> (file extension, media type, supported compressions)
+COLUMNAR_FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet", {"zstd", "snappy", "gzip", "lz4", "none"}),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file", {"zstd", "lz4", "none"}),
+}
+
+# Rows per Arrow record batch / Parquet row group chunk
+COLUMNAR_BATCH_SIZE = 10000
+
+
+def resolve_columns(dataset: str, columns: Optional[str] = None) -> List[Any]:
+    """
+    Map a comma-separated column selection onto the dataset's table columns.
+    Raises ValueError on unknown datasets or columns.
+    """
+    model = COLUMNAR_DATASETS.get(dataset)
+    if model is None:
+        raise ValueError(f"Unknown dataset: {dataset}. Use: {', '.join(COLUMNAR_DATASETS)}")
+
+    table_columns = model.__table__.columns
+    if not columns:
+        return list(table_columns)
+
+    selected = []
+    for name in [c.strip() for c in columns.split(",") if c.strip()]:
+        if name not in table_columns:
+            raise ValueError(f"Unknown column for {dataset}: {name}")
+        selected.append(table_columns[name])
+    if not selected:
+        raise ValueError("No columns selected")
+    return selected
+
+
+def _arrow_type(pa, column):
+    """Arrow type for a SQLAlchemy column so every batch shares one schema"""
+    col_type = column.type
+    if isinstance(col_type, Boolean):
+        return pa.bool_()
+    if isinstance(col_type, Integer):
+        return pa.int64()
+    if isinstance(col_type, Float):
+        return pa.float64()
+    if isinstance(col_type, DateTime):
+        return pa.timestamp("us", tz="UTC" if col_type.timezone else None)
+    if isinstance(col_type, Date):
+        return pa.date32()
+    # String, Text and JSON (serialized) all export as UTF-8 strings
+    return pa.string()
+
+
+def write_columnar_export(
+    db: Session,
+    user_id: str,
+    dataset: str,
+    fmt: str,
+    sink,
+    columns: Optional[str] = None,
+    compression: str = "zstd",
+    batch_size: int = COLUMNAR_BATCH_SIZE
+) -> int:
+    """
+    Stream a dataset into a Parquet or Arrow IPC file in record batches.
+    `sink` is a path or writable binary file. Returns the number of rows written.
+    """
+    import pyarrow as pa
+
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown format: {fmt}. Use: {', '.join(COLUMNAR_FORMATS)}")
+    if compression not in COLUMNAR_FORMATS[fmt][2]:
+        raise ValueError(f"Compression {compression} not supported for {fmt}")
+
+    selected = resolve_columns(dataset, columns)
+    model = COLUMNAR_DATASETS[dataset]
+    schema = pa.schema([pa.field(c.name, _arrow_type(pa, c)) for c in selected])
+    json_columns = {i for i, c in enumerate(selected) if isinstance(c.type, JSON)}
+    codec = None if compression == "none" else compression
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression=codec or "none")
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec))
+        write = writer.write_batch
+
+    def flush(buffers: List[list]) -> None:
+        arrays = [pa.array(values, type=field.type) for values, field in zip(buffers, schema)]
+        write(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+    total = 0
+    buffers: List[list] = [[] for _ in selected]
+    query = db.query(*selected).filter(model.user_id == user_id).order_by(model.id)
+    try:
+        for row in query.yield_per(batch_size):
+            for i, value in enumerate(row):
+                if i in json_columns and value is not None:
+                    value = json.dumps(value, ensure_ascii=False, default=str)
+                buffers[i].append(value)
+            total += 1
+            if total % batch_size == 0:
+                flush(buffers)
+                buffers = [[] for _ in selected]
+        if buffers[0] or total == 0:
+            flush(buffers)
+    finally:
+        writer.close()
+
+    return total
@@ -0,0 +1,233 @@
+"""
+Stage funnel and cohort analytics over ConversationState.
+
+Each report loads a columnar snapshot (narrow SELECTs of only the needed
+columns) into pandas and aggregates with vectorized groupby operations -
+no per-client queries or Python loops over leads.
+Results are cached per user in `analytics_cache` and dropped whenever a
+conversation changes stage.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.models import Client, ConversationState, ConversationStageEvent, CONVERSATION_STAGES
+from app.utils.cache import analytics_cache
+
+STAGE_INDEX = {stage: i for i, stage in enumerate(CONVERSATION_STAGES)}
+
+
+def _to_utc(series: pd.Series) -> pd.Series:
+    # PostgreSQL returns aware datetimes, SQLite naive ones (stored as UTC)
+    return pd.to_datetime(series, utc=True, errors="coerce", format="mixed")
+
+
+def _utc_now(now: Optional[datetime] = None) -> pd.Timestamp:
+    ts = pd.Timestamp(now or datetime.utcnow())
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+def load_stage_snapshot(db: Session, user_id: str):
+    """
+    Columnar snapshot of a user's conversations:
+      states: client_id, stage, stage_idx, started_at
+      events: client_id, stage, stage_idx, entered_at (one row per stage entry)
+    Conversations that predate the event log get a synthetic entry for their
+    current stage so they still count in the funnel.
+    """
+    states = pd.DataFrame.from_records(
+        db.query(
+            ConversationState.client_id,
+            ConversationState.stage,
+            ConversationState.stage_entered_at,
+            ConversationState.created_at
+        ).filter(ConversationState.user_id == user_id).all(),
+        columns=["client_id", "stage", "stage_entered_at", "started_at"]
+    )
+    events = pd.DataFrame.from_records(
+        db.query(
+            ConversationStageEvent.client_id,
+            ConversationStageEvent.stage,
+            ConversationStageEvent.entered_at
+        ).filter(ConversationStageEvent.user_id == user_id).all(),
+        columns=["client_id", "stage", "entered_at"]
+    )
+
+    states["started_at"] = _to_utc(states["started_at"])
+    states["stage_entered_at"] = _to_utc(states["stage_entered_at"])
+    states["stage"] = states["stage"].fillna("INTAKE")
+    events["entered_at"] = _to_utc(events["entered_at"])
+
+    untracked = states[~states["client_id"].isin(events["client_id"])]
+    if not untracked.empty:
+        synthetic = pd.DataFrame({
+            "client_id": untracked["client_id"],
+            "stage": untracked["stage"],
+            "entered_at": untracked["stage_entered_at"].fillna(untracked["started_at"]),
+        })
+        events = synthetic if events.empty else pd.concat([events, synthetic], ignore_index=True)
+
+    # Earliest entry per conversation is when it started
+    first_entry = events.groupby("client_id")["entered_at"].min()
+    # (pandas cannot map through an empty datetime Series: account without conversations)
+    if not first_entry.empty:
+        states["started_at"] = states["started_at"].fillna(states["client_id"].map(first_entry))
+
+    states["stage_idx"] = states["stage"].map(STAGE_INDEX)
+    events["stage_idx"] = events["stage"].map(STAGE_INDEX)
+    # Stages outside CONVERSATION_STAGES (legacy modes) are not part of the funnel
+    events = events.dropna(subset=["stage_idx"])
+    events["stage_idx"] = events["stage_idx"].astype(int)
+    return states, events
+
+
+def _reached_counts(max_idx: pd.Series) -> List[int]:
+    """Clients whose furthest stage is >= each stage (funnel is cumulative)"""
+    per_stage = max_idx.value_counts().reindex(range(len(CONVERSATION_STAGES)), fill_value=0)
+    return per_stage[::-1].cumsum()[::-1].astype(int).tolist()
+
+
+def compute_funnel(states: pd.DataFrame, events: pd.DataFrame, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Stage funnel, step conversion and time-in-stage from a snapshot"""
+    now = _utc_now(now)
+
+    max_idx = events.groupby("client_id")["stage_idx"].max()
+    reached = _reached_counts(max_idx)
+    current = states["stage"].value_counts()
+
+    # Time in stage: an entry lasts until the conversation's next entry (or now if still open)
+    ordered = events.sort_values(["client_id", "entered_at"])
+    left_at = ordered.groupby("client_id")["entered_at"].shift(-1)
+    ordered = ordered.assign(
+        open=left_at.isna(),
+        hours=(left_at.fillna(now) - ordered["entered_at"]).dt.total_seconds() / 3600
+    )
+    closed = ordered[~ordered["open"]].groupby("stage_idx")["hours"]
+    time_stats = pd.DataFrame({
+        "median": closed.median(),
+        "mean": closed.mean(),
+        "p90": closed.quantile(0.9),
+        "completed": closed.size(),
+    })
+    open_age = ordered[ordered["open"]].groupby("stage_idx")["hours"].median()
+
+    def _hours(value):
+        return None if pd.isna(value) else round(float(value), 1)
+
+    stages = []
+    total = len(max_idx)
+    for i, stage in enumerate(CONVERSATION_STAGES):
+        next_reached = reached[i + 1] if i + 1 < len(reached) else None
+        stats = time_stats.loc[i] if i in time_stats.index else None
+        stages.append({
+            "stage": stage,
+            "reached": reached[i],
+            "current": int(current.get(stage, 0)),
+            "reached_pct": round(reached[i] / total * 100, 1) if total else 0.0,
+            "conversion_to_next": (
+                round(next_reached / reached[i] * 100, 1)
+                if next_reached is not None and reached[i] else None
+            ),
+            "hours_in_stage": {
+                "median": _hours(stats["median"]) if stats is not None else None,
+                "mean": _hours(stats["mean"]) if stats is not None else None,
+                "p90": _hours(stats["p90"]) if stats is not None else None,
+                "completed": int(stats["completed"]) if stats is not None else 0,
+                "open_median": _hours(open_age.get(i)),
+            },
+        })
+
+    return {
+        "total_conversations": int(len(states)),
+        "stages": stages,
+        "overall_conversion": round(reached[-1] / total * 100, 1) if total else 0.0,
+    }
+
+
+def compute_cohorts(
+    clients: pd.DataFrame,
+    events: pd.DataFrame,
+    weeks: int = 12,
+    now: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Weekly lead cohorts (by client creation week, Monday start): leads in each
+    week and how many of them reached every stage so far.
+    """
+    now = _utc_now(now)
+    current_week = now.normalize() - pd.Timedelta(days=now.weekday())
+    first_week = current_week - pd.Timedelta(weeks=weeks - 1)
+
+    clients = clients[clients["created_at"] >= first_week].copy()
+    clients["week"] = (
+        clients["created_at"].dt.normalize()
+        - pd.to_timedelta(clients["created_at"].dt.weekday, unit="D")
+    )
+    clients["max_idx"] = clients["client_id"].map(events.groupby("client_id")["stage_idx"].max())
+
+    # leads x stage matrix of "reached" flags, summed per week in one groupby
+    reached = pd.DataFrame({
+        stage: (clients["max_idx"] >= i) for i, stage in enumerate(CONVERSATION_STAGES)
+    }, index=clients.index)
+    reached["week"] = clients["week"]
+    reached["leads"] = 1
+    by_week = reached.groupby("week").sum()
+
+    weeks_index = pd.date_range(first_week, current_week, freq="7D")
+    by_week = by_week.reindex(weeks_index, fill_value=0)
+
+    cohorts = []
+    for week, row in by_week.iterrows():
+        leads = int(row["leads"])
+        cohorts.append({
+            "week_start": week.strftime("%Y-%m-%d"),
+            "leads": leads,
+            "reached": {stage: int(row[stage]) for stage in CONVERSATION_STAGES},
+            "appointment_rate": round(row["APPOINTMENT"] / leads * 100, 1) if leads else 0.0,
+        })
+    return cohorts
+
+
+def get_funnel(db: Session, user_id: str, days: Optional[int] = None) -> Dict[str, Any]:
+    """Cached funnel report, optionally limited to conversations started in the last N days"""
+    key = (str(user_id), "funnel", days)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    states, events = load_stage_snapshot(db, user_id)
+    if days:
+        since = pd.Timestamp(datetime.utcnow() - timedelta(days=days), tz="UTC")
+        recent = states.loc[states["started_at"] >= since, "client_id"]
+        states = states[states["client_id"].isin(recent)]
+        events = events[events["client_id"].isin(recent)]
+
+    payload = compute_funnel(states, events)
+    payload["days"] = days
+    analytics_cache.set(key, payload)
+    return payload
+
+
+def get_cohorts(db: Session, user_id: str, weeks: int = 12) -> Dict[str, Any]:
+    """Cached weekly cohort report"""
+    key = (str(user_id), "cohorts", weeks)
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return cached
+
+    since = datetime.utcnow() - timedelta(weeks=weeks + 1)
+    clients = pd.DataFrame.from_records(
+        db.query(Client.id, Client.created_at).filter(
+            Client.user_id == user_id,
+            Client.created_at >= since
+        ).all(),
+        columns=["client_id", "created_at"]
+    )
+    clients["created_at"] = _to_utc(clients["created_at"])
+    _, events = load_stage_snapshot(db, user_id)
+
+    payload = {"weeks": weeks, "cohorts": compute_cohorts(clients, events, weeks)}
+    analytics_cache.set(key, payload)
+    return payload
@@ -0,0 +1,240 @@
+"""
+Image variants for WhatsApp sends.
+
+Car photos are sent at full resolution: multi-MB uploads and catalog images
+slow the bridge download and WhatsApp delivery. Each image gets resized,
+recompressed JPEG variants:
+
+  - thumbnail: 320px long edge, for lists / previews
+  - whatsapp:  1600px long edge, q80 - what send paths should use
+  - original:  the stored file untouched
+
+EXIF is dropped (after applying the orientation tag). Variants live in
+MEDIA_DIR/variants, keyed by the upload's content hash or by a hash of the
+remote URL. The directory is kept under IMAGE_VARIANT_CACHE_MB with LRU
+eviction: hits bump the mtime and the oldest files go first. Rendering
+runs on the media pool (media_jobs.run_cpu).
+
+Pillow is optional: without it, every helper falls back to the original image.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote, urljoin, urlparse
+
+import requests
+
+from app.services.media_jobs import run_cpu
+from app.services.media_store import MEDIA_DIR, public_media_url
+from app.services.storage import get_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed: variants disabled, originals are sent
+    Image = None
+    ImageOps = None
+
+VARIANTS: Dict[str, Optional[tuple]] = {
+    # name: (max long edge px, JPEG quality); None = untouched original
+    "thumbnail": (320, 70),
+    "whatsapp": (1600, 80),
+    "original": None,
+}
+DEFAULT_SEND_VARIANT = "whatsapp"
+
+VARIANTS_DIR = MEDIA_DIR / "variants"
+IMAGE_VARIANT_CACHE_BYTES = int(os.getenv("IMAGE_VARIANT_CACHE_MB", "512")) * 1024 * 1024
+
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp"}
+
+# Remote images the proxy may fetch (catalog CDNs); everything else is sent as-is
+IMAGE_PROXY_HOSTS = {
+    host.strip().lower()
+    for host in os.getenv("IMAGE_PROXY_HOSTS", "images.unsplash.com,auto-ai-beta.vercel.app").split(",")
+    if host.strip()
+}
+MAX_REMOTE_IMAGE_BYTES = 15 * 1024 * 1024
+MAX_REMOTE_REDIRECTS = 3
+
+
+def variants_enabled() -> bool:
+    return Image is not None
+
+
+def is_image_filename(filename: str) -> bool:
+    return filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS if '.' in filename else False
+
+
+def proxy_allowed(url: str) -> bool:
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and (parsed.hostname or "").lower() in IMAGE_PROXY_HOSTS
+
+
+def render_variant(data: bytes, variant: str) -> bytes:
+    """Resize + recompress to JPEG without metadata (CPU-bound, run on the pool)"""
+    max_edge, quality = VARIANTS[variant]
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = io.BytesIO()
+        # No exif= argument: metadata (GPS, device) is not carried over
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def evict_variants(directory: Path = None, max_bytes: int = None) -> int:
+    """Delete least recently used variants until the cache fits. Returns bytes freed."""
+    directory = directory or VARIANTS_DIR
+    max_bytes = IMAGE_VARIANT_CACHE_BYTES if max_bytes is None else max_bytes
+    if not directory.exists():
+        return 0
+
+    files = []
+    for path in directory.iterdir():
+        if path.is_file() and not path.name.endswith(".part"):
+            st = path.stat()
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    freed = 0
+    for _, size, path in sorted(files, key=lambda f: f[0]):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        freed += size
+    if freed:
+        print(f"[ImageVariants] Evicted {freed} bytes from variant cache")
+    return freed
+
+
+def _cache_path(key: str, variant: str) -> Path:
+    return VARIANTS_DIR / f"{key}.{variant}.jpg"
+
+
+def _write_variant(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    evict_variants()
+
+
+def _cached(path: Path) -> bool:
+    if path.exists():
+        os.utime(path)  # LRU: a hit makes it recent
+        return True
+    return False
+
+
+async def _build(path: Path, data: bytes, variant: str) -> Optional[Path]:
+    try:
+        rendered = await run_cpu(render_variant, data, variant)
+        await run_cpu(_write_variant, path, rendered)
+        return path
+    except Exception as e:
+        print(f"[ImageVariants] Could not render {variant} for {path.name}: {e}")
+        return None
+
+
+async def local_variant(filename: str, variant: str, directory: Path = None) -> Optional[Path]:
+    """Variant of a stored upload. None means serve the original instead."""
+    directory = directory or MEDIA_DIR
+    source = directory / filename
+    if variant == "original" or not variants_enabled() or not is_image_filename(filename):
+        return None
+
+    path = _cache_path(Path(filename).stem, variant)
+    if await run_cpu(_cached, path):
+        return path
+    if not source.exists():
+        # Local working copy gone (redeploy): pull it back from object storage
+        storage = get_storage()
+        if not storage.is_remote or not await run_cpu(storage.exists, filename):
+            return None
+        await run_cpu(storage.download, filename, source)
+    data = await run_cpu(source.read_bytes)
+    return await _build(path, data, variant)
+
+
+def _download(url: str) -> bytes:
+    # Redirects are followed by hand: every hop must be an allow-listed host too
+    for _ in range(MAX_REMOTE_REDIRECTS + 1):
+        res = requests.get(url, timeout=10, stream=True, allow_redirects=False)
+        if not res.is_redirect:
+            break
+        res.close()
+        url = urljoin(url, res.headers["location"])
+        if not proxy_allowed(url):
+            raise ValueError(f"redirect to a host not allowed: {urlparse(url).hostname}")
+    else:
+        raise ValueError("too many redirects")
+    with res:
+        res.raise_for_status()
+        chunks, size = [], 0
+        for chunk in res.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > MAX_REMOTE_IMAGE_BYTES:
+                raise ValueError("remote image too large")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+async def remote_variant(url: str, variant: str) -> Optional[Path]:
+    """Variant of an allow-listed remote image (fetched once, then cached)"""
+    if variant == "original" or not variants_enabled() or not proxy_allowed(url):
+        return None
+
+    path = _cache_path(hashlib.sha256(url.encode()).hexdigest(), variant)
+    if await run_cpu(_cached, path):
+        return path
+    try:
+        data = await run_cpu(_download, url)
+    except Exception as e:
+        print(f"[ImageVariants] Download failed for {url[:80]}: {e}")
+        return None
+    return await _build(path, data, variant)
+
+
+def variant_url(url: Optional[str], variant: str = DEFAULT_SEND_VARIANT) -> Optional[str]:
+    """
+    URL that serves `url` as the given variant - what send paths pass to the
+    bridge. Returns the URL unchanged when no variant can be produced.
+    """
+    if not url or variant == "original" or not variants_enabled():
+        return url
+
+    own_prefix = public_media_url("")
+    if url.startswith(own_prefix):
+        filename = url[len(own_prefix):]
+        if '/' not in filename and is_image_filename(filename):
+            return public_media_url(f"variants/{variant}/{filename}")
+        return url
+    if proxy_allowed(url):
+        base = own_prefix[:-len("/files/media/")]
+        return f"{base}/files/image-proxy/{variant}?url={quote(url, safe='')}"
+    return url
+
+
+# Strong refs to fire-and-forget pre-renders (the loop only keeps weak ones)
+_background = set()
+
+
+def pregenerate(filename: str, directory: Path = None, variant: str = DEFAULT_SEND_VARIANT) -> None:
+    """Render the send variant right after upload so the first send is a cache hit"""
+    if not variants_enabled() or not is_image_filename(filename):
+        return
+    task = asyncio.get_running_loop().create_task(local_variant(filename, variant, directory))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
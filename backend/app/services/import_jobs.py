@@ -0,0 +1,201 @@
+"""
+Background client import jobs.
+
+The upload is streamed to disk, an ImportJob row is created and the file is
+processed by a small thread pool (chunked importer from client_import.py).
+Progress counters are written after every chunk; rejected rows and failed
+chunks go to a per-job CSV error file that can be downloaded afterwards.
+
+Every API worker runs `resume_pending_jobs` at startup, so a job is only run
+by the worker that flips it from queued to running with a conditional UPDATE.
+The running worker renews `heartbeat_at` after every chunk; a running job is
+only taken over once that lease has expired.
+"""
+import csv
+import os
+import datetime
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from fastapi import UploadFile
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.db.session import SessionLocal
+from app.models import ImportJob, get_uuid
+from app.services.client_import import ImportStats, import_clients_file
+
+IMPORT_JOBS_DIR = Path(os.getenv("IMPORT_JOBS_DIR", "uploads/imports"))
+
+# Concurrent imports per process (each holds one DB connection while running)
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+
+# Bytes read from the upload per write to disk
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-job")
+
+# A running job whose heartbeat is older than this belongs to a dead worker
+IMPORT_JOB_LEASE_SECONDS = int(os.getenv("IMPORT_JOB_LEASE_SECONDS", "300"))
+
+
+async def save_upload(upload: UploadFile, path: Path) -> int:
+    """Stream an upload to disk without holding it in memory. Returns bytes written."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+    with open(path, "wb") as out:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            await run_in_threadpool(out.write, chunk)
+            size += len(chunk)
+    return size
+
+
+def create_job(db: Session, user_id: str, filename: str, ext: str) -> ImportJob:
+    """Register a queued job; the caller writes the upload to job.file_path"""
+    job_id = get_uuid()
+    job = ImportJob(
+        id=job_id,
+        user_id=user_id,
+        filename=filename,
+        file_path=str(IMPORT_JOBS_DIR / f"{job_id}{ext}"),
+        status="queued"
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def submit_job(job_id: str, session_factory: Callable[[], Session] = SessionLocal) -> Future:
+    return _executor.submit(run_import_job, job_id, session_factory)
+
+
+def _apply_stats(job: ImportJob, stats: ImportStats) -> None:
+    job.parsed = stats.parsed
+    job.inserted = stats.inserted
+    job.updated = stats.updated
+    job.skipped = stats.skipped
+    job.error_count = stats.error_count
+
+
+def _transition(db: Session, job_id: str, from_status: str, values: Dict[str, Any]) -> bool:
+    """Atomic status change; False if another worker changed the job first"""
+    claimed = db.query(ImportJob).filter(
+        ImportJob.id == job_id,
+        ImportJob.status == from_status
+    ).update(values, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def run_import_job(job_id: str, session_factory: Callable[[], Session] = SessionLocal) -> None:
+    """Worker body: import the spooled file, keeping the job row up to date"""
+    db = session_factory()
+    now = datetime.datetime.utcnow()
+    claimed = _transition(db, job_id, "queued", {
+        ImportJob.status: "running",
+        ImportJob.started_at: now,
+        ImportJob.heartbeat_at: now
+    })
+    job = db.get(ImportJob, job_id) if claimed else None
+    if not job:
+        print(f"[ImportJob] {job_id} not queued (claimed by another worker?), skipping")
+        db.close()
+        return
+
+    error_path = IMPORT_JOBS_DIR / f"{job_id}_errors.csv"
+    stats = None
+    try:
+        print(f"[ImportJob] {job_id} started for user {job.user_id} ({job.filename})")
+
+        def progress(current: ImportStats) -> None:
+            _apply_stats(job, current)
+            job.heartbeat_at = datetime.datetime.utcnow()
+            db.commit()
+
+        error_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(error_path, "w", newline="", encoding="utf-8") as error_file:
+            writer = csv.writer(error_file)
+            writer.writerow(["row", "error"])
+            stats = ImportStats(on_error=lambda row, message: writer.writerow([row or "", message]))
+
+            with open(job.file_path, "rb") as source:
+                import_clients_file(
+                    db, job.user_id, source, Path(job.file_path).suffix.lower(),
+                    on_progress=progress, stats=stats
+                )
+
+        _apply_stats(job, stats)
+        job.status = "completed"
+    except Exception as e:
+        db.rollback()
+        print(f"[ImportJob] {job_id} failed: {e}")
+        if stats:
+            _apply_stats(job, stats)
+        job.status = "failed"
+        job.message = str(e)
+    finally:
+        if stats and stats.error_count:
+            job.error_file_path = str(error_path)
+        elif error_path.exists():
+            error_path.unlink()
+        job.finished_at = datetime.datetime.utcnow()
+        db.commit()
+        print(f"[ImportJob] {job_id} {job.status}: {stats.as_dict() if stats else job.message}")
+
+        try:
+            os.remove(job.file_path)
+        except OSError:
+            pass
+        db.close()
+
+
+def resume_pending_jobs(session_factory: Callable[[], Session] = SessionLocal) -> int:
+    """
+    Re-queue jobs interrupted by a restart. Re-running is safe: rows already
+    written are matched by phone and only count as updates if they change.
+    Safe to call from every worker: "running" jobs are only taken back once
+    their heartbeat lease expired, and `run_import_job` claims each queued
+    job for exactly one worker.
+    """
+    db = session_factory()
+    try:
+        jobs = db.query(ImportJob).filter(ImportJob.status.in_(["queued", "running"])).all()
+        lease_cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=IMPORT_JOB_LEASE_SECONDS)
+        resumed = 0
+        for job in jobs:
+            status = job.status
+            heartbeat = job.heartbeat_at or job.started_at
+            if status == "running" and heartbeat and heartbeat.replace(tzinfo=None) > lease_cutoff:
+                continue  # Live run in another worker
+            if not (job.file_path and os.path.exists(job.file_path)):
+                _transition(db, job.id, status, {ImportJob.status: "failed", ImportJob.message: "Upload lost during restart"})
+                continue
+            if status == "queued" or _transition(db, job.id, "running", {ImportJob.status: "queued"}):
+                submit_job(job.id, session_factory)
+                resumed += 1
+        return resumed
+    finally:
+        db.close()
+
+
+def job_to_dict(job: ImportJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "parsed": job.parsed or 0,
+        "inserted": job.inserted or 0,
+        "updated": job.updated or 0,
+        "skipped": job.skipped or 0,
+        "error_count": job.error_count or 0,
+        "has_error_file": bool(job.error_file_path),
+        "message": job.message,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
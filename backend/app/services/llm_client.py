@@ -0,0 +1,288 @@
+"""
+Shared LLM client layer.
+
+Every AI call used to build its own `OpenAI()` client, throwing away the
+HTTP connection pool and TLS session each time. This module holds one
+process-wide client (sync and async) on a pooled httpx transport and wraps
+calls with:
+
+  - timeouts (LLM_TIMEOUT_SECONDS)
+  - a cap on in-flight requests (LLM_MAX_CONCURRENCY)
+  - retry with exponential backoff + jitter on 429, 5xx, timeouts and
+    connection errors, honouring Retry-After (LLM_MAX_RETRIES)
+
+Call sites use `chat_completion(...)` / `achat_completion(...)` with the
+usual `chat.completions.create` keyword arguments, and `embed_texts(...)`
+for embeddings. `chat_completion_stream(on_text, ...)` streams the answer,
+handing text to `on_text` as it arrives, and returns the assembled
+completion in the same shape as `chat_completion`.
+
+These go to the active provider (LLM_PROVIDER: openai, replay or stub, see
+app.services.llm_providers); pooling, limits and retries apply to OpenAI.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from openai import (
+    APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI, OpenAI
+)
+
+from app.services.llm_providers import LLMProvider, ReplayProvider, StubProvider, make_completion
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = 0.5
+LLM_MAX_BACKOFF_SECONDS = 8.0
+
+DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+_lock = threading.Lock()
+_client: Optional[OpenAI] = None
+_sync_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Async client + semaphore belong to one event loop
+_async_state: Optional[Tuple[asyncio.AbstractEventLoop, AsyncOpenAI, asyncio.Semaphore]] = None
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+
+def get_client() -> OpenAI:
+    """Process-wide sync client (retries are done here, not by the SDK)"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    max_retries=0,
+                    timeout=_timeout(),
+                    http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+                )
+    return _client
+
+
+def _async_parts() -> Tuple[AsyncOpenAI, asyncio.Semaphore]:
+    global _async_state
+    loop = asyncio.get_running_loop()
+    if _async_state is None or _async_state[0] is not loop:
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            timeout=_timeout(),
+            http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+        )
+        _async_state = (loop, client, asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+    return _async_state[1], _async_state[2]
+
+
+def get_async_client() -> AsyncOpenAI:
+    """Async client for the running event loop"""
+    return _async_parts()[0]
+
+
+def retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying, or None if the error is not retryable"""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        retry_after = None
+    elif isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500):
+        retry_after = error.response.headers.get("retry-after") if error.response is not None else None
+    else:
+        return None
+
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_MAX_BACKOFF_SECONDS)
+        except ValueError:
+            pass
+    backoff = min(LLM_BACKOFF_SECONDS * (2 ** attempt), LLM_MAX_BACKOFF_SECONDS)
+    return backoff * (0.5 + random.random() / 2)
+
+
+def add_usage(usage: Optional[dict], completion: Any) -> None:
+    """Add one call and its token counts to a usage accumulator (None: no-op)"""
+    if usage is None:
+        return
+    usage["llm_calls"] = usage.get("llm_calls", 0) + 1
+    counts = getattr(completion, "usage", None)
+    for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        usage[key] = usage.get(key, 0) + (getattr(counts, key, 0) or 0)
+    # Prompt tokens served from the provider's prefix cache
+    details = getattr(counts, "prompt_tokens_details", None)
+    usage["cached_tokens"] = usage.get("cached_tokens", 0) + (getattr(details, "cached_tokens", 0) or 0)
+
+
+def _call_with_retries(call: Callable[[], Any]) -> Any:
+    attempt = 0
+    while True:
+        try:
+            with _sync_slots:
+                return call()
+        except Exception as e:
+            delay = retry_delay(e, attempt) if attempt < LLM_MAX_RETRIES else None
+            if delay is None:
+                raise
+            print(f"[LLM] {type(e).__name__} (attempt {attempt + 1}/{LLM_MAX_RETRIES + 1}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+class StreamInterrupted(Exception):
+    """The stream failed after part of the answer was handed out: not retried"""
+
+
+def collect_stream(chunks: Iterable[Any], on_text: Callable[[str], None]) -> Any:
+    """Assemble streamed chunks into a completion-like object, passing text deltas on"""
+    content: List[str] = []
+    tool_calls: Dict[int, Dict[str, str]] = {}
+    finish_reason = None
+    usage = None
+    for chunk in chunks:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage  # Last chunk, with stream_options include_usage
+        for choice in chunk.choices or []:
+            delta = choice.delta
+            if delta.content:
+                content.append(delta.content)
+                on_text(delta.content)
+            for call in delta.tool_calls or []:
+                slot = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                slot["id"] = call.id or slot["id"]
+                if call.function is not None:
+                    slot["name"] += call.function.name or ""
+                    slot["arguments"] += call.function.arguments or ""
+            finish_reason = choice.finish_reason or finish_reason
+
+    completion = make_completion(
+        "".join(content) or None, [slot for _, slot in sorted(tool_calls.items())], finish_reason=finish_reason
+    )
+    completion.usage = usage
+    return completion
+
+
+class OpenAIProvider(LLMProvider):
+    """The OpenAI API through the shared client, with limits and retries"""
+
+    name = "openai"
+
+    def available(self) -> bool:
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def chat(self, **kwargs: Any) -> Any:
+        return _call_with_retries(lambda: get_client().chat.completions.create(**kwargs))
+
+    def chat_stream(self, on_text: Callable[[str], None], **kwargs: Any) -> Any:
+        """Holds a concurrency slot until the stream is read; retries only while nothing was handed out"""
+        kwargs["stream"] = True
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        emitted = False
+
+        def forward(text: str) -> None:
+            nonlocal emitted
+            emitted = True
+            on_text(text)
+
+        def call() -> Any:
+            stream = get_client().chat.completions.create(**kwargs)
+            try:
+                return collect_stream(stream, forward)
+            except Exception as e:
+                if emitted:
+                    raise StreamInterrupted(str(e)) from e
+                raise
+
+        return _call_with_retries(call)
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        response = _call_with_retries(lambda: get_client().embeddings.create(model=model, input=texts))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def achat(self, **kwargs: Any) -> Any:
+        client, slots = _async_parts()
+        attempt = 0
+        while True:
+            try:
+                async with slots:
+                    return await client.chat.completions.create(**kwargs)
+            except Exception as e:
+                delay = retry_delay(e, attempt) if attempt < LLM_MAX_RETRIES else None
+                if delay is None:
+                    raise
+                print(f"[LLM] {type(e).__name__} (attempt {attempt + 1}/{LLM_MAX_RETRIES + 1}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+_provider: Optional[LLMProvider] = None
+
+
+def _provider_from_env() -> LLMProvider:
+    name = os.getenv("LLM_PROVIDER", "openai").lower()
+    if name == "stub":
+        return StubProvider.from_env()
+    if name == "replay":
+        path = os.getenv("LLM_REPLAY_FILE", "llm_replay.jsonl")
+        recorder = OpenAIProvider() if os.getenv("LLM_REPLAY_RECORD", "0") == "1" else None
+        return ReplayProvider(path, recorder=recorder, strict=os.getenv("LLM_REPLAY_STRICT", "0") == "1")
+    if name != "openai":
+        print(f"[LLM] Unknown LLM_PROVIDER '{name}', using openai")
+    return OpenAIProvider()
+
+
+def get_provider() -> LLMProvider:
+    """Active provider, built from LLM_PROVIDER on first use"""
+    global _provider
+    if _provider is None:
+        with _lock:
+            if _provider is None:
+                _provider = _provider_from_env()
+                print(f"[LLM] Provider: {_provider.name}")
+    return _provider
+
+
+def set_provider(provider: Optional[LLMProvider]) -> None:
+    """Swap the provider (benchmarks, tests); None goes back to LLM_PROVIDER"""
+    global _provider
+    with _lock:
+        _provider = provider
+
+
+def llm_available() -> bool:
+    """Can AI features run (API key set, or a local provider)?"""
+    return get_provider().available()
+
+
+def chat_completion(**kwargs: Any) -> Any:
+    """`chat.completions.create` on the active provider"""
+    kwargs.setdefault("model", DEFAULT_MODEL)
+    return get_provider().chat(**kwargs)
+
+
+def chat_completion_stream(on_text: Callable[[str], None], **kwargs: Any) -> Any:
+    """Streaming chat_completion; returns the assembled completion"""
+    kwargs.setdefault("model", DEFAULT_MODEL)
+    return get_provider().chat_stream(on_text, **kwargs)
+
+
+def embed_texts(texts: List[str], model: str = EMBEDDING_MODEL) -> List[List[float]]:
+    """Embedding vectors for `texts`, in order"""
+    return get_provider().embed(texts, model)
+
+
+async def achat_completion(**kwargs: Any) -> Any:
+    """Async variant of chat_completion"""
+    kwargs.setdefault("model", DEFAULT_MODEL)
+    return await get_provider().achat(**kwargs)
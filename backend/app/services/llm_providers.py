@@ -0,0 +1,382 @@
+"""
+LLM providers behind app.services.llm_client.
+
+Every AI module calls `chat_completion` / `chat_completion_stream` /
+`achat_completion` / `embed_texts` from llm_client, which hand the request
+to the active provider (LLM_PROVIDER):
+
+  - openai  (default) the OpenAI API, with llm_client's pooling and retries
+  - replay  answers recorded to a JSONL file (LLM_REPLAY_FILE); with
+            LLM_REPLAY_RECORD=1 it calls OpenAI and records instead
+  - stub    deterministic local answers with configurable latency and a
+            script of tool calls (LLM_STUB_SCRIPT), no network at all
+
+replay and stub make the webhook -> agent -> send path runnable offline, so
+throughput and regression benchmarks need neither an API key nor money.
+Responses have the shape of OpenAI's chat completions (`choices[0].message`
+with `content`/`tool_calls`, `usage`), which is all callers look at.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+
+
+def make_completion(
+    content: Optional[str],
+    tool_calls: Optional[List[Dict[str, str]]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    finish_reason: Optional[str] = None
+) -> Any:
+    """Completion-like object; tool_calls as [{"id", "name", "arguments"}]"""
+    message = ChatCompletionMessage(
+        role="assistant",
+        content=content,
+        tool_calls=[
+            ChatCompletionMessageToolCall(
+                id=call["id"], type="function",
+                function={"name": call["name"], "arguments": call["arguments"]}
+            )
+            for call in tool_calls or []
+        ] or None,
+    )
+    counts = None
+    if usage is not None:
+        counts = SimpleNamespace(
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=usage.get("cached_tokens", 0)),
+        )
+    finish_reason = finish_reason or ("tool_calls" if tool_calls else "stop")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=counts)
+
+
+def completion_to_dict(completion: Any) -> Dict[str, Any]:
+    """Serializable form of a completion (inverse of make_completion)"""
+    message = completion.choices[0].message
+    counts = getattr(completion, "usage", None)
+    details = getattr(counts, "prompt_tokens_details", None)
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+            for call in message.tool_calls or []
+        ],
+        "usage": {
+            "prompt_tokens": getattr(counts, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(counts, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(counts, "total_tokens", 0) or 0,
+            "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        },
+    }
+
+
+def request_key(kind: str, kwargs: Dict[str, Any]) -> str:
+    """Stable hash of what decides the answer (streaming options left out)"""
+    relevant = {k: v for k, v in kwargs.items() if k not in ("stream", "stream_options")}
+    if "messages" in relevant:
+        relevant["messages"] = [_message_dict(m) for m in relevant["messages"]]
+    if "tools" in relevant:
+        relevant["tools"] = [t.get("function", {}).get("name") for t in relevant["tools"]]
+    blob = json.dumps({"kind": kind, **relevant}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+def _message_dict(message: Any) -> Dict[str, Any]:
+    """Chat message as a plain dict (callers append SDK message objects too)"""
+    if isinstance(message, dict):
+        return message
+    return {
+        "role": message.role,
+        "content": message.content,
+        "tool_calls": [
+            {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+            for call in message.tool_calls or []
+        ],
+    }
+
+
+def _text_pieces(text: str, size: int = 4) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class LLMProvider:
+    """Interface; subclasses implement `chat` and `embed`"""
+
+    name = "base"
+
+    def available(self) -> bool:
+        return True
+
+    def chat(self, **kwargs: Any) -> Any:
+        raise NotImplementedError
+
+    def chat_stream(self, on_text: Callable[[str], None], **kwargs: Any) -> Any:
+        """Default: the whole answer, handed to `on_text` in small pieces"""
+        completion = self.chat(**kwargs)
+        for piece in _text_pieces(completion.choices[0].message.content or ""):
+            on_text(piece)
+        return completion
+
+    async def achat(self, **kwargs: Any) -> Any:
+        return await asyncio.to_thread(self.chat, **kwargs)
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class ReplayMiss(LookupError):
+    """No recorded answer for a request"""
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Serves answers recorded in a JSONL file, one {"kind", "key", "response"}
+    per line. With `recorder` (another provider) it records instead.
+
+    Requests are matched on `request_key`; prompts that change between runs
+    (e.g. the hour in the agent's context) miss, so unless `strict` a miss
+    takes the next recording of the same kind in file order. Those fallbacks
+    are logged and counted in `stats`: a regression run with many of them
+    is comparing against answers to other questions.
+    """
+
+    name = "replay"
+
+    def __init__(self, path: str, recorder: Optional[LLMProvider] = None, strict: bool = False):
+        self.path = path
+        self.recorder = recorder
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._in_order: Dict[str, List[Dict[str, Any]]] = {}
+        self.stats = {"matched": 0, "fallbacks": 0, "misses": 0}
+        if recorder is None:
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                record["used"] = False
+                self._by_key.setdefault(record["key"], []).append(record)
+                self._in_order.setdefault(record["kind"], []).append(record)
+        print(f"[LLM] Replaying {sum(len(r) for r in self._in_order.values())} recorded answers from {self.path}")
+
+    def _take(self, kind: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            candidates = [r for r in self._by_key.get(key, []) if not r["used"]]
+            outcome = "matched"
+            if not candidates and not self.strict:
+                candidates = [r for r in self._in_order.get(kind, []) if not r["used"]]
+                outcome = "fallbacks"
+            if not candidates:
+                self.stats["misses"] += 1
+                raise ReplayMiss(f"No recorded {kind} answer for request {key}")
+            record = candidates[0]
+            self.stats[outcome] += 1
+            if outcome == "fallbacks":
+                print(f"[LLM] Replay: no {kind} recording for {key}, serving the next one ({record['key']})")
+            record["used"] = True
+            return record["response"]
+
+    def _record(self, kind: str, key: str, response: Any) -> None:
+        line = json.dumps({"kind": kind, "key": key, "response": response}, ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def available(self) -> bool:
+        return self.recorder.available() if self.recorder is not None else True
+
+    def chat(self, **kwargs: Any) -> Any:
+        key = request_key("chat", kwargs)
+        if self.recorder is not None:
+            completion = self.recorder.chat(**kwargs)
+            self._record("chat", key, completion_to_dict(completion))
+            return completion
+        data = self._take("chat", key)
+        return make_completion(data["content"], data["tool_calls"], data["usage"])
+
+    def chat_stream(self, on_text: Callable[[str], None], **kwargs: Any) -> Any:
+        if self.recorder is not None:
+            completion = self.recorder.chat_stream(on_text, **kwargs)
+            self._record("chat", request_key("chat", kwargs), completion_to_dict(completion))
+            return completion
+        return super().chat_stream(on_text, **kwargs)
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        key = request_key("embed", {"model": model, "input": texts})
+        if self.recorder is not None:
+            vectors = self.recorder.embed(texts, model)
+            self._record("embed", key, vectors)
+            return vectors
+        return self._take("embed", key)
+
+
+# Built-in script: the side calls (memory extraction, history summary) plus
+# enough to take the agent through a tool round
+DEFAULT_STUB_SCRIPT = [
+    {"system": r"^Extraes información", "content": "{}"},
+    {"system": r"^Mantienes el resumen", "content": "Cliente interesado en un Corolla, aún sin cita."},
+    {
+        "match": r"cu[aá]nto|pago|mensual|precio|lease|financ",
+        "tool_calls": [{"name": "calculate_payment", "arguments": {"model_name": "Corolla LE", "plan_type": "finance"}}],
+        "reply": "El Corolla LE te queda en aproximadamente $389 al mes con $2,000 de down. ¿Quieres que te agende para verlo?",
+        "memory": {"vehicle_mentioned": "Corolla", "plan_preference": "finance"},
+    },
+    {
+        "match": r"horario|disponib|cu[aá]ndo",
+        "tool_calls": [{"name": "check_calendar", "arguments": {}}],
+        "reply": "Tengo espacio mañana a las 10am o a las 3pm. ¿Cuál te queda mejor?",
+    },
+]
+DEFAULT_STUB_REPLY = "¡Claro! Con gusto te ayudo. ¿Qué modelo te interesa y buscas lease o financiamiento?"
+
+
+class StubProvider(LLMProvider):
+    """
+    Deterministic local answers. Script rules ({"match": regex on the last
+    user message, optional "system" regex on the first system message,
+    "tool_calls": [{"name", "arguments"}], "reply", "memory", "content",
+    "latency_ms"}) are tried in order:
+
+      - while tools are offered and the rule has tool calls not answered yet,
+        it asks for them (a forced tool_choice is always honoured)
+      - otherwise it answers with the rule's "content" verbatim, or its
+        "reply" (DEFAULT_STUB_REPLY if no rule matches), as {"reply", "memory"}
+        JSON when JSON is requested
+
+    Latency is `latency_ms` (or the rule's) plus up to `jitter_ms` (seeded by
+    the request, so runs repeat), and `token_ms` per streamed piece.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        script: Optional[List[Dict[str, Any]]] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        token_ms: float = 0.0,
+        reply: str = DEFAULT_STUB_REPLY,
+        dimensions: int = 64
+    ):
+        self.script = DEFAULT_STUB_SCRIPT if script is None else script
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.token_ms = token_ms
+        self.reply = reply
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls) -> "StubProvider":
+        script = None
+        script_path = os.getenv("LLM_STUB_SCRIPT")
+        if script_path:
+            with open(script_path, encoding="utf-8") as f:
+                script = json.load(f)
+        return cls(
+            script=script,
+            latency_ms=float(os.getenv("LLM_STUB_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("LLM_STUB_JITTER_MS", "0")),
+            token_ms=float(os.getenv("LLM_STUB_TOKEN_MS", "0")),
+        )
+
+    def _sleep(self, kwargs: Dict[str, Any], rule: Optional[Dict[str, Any]]) -> None:
+        latency = (rule or {}).get("latency_ms", self.latency_ms)
+        if not latency and not self.jitter_ms:
+            return
+        rng = random.Random(request_key("chat", kwargs))
+        time.sleep((latency + rng.random() * self.jitter_ms) / 1000)
+
+    def _rule_for(self, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        for rule in self.script:
+            if rule.get("match") and not re.search(rule["match"], user, re.IGNORECASE):
+                continue
+            if rule.get("system") and not re.search(rule["system"], system, re.IGNORECASE):
+                continue
+            return rule
+        return None
+
+    def _answer(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = [_message_dict(m) for m in kwargs.get("messages", [])]
+        rule = self._rule_for(messages)
+        self._sleep(kwargs, rule)
+        # Tool calls already answered since the last user message
+        done = set()
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                break
+            done.update(call["name"] for call in message.get("tool_calls") or [])
+
+        tool_choice = kwargs.get("tool_choice")
+        wanted = []
+        if kwargs.get("tools"):
+            if isinstance(tool_choice, dict):
+                forced = tool_choice["function"]["name"]
+                scripted = next((c for c in (rule or {}).get("tool_calls", []) if c["name"] == forced), None)
+                wanted = [scripted or {"name": forced, "arguments": {}}] if forced not in done else []
+            elif tool_choice != "none":
+                wanted = [c for c in (rule or {}).get("tool_calls", []) if c["name"] not in done]
+        if wanted:
+            turn = sum(1 for m in messages if m.get("role") == "assistant")
+            return {"content": None, "tool_calls": [
+                {"id": f"call_{turn}_{i}", "name": c["name"], "arguments": json.dumps(c.get("arguments", {}))}
+                for i, c in enumerate(wanted)
+            ]}
+
+        if rule and rule.get("content") is not None:
+            return {"content": rule["content"], "tool_calls": []}
+        reply = (rule or {}).get("reply", self.reply)
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            reply = json.dumps({"reply": reply, "memory": (rule or {}).get("memory", {})}, ensure_ascii=False)
+        return {"content": reply, "tool_calls": []}
+
+    def _usage(self, kwargs: Dict[str, Any], answer: Dict[str, Any]) -> Dict[str, int]:
+        prompt = sum(len(str(m.get("content") or "")) for m in (_message_dict(m) for m in kwargs.get("messages", [])))
+        completion = len(answer["content"] or "") + sum(len(c["arguments"]) + 10 for c in answer["tool_calls"])
+        prompt_tokens, completion_tokens = max(1, prompt // 4), max(1, completion // 4)  # ~4 chars per token
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def chat(self, **kwargs: Any) -> Any:
+        with self._lock:
+            self.calls += 1
+        answer = self._answer(kwargs)
+        return make_completion(answer["content"], answer["tool_calls"], self._usage(kwargs, answer))
+
+    def chat_stream(self, on_text: Callable[[str], None], **kwargs: Any) -> Any:
+        with self._lock:
+            self.calls += 1
+        answer = self._answer(kwargs)
+        for piece in _text_pieces(answer["content"] or ""):
+            if self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            on_text(piece)
+        return make_completion(answer["content"], answer["tool_calls"], self._usage(kwargs, answer))
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """Hashed bag of words: same words, same vector"""
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dimensions
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % self.dimensions] += 1.0
+            vectors.append(vector)
+        return vectors
@@ -0,0 +1,194 @@
+"""
+Media processing pool.
+
+ffmpeg runs as an asyncio subprocess, so converting a voice note never blocks
+the event loop, and CPU-bound work (image resizing) runs on a small thread
+executor. Both share one semaphore, which caps concurrent jobs at
+MEDIA_WORKERS per process.
+
+Transcodes are tracked per asset: the upload returns right away with the
+asset in status "processing", the job flips it to "ready" or "failed", and
+`wait_for_asset` lets the media endpoint hold a download until the converted
+file exists.
+"""
+import asyncio
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.db.session import SessionLocal
+from app.models import MediaAsset
+
+# Concurrent ffmpeg processes / image jobs per process
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+# A conversion taking longer than this is killed and the original is served
+FFMPEG_TIMEOUT_SECONDS = int(os.getenv("FFMPEG_TIMEOUT_SECONDS", "120"))
+
+_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media-job")
+
+# (loop, semaphore): asyncio primitives belong to one event loop
+_slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+# Public asset filename -> running transcode
+_jobs: Dict[str, "asyncio.Task[bool]"] = {}
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _slots
+    loop = asyncio.get_running_loop()
+    if _slots is None or _slots[0] is not loop:
+        _slots = (loop, asyncio.Semaphore(MEDIA_WORKERS))
+    return _slots[1]
+
+
+async def run_ffmpeg(args: list) -> bool:
+    """Run ffmpeg with a pool slot held. Returns True on exit code 0."""
+    if shutil.which('ffmpeg') is None:
+        print("🚨 CRITICAL: FFMPEG NOT INSTALLED IN CONTAINER")
+        return False
+
+    async with _semaphore():
+        proc = await asyncio.create_subprocess_exec(
+            'ffmpeg', *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), FFMPEG_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            print(f"[MediaJobs] ffmpeg timed out after {FFMPEG_TIMEOUT_SECONDS}s")
+            return False
+
+    if proc.returncode != 0:
+        print(f"[MediaJobs] ffmpeg failed ({proc.returncode}): {stderr.decode(errors='ignore')[-300:]}")
+        return False
+    return True
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run CPU-bound media work (e.g. image downscaling) on the pool"""
+    async with _semaphore():
+        return await asyncio.get_running_loop().run_in_executor(_executor, partial(fn, *args))
+
+
+async def transcode_webm_audio(source: Path, target: Path) -> bool:
+    """
+    WebM -> MP4 (AAC), which WhatsApp accepts everywhere. ffmpeg writes a
+    `.part.mp4` next to the target, which is renamed into place only on
+    success, so the media endpoint never serves (and caches) a partial file.
+    """
+    partial_path = target.with_suffix('.part.mp4')
+    ok = False
+    try:
+        ok = await run_ffmpeg(['-i', str(source), '-vn', '-acodec', 'aac', '-y', str(partial_path)])
+        if ok and partial_path.exists():
+            os.replace(partial_path, target)
+        else:
+            ok = False
+    finally:
+        partial_path.unlink(missing_ok=True)
+    return ok
+
+
+def _finish(asset_id: str, ok: bool, directory: Path, session_factory: Callable[[], Session]) -> None:
+    db = session_factory()
+    try:
+        asset = db.get(MediaAsset, asset_id)
+        if asset is None:
+            return
+        if ok:
+            source = asset.source_filename
+            asset.status = "ready"
+            asset.size_bytes = (directory / asset.filename).stat().st_size
+            asset.source_filename = None
+            db.commit()
+            if source:
+                (directory / source).unlink(missing_ok=True)
+            from app.services.media_store import push_to_storage
+            push_to_storage(asset, directory)
+        else:
+            # Keep the original; the media endpoint serves it under the asset URL
+            asset.status = "failed"
+            asset.mimetype = "audio/webm"
+            db.commit()
+    finally:
+        db.close()
+
+
+async def _transcode_job(
+    asset_id: str, filename: str, source_filename: str,
+    directory: Path, session_factory: Callable[[], Session]
+) -> bool:
+    try:
+        ok = await transcode_webm_audio(directory / source_filename, directory / filename)
+    except Exception as e:
+        print(f"[MediaJobs] Transcode error for {filename}: {e}")
+        ok = False
+    await run_in_threadpool(_finish, asset_id, ok, directory, session_factory)
+    print(f"[MediaJobs] {source_filename} -> {filename}: {'ready' if ok else 'failed'}")
+    return ok
+
+
+def submit_transcode(
+    asset: MediaAsset, directory: Path, session_factory: Callable[[], Session] = SessionLocal
+) -> "asyncio.Task[bool]":
+    """Schedule the asset's conversion (once) on the running loop"""
+    filename = asset.filename
+    existing = _jobs.get(filename)
+    if existing and not existing.done():
+        return existing
+
+    task = asyncio.get_running_loop().create_task(
+        _transcode_job(asset.id, filename, asset.source_filename, directory, session_factory)
+    )
+    _jobs[filename] = task
+
+    def _forget(done: "asyncio.Task[bool]") -> None:
+        if _jobs.get(filename) is done:
+            _jobs.pop(filename, None)
+
+    task.add_done_callback(_forget)
+    return task
+
+
+def is_transcoding(filename: str) -> bool:
+    """A conversion producing this asset filename is queued or running in this process"""
+    task = _jobs.get(filename)
+    return task is not None and not task.done()
+
+
+async def wait_for_asset(filename: str, timeout: float) -> Optional[bool]:
+    """Wait for an in-flight conversion. None if there is none or it took too long."""
+    task = _jobs.get(filename)
+    if task is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        return None
+
+
+def resume_pending_transcodes(directory: Path, session_factory: Callable[[], Session] = SessionLocal) -> int:
+    """Re-queue conversions interrupted by a restart (call from the running loop)"""
+    db = session_factory()
+    try:
+        resumed = 0
+        for asset in db.query(MediaAsset).filter(MediaAsset.status == "processing").all():
+            if asset.source_filename and (directory / asset.source_filename).exists():
+                submit_transcode(asset, directory, session_factory)
+                resumed += 1
+            else:
+                asset.status = "failed"
+        db.commit()
+        return resumed
+    finally:
+        db.close()
@@ -0,0 +1,265 @@
+"""
+Media retention sweeper.
+
+Nothing used to delete media: abandoned uploads, WebM originals left behind
+by failed conversions and one-off campaign files piled up forever. The
+sweeper runs on the scheduler and removes media that nothing points at:
+
+  - references are `Message.media_url` and `InventoryItem.primary_image_url`
+    (own /files/media/ URLs, including variant URLs)
+  - media_assets rows (with their files, storage objects and cached variants)
+    unreferenced and not uploaded again for MEDIA_RETENTION_GRACE_HOURS
+  - loose files in MEDIA_DIR and objects in remote storage that no asset
+    owns (legacy uuid uploads, leftovers) past the same grace period
+  - temp files of interrupted uploads after an hour
+
+For users over their quota (media_store.MEDIA_QUOTA_BYTES) unreferenced
+assets are reclaimed without waiting out the grace period.
+
+Deletes go in batches of MEDIA_SWEEP_BATCH with a pause in between, so a
+large backlog doesn't hammer the disk or the bucket. Each run returns (and
+keeps in `last_sweep_report`) how many files and bytes were reclaimed.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models import InventoryItem, MediaAsset, MediaUpload, Message
+from app.services import media_store
+from app.services.media_jobs import is_transcoding
+from app.services.storage import get_storage
+
+MEDIA_RETENTION_GRACE_HOURS = int(os.getenv("MEDIA_RETENTION_GRACE_HOURS", "72"))
+MEDIA_SWEEP_INTERVAL_HOURS = int(os.getenv("MEDIA_SWEEP_INTERVAL_HOURS", "6"))
+MEDIA_SWEEP_BATCH = int(os.getenv("MEDIA_SWEEP_BATCH", "200"))
+MEDIA_SWEEP_PAUSE_SECONDS = float(os.getenv("MEDIA_SWEEP_PAUSE_SECONDS", "1.0"))
+
+# Over-quota users: unreferenced assets younger than this are still kept
+QUOTA_MIN_AGE = timedelta(hours=1)
+TEMP_FILE_MAX_AGE = timedelta(hours=1)
+
+MEDIA_PATH_MARKER = "/files/media/"
+
+last_sweep_report: Optional[Dict[str, Any]] = None
+
+
+def media_filename_from_url(url: Optional[str]) -> Optional[str]:
+    """Stored filename behind one of our media URLs (variant URLs map to their source)"""
+    if not url or MEDIA_PATH_MARKER not in url:
+        return None
+    name = url.split(MEDIA_PATH_MARKER, 1)[1].split("?", 1)[0].split("#", 1)[0]
+    return name.rsplit("/", 1)[-1] or None
+
+
+def referenced_filenames(db: Session) -> Set[str]:
+    referenced = set()
+    for column in (Message.media_url, InventoryItem.primary_image_url):
+        rows = db.query(column).filter(column.like(f"%{MEDIA_PATH_MARKER}%")).distinct()
+        for (url,) in rows:
+            name = media_filename_from_url(url)
+            if name:
+                referenced.add(name)
+    return referenced
+
+
+def _referenced_among(db: Session, names: Set[str]) -> Set[str]:
+    """Which of these filenames messages or inventory point to right now"""
+    if not names:
+        return set()
+    found = set()
+    for column in (Message.media_url, InventoryItem.primary_image_url):
+        matches = or_(*(column.like(f"%{MEDIA_PATH_MARKER}{name}%") for name in names))
+        for (url,) in db.query(column).filter(matches).distinct():
+            name = media_filename_from_url(url)
+            if name in names:
+                found.add(name)
+    return found
+
+
+def _as_naive(value: Optional[datetime]) -> Optional[datetime]:
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+
+def _over_quota_users(db: Session) -> Set[str]:
+    if not media_store.MEDIA_QUOTA_BYTES:
+        return set()
+    users = [row[0] for row in db.query(MediaUpload.user_id).distinct()]
+    return {u for u in users if media_store.user_storage_bytes(db, u) > media_store.MEDIA_QUOTA_BYTES}
+
+
+def _batches(items: List[Any]) -> Iterable[List[Any]]:
+    for i in range(0, len(items), MEDIA_SWEEP_BATCH):
+        if i:
+            time.sleep(MEDIA_SWEEP_PAUSE_SECONDS)
+        yield items[i:i + MEDIA_SWEEP_BATCH]
+
+
+def _remove_local(path: Path) -> int:
+    try:
+        size = path.stat().st_size
+        path.unlink()
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _remove_variants(stem: str) -> int:
+    from app.services.image_variants import VARIANTS_DIR
+    if not VARIANTS_DIR.exists():
+        return 0
+    return sum(_remove_local(p) for p in VARIANTS_DIR.glob(f"{stem}.*.jpg"))
+
+
+def sweep_media(
+    directory: Optional[Path] = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """One retention pass. Returns the reclaimed-bytes report."""
+    global last_sweep_report
+    directory = directory or media_store.MEDIA_DIR
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(hours=MEDIA_RETENTION_GRACE_HOURS)
+    storage = get_storage()
+    started = time.monotonic()
+    report = {
+        "assets_deleted": 0, "orphan_files_deleted": 0, "temp_files_deleted": 0,
+        "storage_objects_deleted": 0, "bytes_reclaimed": 0, "over_quota_users": 0,
+        "dry_run": dry_run,
+    }
+
+    db = session_factory()
+    try:
+        referenced = referenced_filenames(db)
+        over_quota = _over_quota_users(db)
+        report["over_quota_users"] = len(over_quota)
+
+        # 1. Unreferenced assets
+        quota_owned = set()
+        if over_quota:
+            quota_owned = {
+                row[0] for row in db.query(MediaUpload.asset_id)
+                .filter(MediaUpload.user_id.in_(over_quota)).distinct()
+            }
+            # Assets are deduplicated across tenants: one also uploaded by a user
+            # within quota is theirs too (message references are skipped below anyway)
+            quota_owned -= {
+                row[0] for row in db.query(MediaUpload.asset_id)
+                .filter(MediaUpload.asset_id.in_(quota_owned), MediaUpload.user_id.notin_(over_quota)).distinct()
+            }
+
+        def deletable(asset: MediaAsset, referenced: Set[str]) -> bool:
+            if asset.status == "processing" or is_transcoding(asset.filename):
+                return False
+            if asset.filename in referenced or (asset.source_filename and asset.source_filename in referenced):
+                return False
+            last_used = _as_naive(asset.last_uploaded_at) or _as_naive(asset.created_at) or now
+            return last_used < cutoff or (asset.id in quota_owned and last_used < now - QUOTA_MIN_AGE)
+
+        candidates = [
+            asset.id for asset in db.query(MediaAsset).filter(MediaAsset.status != "processing").all()
+            if deletable(asset, referenced)
+        ]
+
+        for batch in _batches(candidates):
+            # Batches are minutes apart: re-read the assets and their references, so
+            # a dedupe hit or a message sent since the scan keeps its file
+            assets = db.query(MediaAsset).filter(MediaAsset.id.in_(batch)).populate_existing().all()
+            names = {n for asset in assets for n in (asset.filename, asset.source_filename) if n}
+            referenced_now = _referenced_among(db, names)
+            for asset in assets:
+                if not deletable(asset, referenced_now):
+                    continue
+                names = [n for n in (asset.filename, asset.source_filename) if n]
+                stem, size = Path(asset.filename).stem, asset.size_bytes or 0
+                freed = 0
+                if not dry_run:
+                    # Row first, and only if no upload touched it since it was read
+                    deleted = db.query(MediaAsset).filter(
+                        MediaAsset.id == asset.id,
+                        MediaAsset.last_uploaded_at == asset.last_uploaded_at
+                        if asset.last_uploaded_at is not None else MediaAsset.last_uploaded_at.is_(None)
+                    ).delete(synchronize_session=False)
+                    if not deleted:
+                        db.rollback()
+                        continue
+                    db.query(MediaUpload).filter(MediaUpload.asset_id == asset.id).delete(synchronize_session=False)
+                    db.commit()
+                    for name in names:
+                        freed += _remove_local(directory / name)
+                        if storage.is_remote:
+                            try:
+                                info = storage.stat(name)
+                                storage.delete(name)
+                                freed += info.size if info else 0
+                            except Exception as e:
+                                print(f"[MediaSweep] Storage delete failed for {name}: {e}")
+                    freed += _remove_variants(stem)
+                report["assets_deleted"] += 1
+                report["bytes_reclaimed"] += size if dry_run else freed
+
+        # 2. Loose files no asset owns, and stale temp files
+        owned = set()
+        for filename, source in db.query(MediaAsset.filename, MediaAsset.source_filename):
+            owned.add(filename)
+            if source:
+                owned.add(source)
+        keep = owned | referenced
+
+        orphans = []
+        if directory.exists():
+            for path in directory.iterdir():
+                if path.is_file() and path.name not in keep:
+                    if datetime.utcfromtimestamp(path.stat().st_mtime) < cutoff:
+                        orphans.append(path)
+        temp_dir = directory / ".tmp"
+        temps = []
+        if temp_dir.exists():
+            temps = [
+                p for p in temp_dir.iterdir()
+                if p.is_file() and datetime.utcfromtimestamp(p.stat().st_mtime) < now - TEMP_FILE_MAX_AGE
+            ]
+
+        for batch in _batches(orphans):
+            for path in batch:
+                report["bytes_reclaimed"] += path.stat().st_size if dry_run else _remove_local(path)
+                report["orphan_files_deleted"] += 1
+        for path in temps:
+            report["bytes_reclaimed"] += path.stat().st_size if dry_run else _remove_local(path)
+            report["temp_files_deleted"] += 1
+
+        # 3. Remote objects no asset owns
+        if storage.is_remote:
+            stale = [
+                obj for obj in storage.list_objects()
+                if obj.key not in keep and obj.last_modified is not None and _as_naive(obj.last_modified) < cutoff
+            ]
+            for batch in _batches(stale):
+                for obj in batch:
+                    if not dry_run:
+                        storage.delete(obj.key)
+                    report["storage_objects_deleted"] += 1
+                    report["bytes_reclaimed"] += obj.size or 0
+    finally:
+        db.close()
+
+    report["seconds"] = round(time.monotonic() - started, 2)
+    report["finished_at"] = now.isoformat()
+    last_sweep_report = report
+    print(f"[MediaSweep] {report}")
+    return report
+
+
+def run_media_sweep() -> None:
+    """Scheduler entry point (module-level so the SQLAlchemy job store can reference it)"""
+    try:
+        sweep_media()
+    except Exception as e:
+        print(f"[MediaSweep] Sweep failed: {e}")
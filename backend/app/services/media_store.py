@@ -0,0 +1,276 @@
+"""
+Content-addressed media storage.
+
+Uploads are hashed (SHA-256) while they stream to a temp file and then stored
+as `<hmac(sha256)>.<ext>`: public URLs can't be derived from known content (nor
+confirm that someone uploaded it); the plain hash stays in the database for
+dedupe. A `media_assets` row exists per distinct content, so a
+re-upload of the same brochure or car photo drops the temp file and returns
+the existing URL. Every request is logged in `media_uploads`, which is what
+the storage / dedupe hit-rate report is built from.
+
+WebM voice notes are transcoded to MP4 once, in the background (see
+media_jobs.py); the asset keeps the hash of the original bytes, so re-sending
+the same recording skips ffmpeg entirely.
+"""
+import hashlib
+import hmac
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import UploadFile
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.db.session import SessionLocal
+from app.db.upsert import dialect_insert
+from app.models import MediaAsset, MediaUpload, get_uuid
+from app.services.media_jobs import submit_transcode
+from app.services.storage import get_storage
+
+MEDIA_DIR = Path(os.getenv("MEDIA_DIR", "uploads/media"))
+
+# Bytes read from the upload per hash + write step
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Per-user media quota: distinct stored bytes a user uploaded (0 disables)
+MEDIA_QUOTA_BYTES = int(os.getenv("MEDIA_QUOTA_MB", "2048")) * 1024 * 1024
+
+# Keys the stored file names; changing it only affects files stored afterwards
+MEDIA_NAME_SECRET = os.getenv("MEDIA_NAME_SECRET") or os.getenv("SECRET_KEY", "supersecretkey")
+
+
+class MediaQuotaExceeded(Exception):
+    def __init__(self, used: int, incoming: int, quota: int):
+        super().__init__(f"Media quota exceeded: {used + incoming} of {quota} bytes")
+        self.used, self.incoming, self.quota = used, incoming, quota
+
+
+def public_media_url(filename: str) -> str:
+    base_url = os.getenv("BACKEND_PUBLIC_URL", "https://auto-ai-production-b99a.up.railway.app")
+    return f"{base_url}/files/media/{filename}"
+
+
+def _extension(filename: Optional[str]) -> str:
+    ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else 'bin'
+    ext = ''.join(ch for ch in ext if ch.isalnum())[:8]
+    return ext or 'bin'
+
+
+def _write_chunk(out, hasher, chunk: bytes) -> None:
+    hasher.update(chunk)
+    out.write(chunk)
+
+
+async def spool_and_hash(upload: UploadFile, directory: Path) -> Tuple[Path, str, int]:
+    """Stream an upload to a temp file, hashing as it goes. Returns (path, sha256, size)."""
+    tmp_dir = directory / ".tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = tmp_dir / f"{uuid.uuid4()}.part"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                await run_in_threadpool(_write_chunk, out, hasher, chunk)
+                size += len(chunk)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path, hasher.hexdigest(), size
+
+
+def _find_asset(db: Session, sha256: str) -> Optional[MediaAsset]:
+    return db.query(MediaAsset).filter(MediaAsset.sha256 == sha256).first()
+
+
+def stored_name(sha256: str) -> str:
+    """File name stem for content with this hash"""
+    return hmac.new(MEDIA_NAME_SECRET.encode(), sha256.encode(), hashlib.sha256).hexdigest()
+
+
+def _materialize(tmp_path: Path, sha256: str, ext: str, content_type: str, directory: Path) -> Dict[str, Any]:
+    """Move the temp file to its content-addressed name. Returns the asset's file columns."""
+    stem = stored_name(sha256)
+    if content_type == 'audio/webm':
+        # Public name is the MP4 the background job will produce
+        source = f"{stem}.webm"
+        os.replace(tmp_path, directory / source)
+        return {"filename": f"{stem}.mp4", "mimetype": "audio/mp4", "status": "processing",
+                "source_filename": source, "size_bytes": (directory / source).stat().st_size}
+
+    filename = f"{stem}.{ext}"
+    # Same hash means same bytes, so replacing a concurrent writer's file is harmless
+    os.replace(tmp_path, directory / filename)
+    return {"filename": filename, "mimetype": content_type, "status": "ready",
+            "source_filename": None, "size_bytes": (directory / filename).stat().st_size}
+
+
+def asset_available(asset: MediaAsset, directory: Path) -> bool:
+    """The asset can be served: converted file, or the original while/if conversion didn't finish"""
+    if (directory / asset.filename).exists():
+        return True
+    if asset.source_filename and (directory / asset.source_filename).exists():
+        return True
+    storage = get_storage()
+    return storage.is_remote and asset.status == "ready" and storage.exists(asset.filename)
+
+
+def uploads_by_user(db: Session, user_id: str, asset_id: str) -> int:
+    """How often a user uploaded an asset; dedupe against other tenants is not reported to them"""
+    return db.query(func.count(MediaUpload.id)).filter(
+        MediaUpload.user_id == str(user_id), MediaUpload.asset_id == asset_id
+    ).scalar() or 0
+
+
+def user_storage_bytes(db: Session, user_id: str) -> int:
+    """Bytes of the distinct assets a user has uploaded (shared assets count for each uploader)"""
+    asset_ids = db.query(MediaUpload.asset_id).filter(MediaUpload.user_id == str(user_id)).distinct()
+    total = db.query(func.coalesce(func.sum(MediaAsset.size_bytes), 0)).filter(MediaAsset.id.in_(asset_ids)).scalar()
+    return int(total or 0)
+
+
+def push_to_storage(asset: MediaAsset, directory: Path) -> None:
+    """Copy a finished asset to the durable backend (no-op for local storage)"""
+    storage = get_storage()
+    if not storage.is_remote:
+        return  # MEDIA_DIR is the local backend's root
+    try:
+        storage.save_file(asset.filename, directory / asset.filename, asset.mimetype)
+    except Exception as e:
+        # The local copy still serves; the sweeper/next upload retries
+        print(f"[MediaStore] Storage upload failed for {asset.filename}: {e}")
+
+
+async def store_upload(
+    db: Session,
+    user_id: str,
+    upload: UploadFile,
+    content_type: str,
+    media_type: str,
+    directory: Optional[Path] = None,
+    session_factory: Callable[[], Session] = SessionLocal
+) -> Tuple[MediaAsset, bool]:
+    """
+    Store an upload by content hash. Returns (asset, deduplicated); when
+    deduplicated is True no new bytes were kept on disk. Assets that need
+    conversion come back in status "processing" with the job already queued.
+    Raises MediaQuotaExceeded if new bytes would put the user over quota
+    (dedupe hits are always accepted).
+    """
+    directory = directory or MEDIA_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path, sha256, size = await spool_and_hash(upload, directory)
+
+    try:
+        asset = _find_asset(db, sha256)
+        deduplicated = bool(asset and await run_in_threadpool(asset_available, asset, directory))
+
+        if not deduplicated and MEDIA_QUOTA_BYTES:
+            used = user_storage_bytes(db, user_id)
+            if used + size > MEDIA_QUOTA_BYTES:
+                raise MediaQuotaExceeded(used, size, MEDIA_QUOTA_BYTES)
+
+        if deduplicated:
+            tmp_path.unlink(missing_ok=True)
+            asset.upload_count = (asset.upload_count or 0) + 1
+            asset.last_uploaded_at = datetime.utcnow()
+        else:
+            columns = await run_in_threadpool(
+                _materialize, tmp_path, sha256, _extension(upload.filename), content_type, directory
+            )
+            if asset:
+                # Row survived but the file was removed: re-materialize in place
+                for key, value in columns.items():
+                    setattr(asset, key, value)
+                asset.upload_count = (asset.upload_count or 0) + 1
+                asset.last_uploaded_at = datetime.utcnow()
+            else:
+                db.execute(dialect_insert(db, MediaAsset.__table__).values(
+                    id=get_uuid(), sha256=sha256, media_type=media_type, upload_count=1,
+                    created_at=datetime.utcnow(), last_uploaded_at=datetime.utcnow(), **columns
+                ).on_conflict_do_nothing(index_elements=["sha256"]))
+                asset = _find_asset(db, sha256)
+
+        db.add(MediaUpload(
+            user_id=str(user_id),
+            asset_id=asset.id,
+            original_filename=upload.filename,
+            size_bytes=size,
+            deduplicated=deduplicated
+        ))
+        db.commit()
+        db.refresh(asset)
+    except Exception:
+        db.rollback()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if asset.status == "processing":
+        submit_transcode(asset, directory, session_factory)
+    elif not deduplicated:
+        await run_in_threadpool(push_to_storage, asset, directory)
+
+    print(f"[MediaStore] {'dedupe hit' if deduplicated else 'stored'} {asset.filename} ({size} bytes) for user {user_id}")
+    return asset, deduplicated
+
+
+def get_media_stats(db: Session, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Disk usage of distinct assets plus upload / dedupe counters. With user_id
+    everything is limited to that user's own uploads: a dedupe hit is a
+    re-upload of content they already sent, never a match with another tenant.
+    """
+    if user_id:
+        return _user_media_stats(db, str(user_id))
+
+    stored = db.query(
+        func.count(MediaAsset.id), func.coalesce(func.sum(MediaAsset.size_bytes), 0)
+    ).one()
+
+    uploads = db.query(MediaUpload)
+    is_hit = MediaUpload.deduplicated.is_(True)
+    total, hits, uploaded_bytes, saved_bytes = uploads.with_entities(
+        func.count(MediaUpload.id),
+        func.coalesce(func.sum(case((is_hit, 1), else_=0)), 0),
+        func.coalesce(func.sum(MediaUpload.size_bytes), 0),
+        func.coalesce(func.sum(case((is_hit, MediaUpload.size_bytes), else_=0)), 0),
+    ).one()
+
+    return {
+        "assets": stored[0],
+        "stored_bytes": int(stored[1]),
+        "uploads": total,
+        "dedupe_hits": int(hits),
+        "dedupe_hit_rate": round(hits / total, 4) if total else 0.0,
+        "uploaded_bytes": int(uploaded_bytes),
+        "bytes_saved": int(saved_bytes),
+    }
+
+
+def _user_media_stats(db: Session, user_id: str) -> Dict[str, Any]:
+    mine = db.query(MediaUpload).filter(MediaUpload.user_id == user_id)
+    total, assets, uploaded_bytes = mine.with_entities(
+        func.count(MediaUpload.id),
+        func.count(func.distinct(MediaUpload.asset_id)),
+        func.coalesce(func.sum(MediaUpload.size_bytes), 0),
+    ).one()
+    stored_bytes = user_storage_bytes(db, user_id)
+    hits = total - assets
+
+    return {
+        "assets": assets,
+        "stored_bytes": stored_bytes,
+        "uploads": total,
+        "dedupe_hits": hits,
+        "dedupe_hit_rate": round(hits / total, 4) if total else 0.0,
+        "uploaded_bytes": int(uploaded_bytes),
+        "bytes_saved": max(int(uploaded_bytes) - stored_bytes, 0),
+    }
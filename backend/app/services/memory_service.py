@@ -2,12 +2,11 @@
 MemoryService - Manages persistent memory for each client.
 Used by Ray to remember everything about each client.
 """
-import os
 import json
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from sqlalchemy.orm import Session
-from openai import OpenAI
+from app.services.llm_client import add_usage, chat_completion, llm_available
 
 from app.models import ClientMemory
 
@@ -295,16 +294,16 @@ class MemoryService:
     @staticmethod
     def extract_insights_from_message(
         message: str, 
-        existing_memory: Dict[str, Any] = None
+        existing_memory: Dict[str, Any] = None,
+        usage: Dict[str, int] = None
     ) -> Dict[str, Any]:
         """
         Use GPT to extract insights from a message and return updates for memory.
+        Token usage is added to `usage` if given.
         """
-        if not os.getenv("OPENAI_API_KEY"):
+        if not llm_available():
             return {}
         
-        client = OpenAI()
-        
         existing_context = ""
         if existing_memory:
             existing_context = f"""
@@ -341,7 +340,7 @@ Extrae SOLO lo que esté claramente mencionado (no asumas). Responde en JSON con
 """
         
         try:
-            completion = client.chat.completions.create(
+            completion = chat_completion(
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "Extraes información de mensajes de clientes. Solo reportas lo explícitamente mencionado."},
@@ -351,6 +350,7 @@ Extrae SOLO lo que esté claramente mencionado (no asumas). Responde en JSON con
                 max_tokens=300,
                 temperature=0
             )
+            add_usage(usage, completion)
             
             return json.loads(completion.choices[0].message.content)
             
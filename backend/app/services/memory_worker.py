@@ -0,0 +1,127 @@
+"""
+Background client-memory updates.
+
+Insight extraction is a separate LLM call, and the buyer used to wait for it
+(plus the relationship-score recompute) before the reply went out. The agent
+now submits the update here and returns right away.
+
+Ordering: jobs are striped by client over single-thread executors, so the
+updates for one client run one at a time and in arrival order. The agent
+calls `wait_for_client` before reading memory for the next turn, so a reply
+never works from memory that is missing the previous message's insights.
+"""
+import os
+import threading
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+
+# Set MEMORY_ASYNC=0 to run updates inline (old behaviour, for comparison)
+MEMORY_ASYNC = os.getenv("MEMORY_ASYNC", "1") != "0"
+
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "4"))
+
+# How long the next turn waits for the previous update before reading memory anyway
+MEMORY_WAIT_SECONDS = float(os.getenv("MEMORY_WAIT_SECONDS", "10"))
+
+_stripes: List[ThreadPoolExecutor] = [
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"memory-{i}") for i in range(MEMORY_WORKERS)
+]
+_pending: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def _stripe(client_id: str) -> ThreadPoolExecutor:
+    return _stripes[zlib.crc32(str(client_id).encode()) % len(_stripes)]
+
+
+def apply_memory_update(
+    client_id: str,
+    buyer_message: str,
+    session_factory: Callable[[], Session] = SessionLocal,
+    insights: Optional[dict] = None,
+    metric_id: Optional[str] = None
+) -> None:
+    """
+    Extract insights from the buyer's message (unless given, e.g. by the
+    unified agent turn), apply them and refresh the relationship score.
+    Uses its own session; extraction cost is charged to the turn's metric.
+    """
+    from app.services.memory_service import MemoryService
+    from app.services.agent_metrics import add_memory_usage, new_usage
+
+    db = session_factory()
+    try:
+        memory = MemoryService.get_memory(db, client_id)
+        if memory is None:
+            return
+
+        if insights is None:
+            existing_memory = {
+                "vehicles_interested": memory.vehicles_interested,
+                "preferred_budget_monthly": memory.preferred_budget_monthly,
+                "objections": memory.objections
+            }
+            usage = new_usage()
+            insights = MemoryService.extract_insights_from_message(buyer_message, existing_memory, usage)
+            add_memory_usage(db, metric_id, usage)
+
+        if insights:
+            MemoryService.update_memory_from_insights(db, client_id, insights)
+            db.refresh(memory)
+
+        new_score = MemoryService.calculate_relationship_score(memory)
+        if memory.relationship_score != new_score:
+            memory.relationship_score = new_score
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[MemoryWorker] Error updating memory for client {client_id}: {e}")
+    finally:
+        db.close()
+
+
+def submit_memory_update(
+    client_id: str,
+    buyer_message: str,
+    session_factory: Callable[[], Session] = SessionLocal,
+    insights: Optional[dict] = None,
+    metric_id: Optional[str] = None
+) -> Future:
+    """Queue the update behind any earlier ones for the same client"""
+    return submit_for_client(
+        client_id, apply_memory_update, client_id, buyer_message, session_factory, insights, metric_id
+    )
+
+
+def submit_for_client(client_id: str, fn: Callable[..., Any], *args: Any) -> Future:
+    """Run `fn(*args)` on the client's stripe, after everything already queued for them"""
+    future = _stripe(client_id).submit(fn, *args)
+    with _pending_lock:
+        _pending[client_id] = future
+
+    def _forget(done: Future) -> None:
+        with _pending_lock:
+            if _pending.get(client_id) is done:
+                _pending.pop(client_id, None)
+
+    future.add_done_callback(_forget)
+    return future
+
+
+def wait_for_client(client_id: str, timeout: float = None) -> bool:
+    """Block until queued updates for the client are applied. False on timeout."""
+    with _pending_lock:
+        future = _pending.get(client_id)
+    if future is None:
+        return True
+    try:
+        future.result(timeout=MEMORY_WAIT_SECONDS if timeout is None else timeout)
+        return True
+    except FutureTimeout:
+        print(f"[MemoryWorker] Memory for client {client_id} still updating, continuing without it")
+        return False
@@ -0,0 +1,165 @@
+"""
+Message rollups - incrementally maintained daily counters per user.
+
+Every message write path (inbound webhook, outbound saves, AI replies, bulk
+sends) records into `message_daily_stats` with a single upsert per batch.
+Analytics read these rows instead of aggregating raw `messages`.
+Bulk sends store no message rows, so their share of each counter is also
+kept in `bulk_count`, which `rebuild_daily_stats` carries over.
+"""
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.db.upsert import dialect_insert
+from app.models import Message, MessageDailyStat, get_uuid
+from app.utils.cache import invalidate_dashboard
+
+CHANNEL_WHATSAPP = "whatsapp"
+
+# Bulk sends flush their counters every N delivered messages
+BULK_FLUSH_EVERY = 50
+
+StatKey = Tuple[str, date, str, str, bool]
+
+
+def stat_key(
+    user_id: str,
+    direction: str,
+    sent_at: Optional[datetime] = None,
+    ai_generated: bool = False,
+    channel: str = CHANNEL_WHATSAPP
+) -> StatKey:
+    """Build the rollup key (user, day, direction, channel, ai_generated)"""
+    day = (sent_at or datetime.utcnow()).date()
+    return (str(user_id), day, direction, channel, bool(ai_generated))
+
+
+def record_counts(db: Session, counts: Dict[StatKey, int], commit: bool = True, bulk: bool = False) -> None:
+    """Upsert a batch of aggregated increments in one statement (`bulk`: no message rows behind them)"""
+    if not counts:
+        return
+
+    rows = [
+        {
+            "id": get_uuid(),
+            "user_id": user_id,
+            "day": day,
+            "direction": direction,
+            "channel": channel,
+            "ai_generated": ai_generated,
+            "count": n,
+            "bulk_count": n if bulk else 0
+        }
+        for (user_id, day, direction, channel, ai_generated), n in counts.items()
+    ]
+
+    table = MessageDailyStat.__table__
+    stmt = dialect_insert(db, table)
+    increments = {"count": table.c.count + stmt.excluded.count}
+    if bulk:
+        increments["bulk_count"] = table.c.bulk_count + stmt.excluded.bulk_count
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "direction", "channel", "ai_generated"],
+        set_=increments
+    )
+    db.execute(stmt, rows)
+
+    if commit:
+        db.commit()
+
+
+def record_message(
+    db: Session,
+    user_id: str,
+    direction: str,
+    sent_at: Optional[datetime] = None,
+    ai_generated: bool = False,
+    channel: str = CHANNEL_WHATSAPP,
+    commit: bool = True
+) -> None:
+    """Record a single message. Pass commit=False to join the caller's transaction."""
+    record_counts(db, {stat_key(user_id, direction, sent_at, ai_generated, channel): 1}, commit=commit)
+
+
+class StatsBatch:
+    """
+    Accumulates increments in memory and flushes them as one upsert.
+    Used by bulk sends so a 5k-recipient campaign costs ~100 upserts, not 5k.
+    """
+
+    def __init__(self, db: Session, flush_every: int = BULK_FLUSH_EVERY):
+        self.db = db
+        self.flush_every = flush_every
+        self.pending: Counter = Counter()
+        self._since_flush = 0
+
+    def add(self, user_id: str, direction: str, ai_generated: bool = False, channel: str = CHANNEL_WHATSAPP):
+        self.pending[stat_key(user_id, direction, None, ai_generated, channel)] += 1
+        self._since_flush += 1
+        if self._since_flush >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write pending counters. Errors are logged, never raised into the send loop."""
+        if self.pending:
+            try:
+                record_counts(self.db, dict(self.pending), bulk=True)
+                for user_id in {key[0] for key in self.pending}:
+                    invalidate_dashboard(user_id)
+            except Exception as e:
+                print(f"[MessageStats] Error flushing rollup batch: {e}")
+                self.db.rollback()
+        self.pending.clear()
+        self._since_flush = 0
+
+
+def rebuild_daily_stats(db: Session, user_id: Optional[str] = None) -> int:
+    """
+    Recompute rollups from the raw `messages` history (one grouped scan).
+    Each row is reset to its bulk-send share (`bulk_count`, no message rows
+    behind it) and the message-derived counts are upserted on top.
+    Returns number of message-derived rollup rows written.
+    """
+    ai_flag = func.coalesce(Message.ai_generated, False)
+    query = db.query(
+        Message.user_id,
+        func.date(Message.sent_at).label("day"),
+        Message.direction,
+        ai_flag.label("ai_generated"),
+        func.count(Message.id).label("count")
+    ).filter(Message.sent_at.isnot(None))
+    if user_id:
+        query = query.filter(Message.user_id == user_id)
+    grouped = query.group_by(Message.user_id, func.date(Message.sent_at), Message.direction, ai_flag).all()
+
+    existing = db.query(MessageDailyStat)
+    if user_id:
+        existing = existing.filter(MessageDailyStat.user_id == user_id)
+    existing.filter(MessageDailyStat.bulk_count == 0).delete(synchronize_session=False)
+    existing.update({MessageDailyStat.count: MessageDailyStat.bulk_count}, synchronize_session=False)
+
+    counts: Dict[StatKey, int] = Counter()
+    for row in grouped:
+        # func.date returns a date on PostgreSQL and a string on SQLite
+        day = row.day if isinstance(row.day, date) else date.fromisoformat(str(row.day)[:10])
+        counts[(row.user_id, day, row.direction, CHANNEL_WHATSAPP, bool(row.ai_generated))] += row.count
+
+    record_counts(db, counts, commit=False)
+    db.commit()
+    return len(counts)
+
+
+def get_daily_totals(db: Session, user_id: str, since: date) -> List:
+    """Per-day sent/received totals from the rollup table"""
+    return db.query(
+        MessageDailyStat.day,
+        func.sum(case((MessageDailyStat.direction == "outbound", MessageDailyStat.count), else_=0)).label("sent"),
+        func.sum(case((MessageDailyStat.direction == "inbound", MessageDailyStat.count), else_=0)).label("received")
+    ).filter(
+        MessageDailyStat.user_id == user_id,
+        MessageDailyStat.day >= since
+    ).group_by(MessageDailyStat.day).all()
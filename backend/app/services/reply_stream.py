@@ -0,0 +1,266 @@
+"""
+Streamed delivery of RAY agent replies.
+
+Without streaming the buyer sees nothing until the last OpenAI call has
+finished, which for payment breakdowns is several seconds of silence. With
+AGENT_STREAM_REPLIES=1 the webhook hands the agent a `ReplyStream`:
+
+  - a "composing" presence (typing indicator) is sent as soon as the turn
+    starts, and "paused" once everything went out
+  - the answer is read from the completion stream; in unified mode only the
+    "reply" string of the JSON answer is taken (`JsonReplyExtractor`)
+  - `SentenceChunker` cuts it at sentence/paragraph boundaries and every
+    chunk goes out as its own WhatsApp message as soon as it is complete
+  - `finish` sends what is left, or the whole reply when nothing was
+    streamed (cached reply, non-JSON answer, error)
+
+The thread reading the stream holds an LLM concurrency slot, so it only
+queues chunks; a sender on a small pool delivers them one after the other
+(in order) and `finish` waits for it. `first_message_ms` is the time from
+the start of the turn to the first delivered chunk.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, List, Optional
+
+STREAM_REPLIES = os.getenv("AGENT_STREAM_REPLIES", "0") == "1"
+
+# The first chunk goes out at the first sentence end past FIRST_CHUNK_CHARS;
+# later ones gather at least CHUNK_CHARS so the buyer does not get a message per line
+FIRST_CHUNK_CHARS = int(os.getenv("STREAM_FIRST_CHUNK_CHARS", "40"))
+CHUNK_CHARS = int(os.getenv("STREAM_CHUNK_CHARS", "240"))
+MAX_CHUNK_CHARS = 700
+
+# Threads delivering chunks (one per turn being streamed at a time)
+STREAM_SEND_WORKERS = int(os.getenv("STREAM_SEND_WORKERS", "8"))
+
+_send_pool = ThreadPoolExecutor(max_workers=STREAM_SEND_WORKERS, thread_name_prefix="reply-send")
+
+# Sentence end (+ closing quotes/emoji) followed by whitespace, or a blank line.
+# "$389.50" or "1.9%" never match: the period has to be followed by a space.
+_SENTENCE_END = re.compile(r"[.!?…]+[)\"'»”]*(?:\s*[☀-➿\U0001F300-\U0001FAFF]+)?\s+")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+class SentenceChunker:
+    """Buffers streamed text and returns message-sized chunks cut at sentence ends"""
+
+    def __init__(self, first_chars: int = FIRST_CHUNK_CHARS, chars: int = CHUNK_CHARS, max_chars: int = MAX_CHUNK_CHARS):
+        self.first_chars = first_chars
+        self.chars = chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.emitted = 0
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        chunks = []
+        while True:
+            cut = self._cut()
+            if cut is None:
+                return chunks
+            chunk, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip()
+            if chunk:
+                chunks.append(chunk)
+                self.emitted += 1
+
+    def flush(self) -> Optional[str]:
+        chunk, self.buffer = self.buffer.strip(), ""
+        if chunk:
+            self.emitted += 1
+        return chunk or None
+
+    def _cut(self) -> Optional[int]:
+        minimum = self.first_chars if self.emitted == 0 else self.chars
+        paragraph = _PARAGRAPH_END.search(self.buffer)
+        if paragraph and self.buffer[:paragraph.start()].strip():
+            return paragraph.end()
+        for match in _SENTENCE_END.finditer(self.buffer):
+            if match.end() >= minimum:
+                return match.end()
+        if len(self.buffer) > self.max_chars:
+            space = self.buffer.rfind(" ", 0, self.max_chars)
+            return space if space > 0 else self.max_chars
+        return None
+
+
+class JsonReplyExtractor:
+    """
+    Pulls the value of "reply" out of a streamed unified-mode answer
+    ({"reply": "...", "memory": {...}}), decoding JSON escapes as it goes.
+    """
+
+    _START = re.compile(r'"reply"\s*:\s*"')
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self):
+        self._raw = ""
+        self._state = "seek"  # seek -> string -> done
+
+    def feed(self, delta: str) -> str:
+        if self._state == "done":
+            return ""
+        self._raw += delta
+        if self._state == "seek":
+            match = self._START.search(self._raw)
+            if not match:
+                return ""
+            self._raw = self._raw[match.end():]
+            self._state = "string"
+
+        out = []
+        raw, i = self._raw, 0
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self._state = "done"
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            if i + 1 >= len(raw):
+                break  # Escape split across deltas
+            if raw[i + 1] != "u":
+                out.append(self._ESCAPES.get(raw[i + 1], raw[i + 1]))
+                i += 2
+                continue
+            decoded, used = self._unicode_escape(raw, i)
+            if used == 0:
+                break
+            out.append(decoded)
+            i += used
+        self._raw = raw[i:] if self._state == "string" else ""
+        return "".join(out)
+
+    @staticmethod
+    def _unicode_escape(raw: str, i: int):
+        """(text, chars consumed) for a \\uXXXX escape at i, (_, 0) if incomplete"""
+        if i + 6 > len(raw):
+            return "", 0
+        try:
+            code = int(raw[i + 2:i + 6], 16)
+        except ValueError:
+            return raw[i:i + 6], 6
+        if 0xD800 <= code < 0xDC00:  # Emoji come as a surrogate pair
+            if i + 12 > len(raw):
+                return "", 0
+            try:
+                low = int(raw[i + 8:i + 12], 16)
+            except ValueError:
+                return raw[i:i + 6], 6
+            return chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)), 12
+        return chr(code), 6
+
+
+class ReplyStream:
+    """
+    Sends one agent turn to the buyer while it is generated.
+    `send(text)` delivers a WhatsApp message (called on a sender thread);
+    `presence(state)` sets "composing"/"paused" and may fail silently.
+    """
+
+    def __init__(self, send: Callable[[str], Any], presence: Optional[Callable[[str], Any]] = None):
+        self.send = send
+        self.presence = presence
+        self.started = time.perf_counter()
+        self.first_message_ms: Optional[float] = None
+        self.delivered: List[str] = []
+        self.failed = False
+        self._structured = False
+        self._chunker = SentenceChunker()
+        self._extractor: Optional[JsonReplyExtractor] = None
+        self._streamed = ""  # Reply text seen in the current round
+        self._queue: Deque[str] = deque()
+        self._queued = 0  # Chunks handed to the sender, delivered or not
+        self._lock = threading.Lock()
+        self._sending = False
+        self._sender: Optional[Future] = None
+
+    def begin(self, structured: bool = False) -> None:
+        """Start of the turn: typing indicator right away"""
+        self.started = time.perf_counter()
+        self._structured = structured
+        self._extractor = JsonReplyExtractor() if structured else None
+        self._set_presence("composing")
+
+    def next_round(self) -> None:
+        """A new completion follows tool calls; text of the previous one is complete"""
+        tail = self._chunker.flush()
+        if tail:
+            self._enqueue(tail)
+        self._streamed = ""
+        self._extractor = JsonReplyExtractor() if self._structured else None
+
+    def on_text(self, delta: str) -> None:
+        """Raw text delta from the completion stream"""
+        text = self._extractor.feed(delta) if self._extractor else delta
+        if not text:
+            return
+        self._streamed += text
+        for chunk in self._chunker.feed(text):
+            self._enqueue(chunk)
+
+    def finish(self, reply: str) -> List[str]:
+        """Send whatever of the final reply has not gone out yet. Returns all delivered chunks."""
+        if self._streamed.strip() and self._streamed.strip() == (reply or "").strip():
+            chunks = [self._chunker.flush()]
+        elif not self._queued:
+            # Nothing streamed (cached reply, non-JSON answer, error): same chunking, all at once
+            self._chunker = SentenceChunker()
+            chunks = self._chunker.feed(reply or "") + [self._chunker.flush()]
+        else:
+            # Stream broke off after some chunks went out: finish what was generated
+            chunks = [self._chunker.flush()]
+        for chunk in chunks:
+            if chunk:
+                self._enqueue(chunk)
+        if self._sender is not None:
+            self._sender.result()  # Last sender; nothing is queued after finish
+        self._set_presence("paused")
+        return self.delivered
+
+    def _enqueue(self, chunk: str) -> None:
+        with self._lock:
+            self._queue.append(chunk)
+            self._queued += 1
+            if self._sending:
+                return  # The running sender picks it up
+            self._sending = True
+        self._sender = _send_pool.submit(self._drain)
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue:
+                    self._sending = False
+                    return
+                chunk = self._queue.popleft()
+            self._deliver(chunk)
+
+    def _deliver(self, chunk: str) -> None:
+        if self.failed:
+            return
+        try:
+            self.send(chunk)
+        except Exception as e:
+            # Later chunks would arrive with a gap: stop here
+            print(f"[ReplyStream] Send failed after {len(self.delivered)} chunks: {e}")
+            self.failed = True
+            return
+        if self.first_message_ms is None:
+            self.first_message_ms = (time.perf_counter() - self.started) * 1000
+            print(f"[ReplyStream] First message after {self.first_message_ms:.0f} ms")
+        self.delivered.append(chunk)
+
+    def _set_presence(self, state: str) -> None:
+        if self.presence is None:
+            return
+        try:
+            self.presence(state)
+        except Exception as e:
+            print(f"[ReplyStream] Presence '{state}' failed: {e}")
@@ -0,0 +1,343 @@
+"""
+Semantic response cache for the RAY agent.
+
+Buyers keep asking the same things ("¿aceptan ITIN?", "¿cuánto sale el
+Corolla?", "¿dónde están?") and each one used to pay for a full tool loop.
+Replies are cached per user (dealer) under a scope made of the conversation
+stage and the memory slots that change the answer (vehicle, plan, credit
+tier, document), a fingerprint of the finance program data and a hash of
+the history the agent sees (packed messages + rolling summary). A reply that
+builds on one buyer's conversation is therefore only reused for a buyer with
+the same history: first messages, or replies to the same campaign message.
+Lookup order:
+
+  1. exact match on the normalized message (lowercase, no accents/punctuation)
+  2. cosine similarity over the scope's embeddings (NumPy matrix), accepted
+     at RESPONSE_CACHE_SIMILARITY or above
+
+The message is only embedded on the reply path when its scope already holds
+vectors to compare against; a stored reply gets its vector on a background
+thread, so a miss never waits for the embeddings API.
+
+Only self-contained replies are stored: no media, no tools other than the
+payment calculator, nothing with the client's name in it. Entries expire
+after RESPONSE_CACHE_TTL_SECONDS (payment answers no later than the end of
+the current finance program) and a user's entries are dropped whenever
+their inventory or clone configuration changes (`invalidate_user`).
+
+Hit rate and LLM calls/tokens saved are kept per user (`stats_for`).
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.services.calculator import TOYOTA_FINANCE_DATA, get_credit_tier_number
+from app.services.llm_client import embed_texts, llm_available
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(6 * 3600)))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.93"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "500"))  # Per user
+
+# Shorter messages ("si", "ok", "dale") only make sense with the history
+MIN_MESSAGE_CHARS = 8
+
+# Tools whose output may be reused; the rest have side effects or depend on the clock
+CACHEABLE_TOOLS = {"calculate_payment"}
+
+# Embeds stored replies off the reply path
+_embed_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-embed")
+
+
+def _finance_fingerprint() -> str:
+    return hashlib.sha1(json.dumps(TOYOTA_FINANCE_DATA, sort_keys=True).encode()).hexdigest()[:10]
+
+
+def _finance_program_end() -> Optional[float]:
+    """End of the current finance program as a timestamp, if it is still ahead"""
+    try:
+        end = datetime.strptime(TOYOTA_FINANCE_DATA["programPeriod"].split(" - ")[1].strip(), "%B %d, %Y")
+    except (KeyError, IndexError, ValueError):
+        return None
+    end_ts = end.replace(hour=23, minute=59).timestamp()
+    return end_ts if end_ts > time.time() else None
+
+
+FINANCE_VERSION = _finance_fingerprint()
+
+
+def normalize_message(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w$ ]+", " ", text)).strip()
+
+
+def history_fingerprint(history: Optional[List[Dict[str, Any]]], summary: Optional[str] = None) -> str:
+    """'new' for a first message, else a hash of what the model is shown of the conversation"""
+    if not history and not summary:
+        return "new"
+    turns = [[turn.get("role"), turn.get("text")] for turn in history or []]
+    return hashlib.sha1(json.dumps([turns, summary or ""], ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+def cache_scope(state: Dict[str, Any], memory: Any, history: Optional[List[Dict[str, Any]]] = None) -> str:
+    """Everything besides the message that decides what the right reply is"""
+    score = getattr(memory, "credit_score_mentioned", None) or state.get("credit_score")
+    try:
+        tier = get_credit_tier_number(int(score)) if score else ""
+    except (TypeError, ValueError):
+        tier = ""
+    return "|".join(str(part) for part in (
+        state.get("stage") or "INTAKE",
+        normalize_message(state.get("vehicle_interest") or ""),
+        getattr(memory, "preferred_plan", None) or "",
+        tier,
+        getattr(memory, "document_type", None) or "",
+        history_fingerprint(history, state.get("conversation_summary")),
+        FINANCE_VERSION,
+    ))
+
+
+class CachedReply:
+    __slots__ = ("normalized", "reply", "insights", "llm_calls", "tokens", "expires_at", "vector")
+
+    def __init__(self, normalized, reply, insights, llm_calls, tokens, expires_at, vector):
+        self.normalized = normalized
+        self.reply = reply
+        self.insights = insights
+        self.llm_calls = llm_calls
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.vector = vector
+
+
+class CacheLookup:
+    """Result of `lookup`; pass it back to `store` on a miss"""
+    __slots__ = ("user_id", "scope", "normalized", "entry", "kind", "similarity", "vector")
+
+    def __init__(self, user_id, scope, normalized):
+        self.user_id = user_id
+        self.scope = scope
+        self.normalized = normalized
+        self.entry: Optional[CachedReply] = None
+        self.kind: Optional[str] = None          # exact | semantic
+        self.similarity: float = 0.0
+        self.vector: Optional[np.ndarray] = None
+
+
+class _ScopeIndex:
+    """Entries of one (user, scope) with a lazily rebuilt embedding matrix"""
+
+    def __init__(self):
+        self.entries: Dict[str, CachedReply] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_entries: List[CachedReply] = []
+
+    def put(self, entry: CachedReply) -> None:
+        self.entries[entry.normalized] = entry
+        self._matrix = None
+
+    def drop_expired(self, now: float) -> None:
+        expired = [k for k, e in self.entries.items() if e.expires_at <= now]
+        for key in expired:
+            del self.entries[key]
+        if expired:
+            self._matrix = None
+
+    def nearest(self, vector: np.ndarray):
+        if self._matrix is None:
+            self._matrix_entries = [e for e in self.entries.values() if e.vector is not None]
+            self._matrix = np.vstack([e.vector for e in self._matrix_entries]) if self._matrix_entries else None
+        if self._matrix is None:
+            return None, 0.0
+        scores = self._matrix @ vector  # Rows and query are unit length: dot = cosine
+        best = int(np.argmax(scores))
+        return self._matrix_entries[best], float(scores[best])
+
+
+def _unit(vector: Iterable[float]) -> Optional[np.ndarray]:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        embed=None
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity = similarity
+        # Defaults to the OpenAI embeddings endpoint; None (no API key) = exact match only
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._users: Dict[str, Dict[str, _ScopeIndex]] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _embedder(self):
+        if self.embed is not None:
+            return self.embed
+        return embed_texts if llm_available() else None
+
+    def _count(self, user_id: str, **deltas: int) -> None:
+        stats = self._stats.setdefault(user_id, {
+            "lookups": 0, "exact_hits": 0, "semantic_hits": 0, "stored": 0,
+            "llm_calls_saved": 0, "tokens_saved": 0, "invalidations": 0,
+        })
+        for key, value in deltas.items():
+            stats[key] += value
+
+    def lookup(self, user_id: str, scope: str, message: str) -> Optional[CacheLookup]:
+        """Cached reply for this message, if any. None: message is not cacheable."""
+        normalized = normalize_message(message)
+        if len(normalized) < MIN_MESSAGE_CHARS:
+            return None
+        result = CacheLookup(user_id, scope, normalized)
+        now = time.time()
+
+        with self._lock:
+            self._count(user_id, lookups=1)
+            index = self._users.get(user_id, {}).get(scope)
+            if index is not None:
+                index.drop_expired(now)
+                entry = index.entries.get(normalized)
+                if entry is not None:
+                    result.entry, result.kind, result.similarity = entry, "exact", 1.0
+                    self._count(user_id, exact_hits=1, llm_calls_saved=entry.llm_calls, tokens_saved=entry.tokens)
+                    return result
+            has_vectors = index is not None and any(e.vector is not None for e in index.entries.values())
+
+        embed = self._embedder()
+        if embed is None or not has_vectors:
+            return result  # Nothing to compare with: no embeddings call on the reply path
+        try:
+            result.vector = _unit(embed([normalized])[0])
+        except Exception as e:
+            print(f"[ResponseCache] Embedding failed, exact match only: {e}")
+            return result
+        if result.vector is None:
+            return result
+
+        with self._lock:
+            index = self._users.get(user_id, {}).get(scope)
+            if index is None:
+                return result
+            entry, similarity = index.nearest(result.vector)
+            if entry is not None and similarity >= self.similarity:
+                result.entry, result.kind, result.similarity = entry, "semantic", similarity
+                self._count(user_id, semantic_hits=1, llm_calls_saved=entry.llm_calls, tokens_saved=entry.tokens)
+        return result
+
+    def store(
+        self,
+        lookup: CacheLookup,
+        reply: str,
+        usage: Dict[str, Any],
+        insights: Optional[dict] = None
+    ) -> Optional[Future]:
+        """
+        Keep a fresh reply. It serves exact matches right away; the embedding
+        for semantic matches is computed in the background (returned future).
+        """
+        expires_at = time.time() + self.ttl_seconds
+        if "calculate_payment" in usage.get("tools", []):
+            program_end = _finance_program_end()
+            if program_end:
+                expires_at = min(expires_at, program_end)
+        entry = CachedReply(
+            lookup.normalized, reply, insights, usage.get("llm_calls", 0),
+            usage.get("total_tokens", 0), expires_at, lookup.vector
+        )
+        with self._lock:
+            scopes = self._users.setdefault(lookup.user_id, {})
+            scopes.setdefault(lookup.scope, _ScopeIndex()).put(entry)
+            self._count(lookup.user_id, stored=1)
+            self._evict(scopes)
+
+        embed = self._embedder()
+        if entry.vector is not None or embed is None:
+            return None
+        return _embed_pool.submit(self._attach_vector, lookup, entry, embed)
+
+    def _attach_vector(self, lookup: CacheLookup, entry: CachedReply, embed) -> None:
+        try:
+            vector = _unit(embed([entry.normalized])[0])
+        except Exception as e:
+            print(f"[ResponseCache] Embedding failed, stored for exact match only: {e}")
+            return
+        with self._lock:
+            index = self._users.get(lookup.user_id, {}).get(lookup.scope)
+            if index is None or index.entries.get(entry.normalized) is not entry:
+                return  # Evicted or invalidated meanwhile
+            entry.vector = vector
+            index._matrix = None
+
+    def _evict(self, scopes: Dict[str, _ScopeIndex]) -> None:
+        """Expired first, then the soonest-expiring (oldest) entries past max_entries"""
+        now = time.time()
+        for index in scopes.values():
+            index.drop_expired(now)
+        total = sum(len(index.entries) for index in scopes.values())
+        if total <= self.max_entries:
+            return
+        oldest = sorted(
+            ((entry.expires_at, scope, key) for scope, index in scopes.items() for key, entry in index.entries.items())
+        )[:total - self.max_entries]
+        for _, scope, key in oldest:
+            index = scopes[scope]
+            del index.entries[key]
+            index._matrix = None
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop a user's replies after their inventory or clone settings change"""
+        if not user_id:
+            return
+        with self._lock:
+            if self._users.pop(str(user_id), None):
+                self._count(str(user_id), invalidations=1)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def stats_for(self, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats.get(user_id) or {})
+            entries = sum(len(index.entries) for index in self._users.get(user_id, {}).values())
+        hits = stats.get("exact_hits", 0) + stats.get("semantic_hits", 0)
+        lookups = stats.get("lookups", 0)
+        stats.update(entries=entries, hits=hits, hit_rate=round(hits / lookups, 3) if lookups else 0.0)
+        return stats
+
+
+def cacheable_reply(usage: Dict[str, Any], media_info: Optional[dict], reply: str, private_terms: Iterable[str] = ()) -> bool:
+    """Can this freshly generated reply be served to other buyers?"""
+    if media_info or not usage.get("llm_calls") or not reply:
+        return False
+    if any(tool not in CACHEABLE_TOOLS for tool in usage.get("tools", [])):
+        return False
+    lowered = reply.lower()
+    return not any(
+        re.search(rf"\b{re.escape(term.lower())}\b", lowered)
+        for term in private_terms if term and len(term) > 2
+    )
+
+
+response_cache = ResponseCache()
+
+
+def invalidate_response_cache(user_id: str) -> None:
+    response_cache.invalidate_user(user_id)
@@ -0,0 +1,221 @@
+"""
+Response-time metrics maintained incrementally on every message write.
+
+Each client row remembers when the current inbound and outbound turns began
+(`inbound_turn_at` / `outbound_turn_at`). When a message flips the turn, the
+gap is recorded into `response_time_stats` for the client and for the user:
+a running mean plus a fixed log-bucket histogram, so each update is O(1) and
+percentiles come from the buckets without touching message history.
+Stat rows are shared by every conversation of a user, so they are read
+FOR UPDATE and concurrent webhooks apply their samples one after the other.
+"""
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.upsert import dialect_insert
+from app.models import Client, ClientMemory, ResponseTimeStat, get_uuid
+
+# Histogram bucket upper bounds in seconds (last bucket is open-ended)
+LATENCY_BUCKETS = [
+    5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600, 900, 1800, 2700,
+    3600, 7200, 14400, 28800, 43200, 86400, 172800, 604800,
+]
+
+RESPONDER_AI = "ai"
+RESPONDER_HUMAN = "human"
+RESPONDER_AUTOMATION = "automation"
+RESPONDER_FIRST = "first"
+RESPONDER_CLIENT = "client"
+
+# ClientMemory.response_speed thresholds (minutes) on the client's median reply time
+FAST_REPLY_MINUTES = 15
+SLOW_REPLY_MINUTES = 240
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # PostgreSQL returns aware datetimes, SQLite naive ones (stored as UTC)
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def sketch_add(histogram: Optional[List[int]], seconds: float) -> List[int]:
+    """Return a new histogram with one more sample (new list so JSON change is detected)"""
+    counts = list(histogram or [0] * (len(LATENCY_BUCKETS) + 1))
+    counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    return counts
+
+
+def sketch_quantile(histogram: Optional[List[int]], q: float, max_seconds: Optional[float] = None) -> Optional[float]:
+    """Estimate a quantile by linear interpolation inside the matching bucket"""
+    if not histogram:
+        return None
+    total = sum(histogram)
+    if not total:
+        return None
+
+    target = q * total
+    seen = 0
+    for i, n in enumerate(histogram):
+        if n and seen + n >= target:
+            lower = LATENCY_BUCKETS[i - 1] if i else 0
+            upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else (max_seconds or lower)
+            return lower + (upper - lower) * (target - seen) / n
+        seen += n
+    return max_seconds
+
+
+def _locked_stat(db: Session, scope: str, scope_id: str, responder: str) -> Optional[ResponseTimeStat]:
+    """Current row, locked until the caller's transaction ends (histogram is updated in Python)"""
+    return db.query(ResponseTimeStat).filter(
+        ResponseTimeStat.scope == scope,
+        ResponseTimeStat.scope_id == scope_id,
+        ResponseTimeStat.responder == responder
+    ).with_for_update().populate_existing().first()
+
+
+def _update_stat(db: Session, user_id: str, scope: str, scope_id: str, responder: str, seconds: float) -> ResponseTimeStat:
+    stat = _locked_stat(db, scope, scope_id, responder)
+    if not stat:
+        # Insert-if-missing so two concurrent first replies can't collide on the unique key
+        db.execute(dialect_insert(db, ResponseTimeStat.__table__).values(
+            id=get_uuid(), user_id=user_id, scope=scope, scope_id=scope_id,
+            responder=responder, count=0, mean_seconds=0.0
+        ).on_conflict_do_nothing(index_elements=["scope", "scope_id", "responder"]))
+        stat = _locked_stat(db, scope, scope_id, responder)
+
+    stat.count = (stat.count or 0) + 1
+    stat.mean_seconds = (stat.mean_seconds or 0.0) + (seconds - (stat.mean_seconds or 0.0)) / stat.count
+    stat.min_seconds = seconds if stat.min_seconds is None else min(stat.min_seconds, seconds)
+    stat.max_seconds = seconds if stat.max_seconds is None else max(stat.max_seconds, seconds)
+    stat.histogram = sketch_add(stat.histogram, seconds)
+    return stat
+
+
+def _record(db: Session, client: Client, responder: str, seconds: float) -> ResponseTimeStat:
+    user_id = str(client.user_id)
+    _update_stat(db, user_id, "user", user_id, responder, seconds)
+    return _update_stat(db, user_id, "client", str(client.id), responder, seconds)
+
+
+def _update_client_memory(db: Session, client_id: str, stat: ResponseTimeStat) -> None:
+    """Keep ClientMemory.avg_response_time_minutes / response_speed in sync"""
+    memory = db.query(ClientMemory).filter(ClientMemory.client_id == client_id).first()
+    if not memory:
+        return
+
+    memory.avg_response_time_minutes = int(round(stat.mean_seconds / 60))
+    p50 = sketch_quantile(stat.histogram, 0.5, stat.max_seconds) / 60
+    p90 = sketch_quantile(stat.histogram, 0.9, stat.max_seconds) / 60
+    if stat.count >= 3 and p90 > max(p50 * 10, SLOW_REPLY_MINUTES):
+        memory.response_speed = "variable"
+    elif p50 <= FAST_REPLY_MINUTES:
+        memory.response_speed = "fast"
+    elif p50 >= SLOW_REPLY_MINUTES:
+        memory.response_speed = "slow"
+    else:
+        memory.response_speed = "variable"
+
+
+def record_response(
+    db: Session,
+    client: Optional[Client],
+    direction: str,
+    ai_generated: bool = False,
+    sent_at: Optional[datetime] = None,
+    responder: Optional[str] = None
+) -> Optional[float]:
+    """
+    Advance the client's turn state for a new message and record the reply
+    latency if it answers the other side. Joins the caller's transaction
+    (no commit) inside a savepoint, so a failure here leaves it usable.
+    `responder` says who sent an outbound message (default: ai/human from
+    `ai_generated`). Returns the latency in seconds, or None if nothing was paired.
+    """
+    if client is None:
+        return None
+
+    now = _naive_utc(sent_at) or datetime.utcnow()
+    inbound_at = _naive_utc(client.inbound_turn_at)
+    outbound_at = _naive_utc(client.outbound_turn_at)
+    latency = None
+    if responder is None:
+        responder = RESPONDER_AI if ai_generated else RESPONDER_HUMAN
+
+    try:
+        with db.begin_nested():
+            if direction == "inbound":
+                awaiting_client = outbound_at is not None and (inbound_at is None or inbound_at <= outbound_at)
+                if awaiting_client:
+                    latency = max((now - outbound_at).total_seconds(), 0.0)
+                    stat = _record(db, client, RESPONDER_CLIENT, latency)
+                    _update_client_memory(db, str(client.id), stat)
+                # Latency is measured from the first unanswered message of a turn
+                if inbound_at is None or awaiting_client:
+                    client.inbound_turn_at = now
+
+            elif direction == "outbound":
+                awaiting_us = inbound_at is not None and (outbound_at is None or outbound_at < inbound_at)
+                if awaiting_us:
+                    latency = max((now - inbound_at).total_seconds(), 0.0)
+                    _record(db, client, responder, latency)
+                    if outbound_at is None:
+                        _record(db, client, RESPONDER_FIRST, latency)
+                if outbound_at is None or awaiting_us:
+                    client.outbound_turn_at = now
+    except Exception as e:
+        # Metrics must never block a message write
+        print(f"[ResponseTimes] Error recording {direction} for client {client.id}: {e}")
+        return None
+
+    return latency
+
+
+def _summary(stat: Optional[ResponseTimeStat]) -> Dict[str, Any]:
+    if not stat or not stat.count:
+        return {"count": 0, "avg_minutes": None, "p50_minutes": None, "p90_minutes": None,
+                "min_minutes": None, "max_minutes": None}
+
+    def minutes(seconds):
+        return None if seconds is None else round(seconds / 60, 1)
+
+    return {
+        "count": stat.count,
+        "avg_minutes": minutes(stat.mean_seconds),
+        "p50_minutes": minutes(sketch_quantile(stat.histogram, 0.5, stat.max_seconds)),
+        "p90_minutes": minutes(sketch_quantile(stat.histogram, 0.9, stat.max_seconds)),
+        "min_minutes": minutes(stat.min_seconds),
+        "max_minutes": minutes(stat.max_seconds),
+    }
+
+
+def get_response_time_report(db: Session, user_id: str, client_id: Optional[str] = None) -> Dict[str, Any]:
+    """First-response time, AI vs human reply latency and client reply speed"""
+    scope, scope_id = ("client", client_id) if client_id else ("user", str(user_id))
+    rows = {
+        row.responder: row
+        for row in db.query(ResponseTimeStat).filter(
+            ResponseTimeStat.user_id == str(user_id),
+            ResponseTimeStat.scope == scope,
+            ResponseTimeStat.scope_id == scope_id
+        ).all()
+    }
+
+    ai, human = rows.get(RESPONDER_AI), rows.get(RESPONDER_HUMAN)
+    return {
+        "scope": scope,
+        "scope_id": scope_id,
+        "first_response": _summary(rows.get(RESPONDER_FIRST)),
+        "ai_reply": _summary(ai),
+        "human_reply": _summary(human),
+        "automation_reply": _summary(rows.get(RESPONDER_AUTOMATION)),
+        "client_reply": _summary(rows.get(RESPONDER_CLIENT)),
+        # How many times faster AI replies are on average (None until both have data)
+        "ai_speedup": (
+            round(human.mean_seconds / ai.mean_seconds, 1)
+            if ai and human and ai.count and human.count and ai.mean_seconds else None
+        ),
+    }
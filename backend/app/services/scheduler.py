@@ -36,3 +36,21 @@ def schedule_action_execution(action_func, run_date, args=None):
         misfire_grace_time=3600  # Allow 1 hour late execution if system was down
     )
     print(f"[Scheduler] Scheduled job for {run_date}")
+
+
+def schedule_interval_job(job_id, func, hours):
+    """
+    Register (or update) a recurring job. `func` must be a module-level
+    function so the SQLAlchemy job store can persist a reference to it.
+    """
+    scheduler.add_job(
+        func,
+        'interval',
+        hours=hours,
+        id=job_id,
+        replace_existing=True,
+        coalesce=True,          # Missed runs while down collapse into one
+        max_instances=1,
+        misfire_grace_time=3600
+    )
+    print(f"[Scheduler] Scheduled {job_id} every {hours}h")
@@ -0,0 +1,278 @@
+"""
+Object storage for media and documents.
+
+`get_storage()` returns the configured backend (STORAGE_BACKEND env):
+
+  - local: files under MEDIA_DIR (default; what single-container dev uses)
+  - s3:    any S3-compatible store (AWS, MinIO, R2) via boto3, configured by
+           AWS_S3_BUCKET, AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+           and AWS_S3_ENDPOINT_URL for non-AWS endpoints
+
+Keys are the content-addressed media filenames. Local disk stays the working
+copy for conversions and variants; the backend is the durable copy that
+survives redeploys and is shared by replicas. With S3 the API hands out
+presigned URLs, so downloads go straight to the bucket.
+
+Object metadata (size, ETag, type) is cached for a few minutes so existence
+checks on hot media don't cost a HEAD request each. "Not found" is only kept
+for a few seconds: another replica may upload the object right after.
+"""
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, NamedTuple, Optional
+
+from app.utils.cache import TTLCache
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+AWS_S3_BUCKET = os.getenv("AWS_S3_BUCKET")
+AWS_REGION = os.getenv("AWS_REGION")
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+AWS_S3_PREFIX = os.getenv("AWS_S3_PREFIX", "media/")
+
+# Presigned download URLs stay valid this long
+PRESIGNED_URL_SECONDS = int(os.getenv("PRESIGNED_URL_SECONDS", "3600"))
+
+# Objects above this size are sent as a multipart upload, in parts of this size
+MULTIPART_THRESHOLD_BYTES = 8 * 1024 * 1024
+MULTIPART_PART_BYTES = 8 * 1024 * 1024
+
+_MISSING = False  # Cached "object does not exist" (TTLCache uses None for misses)
+MISSING_TTL_SECONDS = float(os.getenv("STORAGE_MISSING_TTL_SECONDS", "5"))
+
+
+class ObjectInfo(NamedTuple):
+    key: str
+    size: int
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+    content_type: Optional[str]
+
+
+class StorageBackend:
+    """Interface shared by the local and S3 backends"""
+    name = "base"
+    is_remote = False
+
+    def __init__(self, metadata_ttl_seconds: float = 300):
+        self.metadata_cache = TTLCache(ttl_seconds=metadata_ttl_seconds, max_entries=50000)
+
+    # --- implemented by backends ---
+    def _put_file(self, key: str, path: Path, content_type: Optional[str]) -> None:
+        raise NotImplementedError
+
+    def _head(self, key: str) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+
+    def _delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def download(self, key: str, path: Path) -> None:
+        raise NotImplementedError
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        raise NotImplementedError
+
+    def url(self, key: str, expires: int = PRESIGNED_URL_SECONDS) -> Optional[str]:
+        """Direct download URL, or None if the API must serve the file itself"""
+        return None
+
+    # --- shared behaviour ---
+    def save_file(self, key: str, path: Path, content_type: Optional[str] = None) -> None:
+        self._put_file(key, Path(path), content_type)
+        self.metadata_cache.invalidate(key)
+
+    def stat(self, key: str) -> Optional[ObjectInfo]:
+        cached = self.metadata_cache.get(key)
+        if cached is not None:
+            return cached or None
+        info = self._head(key)
+        if info is None:
+            self.metadata_cache.set(key, _MISSING, ttl_seconds=min(MISSING_TTL_SECONDS, self.metadata_cache.ttl_seconds))
+        else:
+            self.metadata_cache.set(key, info)
+        return info
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def delete(self, key: str) -> None:
+        self._delete(key)
+        self.metadata_cache.invalidate(key)
+
+
+class LocalStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: Path, metadata_ttl_seconds: float = 5):
+        super().__init__(metadata_ttl_seconds)
+        self.root = Path(root)
+
+    def path(self, key: str) -> Path:
+        return self.root / key
+
+    def _put_file(self, key: str, path: Path, content_type: Optional[str]) -> None:
+        target = self.path(key)
+        if path.resolve() == target.resolve():
+            return  # Already in place (media is written straight into MEDIA_DIR)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.part")
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    def _head(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            st = self.path(key).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return ObjectInfo(key, st.st_size, None, datetime.fromtimestamp(st.st_mtime, timezone.utc), None)
+
+    def _delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def download(self, key: str, path: Path) -> None:
+        if self.path(key).resolve() != Path(path).resolve():
+            shutil.copyfile(self.path(key), path)
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        if not self.root.exists():
+            return
+        for entry in self.root.iterdir():
+            if entry.is_file() and entry.name.startswith(prefix):
+                info = self._head(entry.name)
+                if info:
+                    yield info
+
+
+def _is_not_found(error: Exception) -> bool:
+    code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3Storage(StorageBackend):
+    name = "s3"
+    is_remote = True
+
+    def __init__(self, bucket: str, client: Any = None, prefix: str = AWS_S3_PREFIX, metadata_ttl_seconds: float = 300):
+        super().__init__(metadata_ttl_seconds)
+        self.bucket = bucket
+        self.prefix = prefix or ""
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3  # Only needed when STORAGE_BACKEND=s3
+                    self._client = boto3.client(
+                        "s3",
+                        region_name=AWS_REGION,
+                        endpoint_url=AWS_S3_ENDPOINT_URL,
+                        aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    )
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _put_file(self, key: str, path: Path, content_type: Optional[str]) -> None:
+        extra = {"ContentType": content_type} if content_type else {}
+        size = path.stat().st_size
+        with open(path, "rb") as f:
+            if size <= MULTIPART_THRESHOLD_BYTES:
+                self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=f, **extra)
+                return
+            self._multipart_upload(key, f, extra)
+
+    def _multipart_upload(self, key: str, f, extra: dict) -> None:
+        """Stream the file part by part: memory use is one part, not the whole file"""
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key), **extra)["UploadId"]
+        try:
+            parts = []
+            number = 1
+            while True:
+                chunk = f.read(MULTIPART_PART_BYTES)
+                if not chunk:
+                    break
+                res = self.client.upload_part(
+                    Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                    PartNumber=number, Body=chunk
+                )
+                parts.append({"PartNumber": number, "ETag": res["ETag"]})
+                number += 1
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                MultipartUpload={"Parts": parts}
+            )
+        except Exception:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+
+    def _head(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            res = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except Exception as e:
+            if _is_not_found(e):
+                return None
+            raise
+        return ObjectInfo(key, res.get("ContentLength", 0), res.get("ETag"),
+                          res.get("LastModified"), res.get("ContentType"))
+
+    def _delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def download(self, key: str, path: Path) -> None:
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        tmp = Path(path).with_name(f"{Path(path).name}.part")
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: body.read(1024 * 1024), b""):
+                out.write(chunk)
+        os.replace(tmp, path)
+
+    def list_objects(self, prefix: str = "") -> Iterator[ObjectInfo]:
+        token = None
+        while True:
+            kwargs = {"Bucket": self.bucket, "Prefix": self._key(prefix)}
+            if token:
+                kwargs["ContinuationToken"] = token
+            res = self.client.list_objects_v2(**kwargs)
+            for obj in res.get("Contents", []):
+                yield ObjectInfo(obj["Key"][len(self.prefix):], obj.get("Size", 0), obj.get("ETag"),
+                                 obj.get("LastModified"), None)
+            if not res.get("IsTruncated"):
+                return
+            token = res.get("NextContinuationToken")
+
+    def url(self, key: str, expires: int = PRESIGNED_URL_SECONDS) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=expires
+        )
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Process-wide backend chosen by STORAGE_BACKEND"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "s3" and AWS_S3_BUCKET:
+            _storage = S3Storage(AWS_S3_BUCKET)
+        else:
+            if STORAGE_BACKEND == "s3":
+                print("[Storage] STORAGE_BACKEND=s3 but AWS_S3_BUCKET is not set, using local disk")
+            from app.services.media_store import MEDIA_DIR
+            _storage = LocalStorage(MEDIA_DIR)
+        print(f"[Storage] Using {_storage.name} storage backend")
+    return _storage
+
+
+def set_storage(storage: Optional[StorageBackend]) -> None:
+    """Swap the backend (tests, scripts)"""
+    global _storage
+    _storage = storage
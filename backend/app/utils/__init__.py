@@ -1 +1,2 @@
 from .reliability import retry_async, RateLimiter, message_rate_limiter
+from .cache import TTLCache, dashboard_cache, invalidate_dashboard, analytics_cache, invalidate_analytics
@@ -2,6 +2,7 @@
 RAY CLON V2.0 - Agent Tools
 Tools for the state-machine based sales agent
 """
+from datetime import datetime
 from typing import Optional, Dict, List, Any
 from sqlalchemy.orm import Session
 import os
@@ -242,16 +243,19 @@ def update_conversation_state(
     """
     Update or create conversation state for a client.
     """
-    from app.models import ConversationState
+    from app.models import ConversationState, ConversationStageEvent
+    from app.utils.cache import invalidate_analytics
     
     state = db.query(ConversationState).filter(
         ConversationState.client_id == client_id
     ).first()
     
+    previous_stage = state.stage if state else None
     if not state:
         state = ConversationState(
             client_id=client_id,
-            user_id=user_id
+            user_id=user_id,
+            stage=fields.get("stage") or "INTAKE"
         )
         db.add(state)
     
@@ -259,6 +263,19 @@ def update_conversation_state(
         if hasattr(state, key):
             setattr(state, key, value)
     
+    # Log stage transitions for funnel analytics
+    if state.stage and state.stage != previous_stage:
+        now = datetime.utcnow()
+        state.stage_entered_at = now
+        db.add(ConversationStageEvent(
+            user_id=user_id,
+            client_id=client_id,
+            from_stage=previous_stage,
+            stage=state.stage,
+            entered_at=now
+        ))
+        invalidate_analytics(user_id)
+    
     db.commit()
     return True
 
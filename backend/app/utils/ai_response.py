@@ -2,10 +2,8 @@
 AI Response Generator for Sales Clone - RAY PRO SELLER
 Uses OpenAI API with the RAY MASTER PROMPT for authentic sales responses
 """
-import os
 from typing import Optional
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 # ============================================
 # RAY MASTER PROMPT - THE CORE IDENTITY
@@ -201,14 +199,13 @@ def generate_clone_response(
     # Build complete system prompt
     system_prompt = _build_system_prompt(clone, client_context)
     
-    if not OPENAI_API_KEY:
+    from app.services.llm_client import chat_completion, llm_available
+    
+    if not llm_available():
         print("[AI Response] No OPENAI_API_KEY found, using fallback")
         return _fallback_response(clone, buyer_message, client_context)
     
     try:
-        from openai import OpenAI
-        
-        client = OpenAI(api_key=OPENAI_API_KEY)
         
         # Build messages with conversation history
         messages = [{"role": "system", "content": system_prompt}]
@@ -228,7 +225,7 @@ def generate_clone_response(
         
         messages.append({"role": "user", "content": buyer_message})
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4o",  # Changed to gpt-4o for better instruction following
             messages=messages,
             max_tokens=250,
@@ -0,0 +1,103 @@
+"""
+In-memory TTL cache for short-lived, per-user payloads (dashboard, analytics).
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Small thread-safe cache where every entry expires after `ttl_seconds`.
+
+    Usage:
+        cache = TTLCache(ttl_seconds=60)
+        payload = cache.get(user_id)
+        if payload is None:
+            payload = build()
+            cache.set(user_id, payload)
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return cached value or None if missing/expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float = None) -> None:
+        """Store value, evicting expired entries if the cache is full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.monotonic()
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                self._evict(now)
+            self._data[key] = (now + ttl, value)
+
+    def get_or_set(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """Return cached value, building and storing it on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = builder()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single key (no-op if missing)"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """Drop every key matching predicate (e.g. all keys of a user)"""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self, now: float) -> None:
+        """Remove expired entries; if still full, drop the oldest-expiring ones"""
+        for key in [k for k, (exp, _) in self._data.items() if exp <= now]:
+            del self._data[key]
+        overflow = len(self._data) - self.max_entries + 1
+        if overflow > 0:
+            oldest = sorted(self._data.items(), key=lambda kv: kv[1][0])[:overflow]
+            for key, _ in oldest:
+                del self._data[key]
+
+
+# Dashboard payload per user_id. Invalidated on tag assignment and message writes.
+dashboard_cache = TTLCache(ttl_seconds=60)
+
+
+def invalidate_dashboard(user_id: str) -> None:
+    """Drop the cached dashboard for a user after data it depends on changes"""
+    if user_id:
+        dashboard_cache.invalidate(str(user_id))
+
+
+# Funnel / cohort payloads keyed by (user_id, report, params). Invalidated on stage changes.
+analytics_cache = TTLCache(ttl_seconds=300)
+
+
+def invalidate_analytics(user_id: str) -> None:
+    """Drop every cached analytics report for a user"""
+    if user_id:
+        user_id = str(user_id)
+        analytics_cache.invalidate_where(lambda key: key[0] == user_id)
@@ -0,0 +1,182 @@
+"""
+File responses for media downloads: conditional GET, byte ranges and cache
+headers, which Starlette's FileResponse doesn't do in this version.
+
+- ETag / Last-Modified on every response; If-None-Match / If-Modified-Since
+  answer 304 without touching the file.
+- Single `Range: bytes=` requests answer 206 (video seeking, resumed
+  downloads); If-Range falls back to 200 when the file changed.
+- Content-addressed files (`<sha256>.<ext>`) never change, so they get a
+  strong hash ETag and `Cache-Control: immutable`.
+- The body goes out through the server's zero-copy extension when it
+  advertises one (`http.response.zerocopysend` / `http.response.pathsend`),
+  otherwise in chunks read off the event loop.
+"""
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from hashlib import md5
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def is_content_addressed(path: Path) -> bool:
+    return bool(_CONTENT_ADDRESSED.match(path.stem))
+
+
+def file_etag(path: Path, st: os.stat_result) -> str:
+    if is_content_addressed(path):
+        return f'"{path.stem}"'
+    return f'"{md5(f"{st.st_mtime}-{st.st_size}".encode()).hexdigest()}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    tags = [tag.strip() for tag in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single satisfiable range. Raises ValueError
+    if unsatisfiable; returns None when the header should be ignored
+    (bad syntax, multiple ranges).
+    """
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or (last and int(last) < start):
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """Sends bytes [start, end] of a file (whole file by default)"""
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: Path, size: int, start: int = 0, end: Optional[int] = None,
+                 status_code: int = 200, headers: Optional[dict] = None, media_type: Optional[str] = None):
+        self.path = path
+        self.start = start
+        self.end = size - 1 if end is None else end
+        self.full = start == 0 and self.end == size - 1
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.end < self.start:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensions = scope.get("extensions") or {}
+        count = self.end - self.start + 1
+        if "http.response.zerocopysend" in extensions:
+            fd = await anyio.to_thread.run_sync(os.open, str(self.path), os.O_RDONLY)
+            try:
+                await send({"type": "http.response.zerocopysend", "file": fd,
+                            "offset": self.start, "count": count, "more_body": False})
+            finally:
+                os.close(fd)
+            return
+        if self.full and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            await f.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank under us; close the body cleanly
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def media_file_response(
+    request: Request,
+    path: Path,
+    media_type: str,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """Conditional / ranged response for a file that is known to exist"""
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        return Response(status_code=404)
+
+    etag = file_etag(path, st)
+    headers = {
+        "etag": etag,
+        "last-modified": formatdate(st.st_mtime, usegmt=True),
+        "cache-control": cache_control or (
+            IMMUTABLE_CACHE_CONTROL if is_content_addressed(path) else REVALIDATE_CACHE_CONTROL
+        ),
+        "accept-ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif _not_modified_since(request.headers.get("if-modified-since", ""), st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range:
+        # Only resume against the same version of the file (strong compare for ETags)
+        same = if_range.strip() == etag if if_range.strip().startswith('"') else _not_modified_since(if_range, st.st_mtime)
+        if not same:
+            range_header = None
+
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{st.st_size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{st.st_size}"
+            return RangeFileResponse(path, st.st_size, start, end, status_code=206,
+                                     headers=headers, media_type=media_type)
+
+    return RangeFileResponse(path, st.st_size, headers=headers, media_type=media_type)
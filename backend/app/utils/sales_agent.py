@@ -4,18 +4,42 @@ Unified Brain: Uses same Logic & Tools as ai_service.py
 """
 import os
 import json
-from typing import Optional, Dict, Any, List, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional, Dict, Any, List, Tuple
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import or_, func
-from openai import OpenAI
+from app.db.session import SessionLocal
+from app.services.llm_client import add_usage, chat_completion, chat_completion_stream, llm_available
+from app.services.agent_metrics import new_usage, record_turn
+from app.services.conversation_context import history_tokens, pack_history
+from app.services.response_cache import (
+    RESPONSE_CACHE_ENABLED, cache_scope, cacheable_reply, response_cache
+)
+from app.services.reply_stream import ReplyStream
+from app.services.memory_worker import MEMORY_ASYNC, apply_memory_update, submit_memory_update, wait_for_client
 
 from app.services.calculator import CalculatorService
 from app.services.calendar_integration import CalendarService
 from app.utils.agent_tools import update_conversation_state, get_conversation_state
-from app.models import InventoryItem
+from app.models import Client, InventoryItem
+from app.services.image_variants import variant_url
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# unified: the reply and the memory fields come back in one JSON answer, so
+#          insight extraction needs no call of its own
+# classic: plain-text reply, memory worker runs a separate extraction call
+AGENT_MODE = os.getenv("AGENT_MODE", "unified").lower()
+
+AGENT_ERROR_REPLY = "Hubo un error procesando tu solicitud. Intenta de nuevo."
+
+# Tool calls of one round run in parallel on this pool
+TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", "8"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("AGENT_TOOL_TIMEOUT_SECONDS", "15"))
+TOOL_TIMEOUTS = {"calculate_payment": 5.0, "check_calendar": 10.0}  # Others: TOOL_TIMEOUT_SECONDS
+MAX_TOOL_ROUNDS = int(os.getenv("AGENT_MAX_TOOL_ROUNDS", "3"))
+
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool")
 
 # ============================================
 # MASTER PROMPT (COPIED FROM AI_SERVICE.PY)
@@ -102,6 +126,31 @@ Si el usuario dice "Me llamo Pedro Pérez", "Soy Pedro", "Mi nombre es Pedro":
 
 """
 
+# Appended to the system prompt in unified mode
+UNIFIED_OUTPUT_PROMPT = """
+📦 FORMATO DE RESPUESTA (OBLIGATORIO)
+Cuando le contestes al cliente (no al llamar herramientas), responde SOLO con este JSON:
+{
+    "reply": "tu mensaje para el cliente, tal cual lo enviarías por WhatsApp",
+    "memory": {
+        "vehicle_mentioned": "modelo si menciona uno",
+        "budget_monthly": número si menciona presupuesto mensual,
+        "budget_down": número si menciona enganche/down,
+        "plan_preference": "lease" o "finance" si lo dice,
+        "credit_score": número si menciona score,
+        "document_type": "ssn/itin/passport si menciona",
+        "objection": "texto de objeción si hay alguna",
+        "concern": "preocupación principal si la hay",
+        "timeline": "now/this_week/this_month/exploring",
+        "communication_style": "formal/casual/direct/friendly",
+        "occupation": "trabajo si lo menciona",
+        "buying_signal": "señal de compra si la hay",
+        "sentiment": "positive/neutral/negative"
+    }
+}
+En "memory" pon SOLO lo que el ÚLTIMO mensaje del cliente menciona explícitamente (null si no aplica).
+"""
+
 RAY_TOOLS = [
     {
         "type": "function",
@@ -165,6 +214,63 @@ RAY_TOOLS = [
     }
 ]
 
+# Messages with these force the schedule_appointment tool on the first call
+APPOINTMENT_KEYWORDS = [
+    "cita", "agenda", "agéndame", "agendame", "appointment",
+    "mañana", "lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo",
+    "10am", "10:00", "11am", "2pm", "3pm", "4pm", "5pm",
+    "a las", "para el", "para mañana", "nos vemos"
+]
+
+
+def wants_appointment(message: str) -> bool:
+    lowered = (message or "").lower()
+    return any(kw in lowered for kw in APPOINTMENT_KEYWORDS)
+
+
+# ============================================
+# PROMPT LAYOUT
+# ============================================
+# Providers cache the longest previously-seen prompt prefix (OpenAI: from
+# 1024 tokens, in 128-token steps). Order of a request, most stable first:
+#   tools -> static system prompt (this clone) -> history -> volatile context -> buyer message
+# Anything that changes per turn (memory, stage, time) lives in the volatile
+# context, so one turn never invalidates the prefix of the next.
+
+def build_static_prompt(clone, unified: bool) -> str:
+    """Master prompt + output format + clone personality: identical on every turn of this clone"""
+    return f"""{RAY_SYSTEM_PROMPT}{UNIFIED_OUTPUT_PROMPT if unified else ""}
+PERSONALIDAD PERSONALIZADA DEL USUARIO:
+{clone.personality or 'Usa el tono de Ray por defecto.'}
+
+INSTRUCCIÓN ESPECIAL DE MEMORIA:
+Si el cliente ya te dio información antes (ves en MEMORIA DEL CLIENTE), 
+NO la pidas de nuevo. Usa lo que ya sabes para personalizar tu respuesta.
+Si hay objeciones previas, tenlas en cuenta al responder.
+"""
+
+
+def build_volatile_context(memory_context: str, state: Dict[str, Any], now: Optional[datetime] = None) -> str:
+    """
+    Per-turn context, incl. the rolling summary of turns outside the history
+    window. Time is rounded to the hour: enough for "mañana", "lunes", "en la tarde".
+    """
+    now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    return f"""CONTEXTO ACTUAL (se actualiza en cada mensaje):
+{memory_context}
+
+ESTADO DE LA CONVERSACIÓN ACTUAL:
+- Stage: {state.get('stage', 'INTAKE')}
+- Vehículo discutido: {state.get('vehicle_interest', 'No definido')}
+- Score mencionado: {state.get('credit_score', 'No definido')}
+- Documento: {state.get('doc_type', 'No definido')}
+- FECHA Y HORA ACTUAL: {now.strftime('%Y-%m-%d %H:%M')} (aprox., usa esto para calcular "mañana", "lunes", etc)
+""" + (f"""
+RESUMEN DE LA CONVERSACIÓN ANTERIOR (mensajes que ya no ves en el historial):
+{state['conversation_summary']}
+""" if state.get("conversation_summary") else "")
+
+
 # ============================================
 # MAIN AGENT FUNCTION
 # ============================================
@@ -174,16 +280,25 @@ def process_message_with_agent(
     clone,  # SalesClone model
     client_id: str,
     buyer_message: str,
-    conversation_history: Optional[List[dict]] = None
+    conversation_history: Optional[List[dict]] = None,
+    reply_stream: Optional[ReplyStream] = None
 ) -> Dict[str, Any]:
     """
     Main entry point for the RAY agent (V2 Unified Brain).
     Connects to OpenAI, uses tools, and manages state.
     NOW WITH MEMORY SYSTEM & VEHICLE PHOTOS.
+    With `reply_stream` the reply is delivered by the stream as it is
+    generated (result["delivered"] lists the chunks sent).
     """
     from app.services.memory_service import MemoryService
-    
+    started = time.perf_counter()
+    unified = AGENT_MODE == "unified"
+    if reply_stream is not None:
+        reply_stream.begin(structured=unified)  # Typing indicator before anything else
+
     # === STEP 1: Get or create memory for this client ===
+    # Previous turn's background update must land first (per-client ordering)
+    wait_for_client(client_id)
     memory = MemoryService.get_or_create_memory(db, client_id, clone.user_id)
     
     # Increment interaction count
@@ -201,97 +316,340 @@ def process_message_with_agent(
         update_conversation_state(db, client_id, clone.user_id, **state)
     
     # === STEP 3: Generate rich context from memory ===
-    memory_context = MemoryService.generate_context_for_ray(memory)
+    # Static prefix (shared by every turn of this clone) + volatile context
+    # (memory, state, time) that goes after the history - see build_static_prompt
+    static_prompt = build_static_prompt(clone, unified)
+    volatile_context = build_volatile_context(MemoryService.generate_context_for_ray(memory), state)
     
-    context_str = f"""
-{memory_context}
-
-ESTADO DE LA CONVERSACIÓN ACTUAL:
-- Stage: {state.get('stage', 'INTAKE')}
-- Vehículo discutido: {state.get('vehicle_interest', 'No definido')}
-- Score mencionado: {state.get('credit_score', 'No definido')}
-- Documento: {state.get('doc_type', 'No definido')}
-- FECHA Y HORA ACTUAL: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (Usa esto para calcular "mañana", "lunes", etc)
-
-
-PERSONALIDAD PERSONALIZADA DEL USUARIO:
-{clone.personality or 'Usa el tono de Ray por defecto.'}
-
-INSTRUCCIÓN ESPECIAL DE MEMORIA:
-Si el cliente ya te dio información antes (ves arriba en MEMORIA DEL CLIENTE), 
-NO la pidas de nuevo. Usa lo que ya sabes para personalizar tu respuesta.
-Si hay objeciones previas, tenlas en cuenta al responder.
-"""
-    
-    # === STEP 4: Call OpenAI with full context ===
-    response_text, media_info = _call_openai_with_tools(
-        system_prompt=RAY_SYSTEM_PROMPT + "\n" + context_str,
-        user_message=buyer_message,
-        history=conversation_history,
-        db=db,
-        client_id=client_id,
-        user_id=clone.user_id
-    )
+    # === STEP 4: Cached reply for a repeated question, else call OpenAI ===
+    usage = new_usage()
+    # Callers may pass any amount of history: keep it within the token budget
+    conversation_history = pack_history(conversation_history)
+    usage["history_tokens"] = history_tokens(conversation_history)
+    mode = "unified" if unified else "classic"
+    scope = cache_scope(state, memory, conversation_history)
+    # A cached reply would skip the forced schedule_appointment call
+    use_cache = RESPONSE_CACHE_ENABLED and not wants_appointment(buyer_message)
+    cached = response_cache.lookup(clone.user_id, scope, buyer_message) if use_cache else None
     
-    # === STEP 5: Extract insights from buyer's message and update memory ===
-    try:
-        # Get existing memory as dict for context
-        existing_memory = {
-            "vehicles_interested": memory.vehicles_interested,
-            "preferred_budget_monthly": memory.preferred_budget_monthly,
-            "objections": memory.objections
-        }
-        
-        # Extract new insights from the buyer's message
-        insights = MemoryService.extract_insights_from_message(
-            buyer_message, 
-            existing_memory
+    if cached and cached.entry:
+        print(f"[SalesAgent] 💾 Cached reply ({cached.kind}, similarity {cached.similarity:.3f})")
+        response_text, media_info, mode = cached.entry.reply, None, "cache"
+        # Insights belong to the message: reusable only when it is the same message
+        insights = cached.entry.insights if cached.kind == "exact" else None
+    else:
+        response_text, media_info, insights = _call_openai_with_tools(
+            system_prompt=static_prompt,
+            context=volatile_context,
+            user_message=buyer_message,
+            history=conversation_history,
+            db=db,
+            client_id=client_id,
+            user_id=clone.user_id,
+            structured=unified,
+            usage=usage,
+            stream=reply_stream
         )
-        
-        # Apply insights to memory
-        if insights:
-            MemoryService.update_memory_from_insights(db, client_id, insights)
-    except Exception as e:
-        print(f"[SalesAgent] Error updating memory: {e}")
+        if cached and response_text != AGENT_ERROR_REPLY:
+            client = db.get(Client, client_id)
+            private_terms = (client.name or "").split() if client else []
+            if cacheable_reply(usage, media_info, response_text, private_terms):
+                response_cache.store(cached, response_text, usage, insights)
     
-    # === STEP 6: Calculate relationship score ===
-    try:
-        new_score = MemoryService.calculate_relationship_score(memory)
-        if memory.relationship_score != new_score:
-            memory.relationship_score = new_score
-            db.commit()
-    except Exception as e:
-        print(f"[SalesAgent] Error calculating relationship score: {e}")
+    first_message_ms = None
+    if reply_stream is not None:
+        reply_stream.finish(response_text)
+        first_message_ms = reply_stream.first_message_ms
     
+    reply_ms = (time.perf_counter() - started) * 1000
+    print(f"[SalesAgent] ⏱️ Reply ready in {reply_ms:.0f} ms ({mode}, {usage['llm_calls']} LLM calls, "
+          f"{usage['prompt_tokens']} prompt tokens of which {usage['history_tokens']} history, "
+          f"{usage['cached_tokens']} cached)"
+          + (f", first message at {first_message_ms:.0f} ms" if first_message_ms is not None else ""))
+    metric_id = record_turn(db, clone.user_id, client_id, mode, usage, reply_ms, first_message_ms)
+
+    # === STEP 5: Insights + relationship score, off the reply path ===
+    # (the client's next turn waits for this in STEP 1, so it sees the update)
+    memory_factory = sessionmaker(bind=db.get_bind(), autoflush=False)
+    if MEMORY_ASYNC:
+        submit_memory_update(client_id, buyer_message, memory_factory, insights, metric_id)
+    else:
+        apply_memory_update(client_id, buyer_message, memory_factory, insights, metric_id)
+
     return {
         "response": response_text,
         "confidence": 0.95,
         "stage": "RAY_V2_AUTO",
         "status_color": "green",
         "state_update": state,
-        "memory_updated": True,
+        "memory_updated": not MEMORY_ASYNC,  # Otherwise queued
+        "timings": {
+            "reply_ms": round(reply_ms, 1),
+            "first_message_ms": round(first_message_ms, 1) if first_message_ms is not None else None,
+        },
+        "agent_mode": mode,
+        "usage": usage,
+        "delivered": reply_stream.delivered if reply_stream is not None else None,
         "media_url": media_info.get("url") if media_info else None,
         "media_caption": media_info.get("caption") if media_info else None
     }
 
+
+def _parse_answer(content: Optional[str], structured: bool) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Split a unified-mode answer into (reply, insights). Insights are None when
+    the answer is not the expected JSON, so the memory worker extracts them
+    the classic way instead.
+    """
+    content = (content or "").strip()
+    if not structured:
+        return content, None
+    try:
+        data = json.loads(content)
+    except ValueError:
+        print("[SalesAgent] Unified answer was not JSON, sending it as text")
+        return content, None
+    reply = data.get("reply") if isinstance(data, dict) else None
+    if not isinstance(reply, str) or not reply.strip():
+        return content, None
+    memory = data.get("memory")
+    insights = {k: v for k, v in memory.items() if v not in (None, "", "null")} if isinstance(memory, dict) else {}
+    return reply.strip(), insights
+
+
+def _run_tool(
+    func_name: str,
+    func_args: Dict[str, Any],
+    session_factory: Callable[[], Session],
+    client_id: str,
+    user_id: str
+) -> Tuple[str, Optional[Dict[str, str]]]:
+    """
+    Execute one tool call. Runs on the tool pool next to the other calls of
+    its round, so it uses its own DB session.
+    Returns: (tool_output, media_info or None)
+    """
+    media_info = None
+    tool_output = "Error"
+    db = session_factory()
+    try:
+        if func_name == "calculate_payment":
+            # Default down payment logic
+            dp = func_args.get("down_payment")
+            if dp is None: dp = 2000.0
+
+            if func_args.get("plan_type") == "lease":
+                res = CalculatorService.calculate_lease(
+                    func_args.get("model_name"),
+                    func_args.get("credit_score", 650),
+                    dp
+                )
+            else:
+                res = CalculatorService.calculate_finance(
+                    func_args.get("model_name"),
+                    func_args.get("credit_score", 650),
+                    dp
+                )
+            tool_output = json.dumps(res)
+
+        elif func_name == "check_calendar":
+            tool_output = CalendarService.check_calendar()
+
+        elif func_name == "schedule_appointment":
+            # Call Calendar Service to create appointment
+            dt_iso = func_args.get("datetime_iso")
+            notes = func_args.get("notes", "")
+            client_name = func_args.get("client_name")
+
+            try:
+                from app.utils.calendar_service import CalendarService as CalSvc
+
+                appt = CalSvc.create_appointment(
+                    db=db,
+                    client_id=client_id,
+                    user_id=user_id,
+                    start_time=dt_iso,
+                    notes=notes,
+                    client_name=client_name
+                )
+                tool_output = json.dumps({
+                    "status": "success", 
+                    "appointment_id": appt.id, 
+                    "time": dt_iso,
+                    "message": "Cita agendada correctamente en base de datos."
+                })
+            except Exception as e:
+                print(f"[SalesAgent] Error scheduling appointment: {e}")
+                tool_output = json.dumps({"status": "error", "message": str(e)})
+
+        elif func_name == "send_vehicle_photos":
+            model_name = func_args.get("model_name")
+            print(f"[SalesAgent] Searching photo for: {model_name}")
+            if not model_name:
+                tool_output = "Error: No model name provided."
+            else:
+                # Improved Search Logic (Smart Match)
+                # We construct a full name "Make Model" and search against it.
+                clean_query = model_name.strip()
+
+                # 1. Try matching the combined "Make Model" (Best for "Honda Pilot", "Toyota Corolla")
+                items = db.query(InventoryItem).filter(
+                    InventoryItem.user_id == user_id,
+                    or_(
+                        # Match "Toyota Corolla" against "Toyota Corolla" (Make + Model)
+                        func.lower(func.concat(InventoryItem.make, " ", InventoryItem.model)).contains(clean_query.lower()),
+                        # Match "Corolla" against "Corolla" (Model only)
+                        InventoryItem.model.ilike(f"%{clean_query}%")
+                    )
+                ).limit(5).all()
+
+                # 2. Fallback: If no results, and query has spaces (e.g. "Pilot 2024"), try generic word match on MODEL only
+                if not items and " " in clean_query:
+                     words = clean_query.split()
+                     # Filter out common makes to avoid "Honda" -> "Ridgeline" issue
+                     # (Simple heuristic: if word in simple list of known makes, ignore it for model search)
+                     # actually, just search model for the last word often works (e.g. "Honda Pilot" -> "Pilot")
+                     last_word = words[-1]
+                     if len(last_word) > 2:
+                         items = db.query(InventoryItem).filter(
+                             InventoryItem.user_id == user_id,
+                             InventoryItem.model.ilike(f"%{last_word}%")
+                         ).limit(5).all()
+
+                # 3. Last Resort: Search by Make only (if user just said "Toyota")
+                # Only do this if the query is SHORT (likely just a brand)
+                if not items and len(clean_query.split()) == 1:
+                     items = db.query(InventoryItem).filter(
+                         InventoryItem.user_id == user_id,
+                         InventoryItem.make.ilike(f"%{clean_query}%")
+                     ).limit(5).all()
+
+                # Debug: log all found items
+                print(f"[SalesAgent] 🔍 Search for '{model_name}' found {len(items)} items")
+
+                # Pick best match (prefer one with image)
+                item = next((i for i in items if i.primary_image_url), None)
+
+                if item:
+                    # FOUND!
+                    caption = f"Aquí tienes el {item.year} {item.make} {item.model}. "
+                    if item.description:
+                        caption += f"\n\n{item.description[:200]}..."
+
+                    media_info = {
+                        # Resized/recompressed variant: faster bridge download and delivery
+                        "url": variant_url(item.primary_image_url),
+                        "caption": caption
+                    }
+                    print(f"[SalesAgent] 🖼️ MEDIA FOUND: {item.primary_image_url[:50]}...")
+                    tool_output = json.dumps({
+                        "status": "success",
+                        "message": "Hidden success: Image URL found and will be sent by system.", 
+                        "found_model": f"{item.year} {item.model}"
+                    })
+                else:
+                    tool_output = json.dumps({
+                        "status": "not_found",
+                        "message": f"No photos found for {model_name} in inventory. Tell the user you will check specifically."
+                    })
+    finally:
+        db.close()
+    return tool_output, media_info
+
+
+def _execute_tool_calls(
+    tool_calls: List[Any],
+    session_factory: Callable[[], Session],
+    client_id: str,
+    user_id: str
+) -> Tuple[List[dict], Optional[Dict[str, str]]]:
+    """
+    Run one round of tool calls concurrently on the bounded tool pool.
+    Each call gets its own timeout (counted from the start of the round, so
+    the round takes as long as its slowest tool, capped). Results come back
+    in tool-call order whatever order they finish in.
+    """
+    started = time.perf_counter()
+    futures = []
+    for tool_call in tool_calls:
+        try:
+            func_args = json.loads(tool_call.function.arguments or "{}")
+        except ValueError:
+            futures.append(None)
+            continue
+        futures.append(_tool_pool.submit(
+            _run_tool, tool_call.function.name, func_args, session_factory, client_id, user_id
+        ))
+    
+    tool_messages = []
+    media_info = None
+    for tool_call, future in zip(tool_calls, futures):
+        func_name = tool_call.function.name
+        timeout = TOOL_TIMEOUTS.get(func_name, TOOL_TIMEOUT_SECONDS)
+        if future is None:
+            tool_output = json.dumps({"status": "error", "message": "Invalid tool arguments"})
+        else:
+            try:
+                tool_output, found_media = future.result(timeout=max(0.0, started + timeout - time.perf_counter()))
+                media_info = media_info or found_media
+            except FutureTimeout:
+                print(f"[SalesAgent] ⏱️ Tool {func_name} timed out after {timeout:.0f}s")
+                tool_output = json.dumps({
+                    "status": "timeout",
+                    "message": f"{func_name} is taking too long. Tell the user you will confirm shortly."
+                })
+            except Exception as e:
+                print(f"[SalesAgent] Tool {func_name} failed: {e}")
+                tool_output = json.dumps({"status": "error", "message": str(e)})
+        
+        tool_messages.append({
+            "tool_call_id": tool_call.id,
+            "role": "tool",
+            "name": func_name,
+            "content": tool_output
+        })
+    
+    print(f"[SalesAgent] {len(tool_calls)} tools done in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return tool_messages, media_info
+
+
 def _call_openai_with_tools(
     system_prompt: str, 
     user_message: str, 
     history: Optional[List[dict]],
     db: Session = None,
     client_id: str = None,
-    user_id: str = None
-) -> Tuple[str, Optional[Dict[str, str]]]:
+    user_id: str = None,
+    structured: bool = False,
+    usage: Optional[Dict[str, int]] = None,
+    context: Optional[str] = None,
+    stream: Optional[ReplyStream] = None
+) -> Tuple[str, Optional[Dict[str, str]], Optional[Dict[str, Any]]]:
     """
     Call OpenAI API with Tools. 
-    Returns: (response_text, media_info_dict)
+    `context` (per-turn memory/state) goes after the history, keeping the
+    system prompt + history a cacheable prefix.
+    With `structured`, answers are JSON carrying the reply plus memory insights.
+    With `stream`, completions are streamed and their text handed to it.
+    Returns: (response_text, media_info_dict, insights or None)
     """
     media_info = None # Store image info if tool finds one
     
-    if not OPENAI_API_KEY:
-        return "Error: OPENAI_API_KEY missing.", None
+    if not llm_available():
+        return "Error: OPENAI_API_KEY missing.", None, None
     
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    session_factory = sessionmaker(bind=db.get_bind(), autoflush=False) if db is not None else SessionLocal
+    
+    # Same key for the whole clone -> requests land where its prefix is cached
+    request_options = {"prompt_cache_key": f"ray:{user_id}"}
+    if structured:
+        # JSON answers only when the model replies; tool calls are unaffected
+        request_options["response_format"] = {"type": "json_object"}
+    
+    def complete(**kwargs):
+        if stream is None:
+            return chat_completion(**kwargs)
+        return chat_completion_stream(stream.on_text, **kwargs)
     
     messages = [{"role": "system", "content": system_prompt}]
     
@@ -300,19 +658,12 @@ def _call_openai_with_tools(
             role = "user" if msg.get("role") == "buyer" else "assistant"
             messages.append({"role": role, "content": msg.get("text", "")})
     
+    if context:
+        messages.append({"role": "system", "content": context})
     messages.append({"role": "user", "content": user_message})
     
     # === APPOINTMENT & PHOTO KEYWORD DETECTION ===
-    user_msg_lower = user_message.lower()
-    
-    appointment_keywords = [
-        "cita", "agenda", "agéndame", "agendame", "appointment",
-        "mañana", "lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo",
-        "10am", "10:00", "11am", "2pm", "3pm", "4pm", "5pm",
-        "a las", "para el", "para mañana", "nos vemos"
-    ]
-    
-    should_force_appointment = any(kw in user_msg_lower for kw in appointment_keywords)
+    should_force_appointment = wants_appointment(user_message)
     
     # REMOVED: Aggressive photo forcing. Let the AI decide based on context.
     
@@ -325,164 +676,54 @@ def _call_openai_with_tools(
     
     try:
         # First call with dynamic tool choice
-        response = client.chat.completions.create(
+        response = complete(
             model="gpt-4o-mini",
             messages=messages,
             tools=RAY_TOOLS,
             tool_choice=tool_choice_param,
-            temperature=0.3
+            temperature=0.3,
+            **request_options
         )
+        add_usage(usage, response)
         
         response_msg = response.choices[0].message
         print(f"[SalesAgent] OpenAI Response: {response_msg.content}")
         print(f"[SalesAgent] Tool Calls: {response_msg.tool_calls}")
         
-        # Tool execution loop
-        if response_msg.tool_calls:
-            print(f"[SalesAgent] Executing {len(response_msg.tool_calls)} tools...")
+        # Tool loop: a round's calls run in parallel, results go back to the model,
+        # which may ask for another round (up to MAX_TOOL_ROUNDS)
+        rounds = 0
+        while response_msg.tool_calls:
+            rounds += 1
+            print(f"[SalesAgent] Executing {len(response_msg.tool_calls)} tools (round {rounds})...")
+            if usage is not None:
+                usage["tool_calls"] = usage.get("tool_calls", 0) + len(response_msg.tool_calls)
+                usage.setdefault("tools", []).extend(tc.function.name for tc in response_msg.tool_calls)
             messages.append(response_msg)
             
-            for tool_call in response_msg.tool_calls:
-                func_name = tool_call.function.name
-                func_args = json.loads(tool_call.function.arguments)
-                tool_output = "Error"
-                
-                if func_name == "calculate_payment":
-                    # Default down payment logic
-                    dp = func_args.get("down_payment")
-                    if dp is None: dp = 2000.0
-                    
-                    if func_args.get("plan_type") == "lease":
-                        res = CalculatorService.calculate_lease(
-                            func_args.get("model_name"),
-                            func_args.get("credit_score", 650),
-                            dp
-                        )
-                    else:
-                        res = CalculatorService.calculate_finance(
-                            func_args.get("model_name"),
-                            func_args.get("credit_score", 650),
-                            dp
-                        )
-                    tool_output = json.dumps(res)
-                    
-                elif func_name == "check_calendar":
-                    tool_output = CalendarService.check_calendar()
-                    
-                elif func_name == "schedule_appointment":
-                    # Call Calendar Service to create appointment
-                    dt_iso = func_args.get("datetime_iso")
-                    notes = func_args.get("notes", "")
-                    client_name = func_args.get("client_name")
-                    
-                    try:
-                        from app.utils.calendar_service import CalendarService as CalSvc
-                        
-                        appt = CalSvc.create_appointment(
-                            db=db,
-                            client_id=client_id,
-                            user_id=user_id,
-                            start_time=dt_iso,
-                            notes=notes,
-                            client_name=client_name
-                        )
-                        tool_output = json.dumps({
-                            "status": "success", 
-                            "appointment_id": appt.id, 
-                            "time": dt_iso,
-                            "message": "Cita agendada correctamente en base de datos."
-                        })
-                    except Exception as e:
-                        print(f"[SalesAgent] Error scheduling appointment: {e}")
-                        tool_output = json.dumps({"status": "error", "message": str(e)})
-
-                elif func_name == "send_vehicle_photos":
-                    model_name = func_args.get("model_name")
-                    print(f"[SalesAgent] Searching photo for: {model_name}")
-                    if not model_name:
-                        tool_output = "Error: No model name provided."
-                    else:
-                        # Improved Search Logic (Smart Match)
-                        # We construct a full name "Make Model" and search against it.
-                        clean_query = model_name.strip()
-                        
-                        # 1. Try matching the combined "Make Model" (Best for "Honda Pilot", "Toyota Corolla")
-                        items = db.query(InventoryItem).filter(
-                            InventoryItem.user_id == user_id,
-                            or_(
-                                # Match "Toyota Corolla" against "Toyota Corolla" (Make + Model)
-                                func.lower(func.concat(InventoryItem.make, " ", InventoryItem.model)).contains(clean_query.lower()),
-                                # Match "Corolla" against "Corolla" (Model only)
-                                InventoryItem.model.ilike(f"%{clean_query}%")
-                            )
-                        ).limit(5).all()
-
-                        # 2. Fallback: If no results, and query has spaces (e.g. "Pilot 2024"), try generic word match on MODEL only
-                        if not items and " " in clean_query:
-                             words = clean_query.split()
-                             # Filter out common makes to avoid "Honda" -> "Ridgeline" issue
-                             # (Simple heuristic: if word in simple list of known makes, ignore it for model search)
-                             # actually, just search model for the last word often works (e.g. "Honda Pilot" -> "Pilot")
-                             last_word = words[-1]
-                             if len(last_word) > 2:
-                                 items = db.query(InventoryItem).filter(
-                                     InventoryItem.user_id == user_id,
-                                     InventoryItem.model.ilike(f"%{last_word}%")
-                                 ).limit(5).all()
-
-                        # 3. Last Resort: Search by Make only (if user just said "Toyota")
-                        # Only do this if the query is SHORT (likely just a brand)
-                        if not items and len(clean_query.split()) == 1:
-                             items = db.query(InventoryItem).filter(
-                                 InventoryItem.user_id == user_id,
-                                 InventoryItem.make.ilike(f"%{clean_query}%")
-                             ).limit(5).all()
-                        
-                        # Debug: log all found items
-                        print(f"[SalesAgent] 🔍 Search for '{model_name}' found {len(items)} items")
-                        
-                        # Pick best match (prefer one with image)
-                        item = next((i for i in items if i.primary_image_url), None)
-                        
-                        if item:
-                            # FOUND!
-                            caption = f"Aquí tienes el {item.year} {item.make} {item.model}. "
-                            if item.description:
-                                caption += f"\n\n{item.description[:200]}..."
-                            
-                            media_info = {
-                                "url": item.primary_image_url,
-                                "caption": caption
-                            }
-                            print(f"[SalesAgent] 🖼️ MEDIA FOUND: {item.primary_image_url[:50]}...")
-                            tool_output = json.dumps({
-                                "status": "success",
-                                "message": "Hidden success: Image URL found and will be sent by system.", 
-                                "found_model": f"{item.year} {item.model}"
-                            })
-                        else:
-                            tool_output = json.dumps({
-                                "status": "not_found",
-                                "message": f"No photos found for {model_name} in inventory. Tell the user you will check specifically."
-                            })
-                
-                messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": func_name,
-                    "content": tool_output
-                })
+            tool_messages, found_media = _execute_tool_calls(
+                response_msg.tool_calls, session_factory, client_id, user_id
+            )
+            messages.extend(tool_messages)
+            media_info = media_info or found_media
             
-            # Second call for final answer
-            final_res = client.chat.completions.create(
+            # Next answer; the last allowed round has to answer without tools
+            more_tools = {"tools": RAY_TOOLS, "tool_choice": "auto"} if rounds < MAX_TOOL_ROUNDS else {}
+            if stream is not None:
+                stream.next_round()
+            response = complete(
                 model="gpt-4o-mini",
                 messages=messages,
-                temperature=0.7
+                temperature=0.7,
+                **more_tools,
+                **request_options
             )
-            return final_res.choices[0].message.content.strip(), media_info
+            add_usage(usage, response)
+            response_msg = response.choices[0].message
             
-        return response_msg.content.strip(), media_info
+        text, insights = _parse_answer(response_msg.content, structured)
+        return text, media_info, insights
 
     except Exception as e:
         print(f"[SalesAgent] Error: {e}")
-        return "Hubo un error procesando tu solicitud. Intenta de nuevo.", None
+        return AGENT_ERROR_REPLY, None, None
@@ -0,0 +1,93 @@
+"""
+Benchmark: time-to-reply of one RAY agent turn.
+
+Runs process_message_with_agent against a throwaway SQLite database on the
+stub LLM provider, which sleeps instead of calling OpenAI (so the numbers
+show the shape of the critical path, not OpenAI's mood), and times:
+  - inline:     insight extraction + relationship score before returning
+  - background: the same work queued on the memory worker
+  - unified:    reply + memory fields in one structured answer (no extraction call)
+
+Usage:
+    python benchmarks/bench_agent_turn.py [--reply-ms 900] [--extract-ms 700] [--turns 10] [--gap-ms 1500]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.models import AgentTurnMetric, Client, SalesClone, User
+from app.services import memory_worker
+from app.services.agent_metrics import summarize_turns
+from app.services.llm_client import set_provider
+from app.services.llm_providers import StubProvider
+from app.utils import sales_agent
+
+
+def stub_llm(reply_ms: float, extract_ms: float) -> StubProvider:
+    reply = "¡Claro! ¿Qué día te queda mejor para verlo?"
+    insights = {"budget_monthly": 450, "sentiment": "positive"}
+    return StubProvider(script=[
+        {"system": r"^Extraes información", "content": json.dumps(insights), "latency_ms": extract_ms},
+        {"reply": reply, "memory": insights},  # Plain text, or JSON in unified mode
+    ], latency_ms=reply_ms)
+
+
+def run(label: str, db, clone, turns: int, background: bool, gap_ms: float, mode: str = "classic"):
+    sales_agent.MEMORY_ASYNC = background
+    sales_agent.AGENT_MODE = mode
+    db.query(AgentTurnMetric).delete()
+    db.commit()
+    samples = []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        sales_agent.process_message_with_agent(db, clone, "bench-client", f"Me interesa un Corolla, mensaje {i}")
+        samples.append((time.perf_counter() - t0) * 1000)
+        time.sleep(gap_ms / 1000)  # Buyer reads and types
+    memory_worker.wait_for_client("bench-client")
+    db.expire_all()
+    cost = summarize_turns(db, "bench-user")["modes"][mode]
+    samples.sort()
+    print(f"{label:<11} median {samples[len(samples) // 2]:8.1f} ms   min {samples[0]:8.1f} ms   "
+          f"{cost['avg_llm_calls']:.1f} calls/turn   {cost['avg_tokens']:.0f} tokens/turn")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reply-ms", type=float, default=900)
+    parser.add_argument("--extract-ms", type=float, default=700)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--gap-ms", type=float, default=1500, help="pause between buyer messages")
+    args = parser.parse_args()
+
+    set_provider(stub_llm(args.reply_ms, args.extract_ms))
+    sales_agent.RESPONSE_CACHE_ENABLED = False  # Every turn should reach the (stub) LLM
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False)()
+    db.add(User(id="bench-user", email="bench@example.com", password_hash="x", name="Bench"))
+    db.add(Client(id="bench-client", user_id="bench-user", name="Bench", phone="5550000000"))
+    clone = SalesClone(user_id="bench-user")
+    db.add(clone)
+    db.commit()
+
+    # With --gap-ms 0 each turn waits for the previous update (worst case)
+    print(f"Stub LLM: reply {args.reply_ms:.0f} ms, extraction {args.extract_ms:.0f} ms, gap {args.gap_ms:.0f} ms")
+    run("inline", db, clone, args.turns, background=False, gap_ms=args.gap_ms)
+    run("background", db, clone, args.turns, background=True, gap_ms=args.gap_ms)
+    run("unified", db, clone, args.turns, background=True, gap_ms=args.gap_ms, mode="unified")
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: /analytics/dashboard latency on a large account.
+
+Seeds a throwaway SQLite database with one user, 6 pipeline tags, 20k clients
+and N messages (default 1M) spread over the last 90 days, then times:
+  - legacy: one COUNT per tag + three scans over messages + next() per day
+  - rollup:  build_dashboard_metrics (grouped tag query + message_daily_stats)
+  - cached: the TTL cache hit served by the endpoint
+
+Usage:
+    python benchmarks/bench_dashboard.py [--messages 1000000] [--db /tmp/bench_dashboard.db]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, case, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base
+from app.models import User, Client, Tag, ClientTag, Message, DEFAULT_TAGS, get_uuid
+from app.routers.analytics import build_dashboard_metrics
+from app.services.message_stats import rebuild_daily_stats
+from app.utils.cache import dashboard_cache
+
+
+def seed(db, n_messages: int, n_clients: int = 20000):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email="bench@example.com", password_hash="x", name="Bench"))
+    tag_ids = []
+    for tag_data in DEFAULT_TAGS:
+        tag_id = get_uuid()
+        tag_ids.append(tag_id)
+        db.add(Tag(id=tag_id, user_id=user_id, name=tag_data["name"], color=tag_data["color"], order=tag_data["order"]))
+    db.commit()
+
+    client_ids = [get_uuid() for _ in range(n_clients)]
+    db.execute(insert(Client), [
+        {"id": cid, "user_id": user_id, "name": f"Client {i}", "phone": f"555{i:07d}"}
+        for i, cid in enumerate(client_ids)
+    ])
+    db.execute(insert(ClientTag), [
+        {"id": get_uuid(), "client_id": cid, "tag_id": random.choice(tag_ids)}
+        for cid in client_ids
+    ])
+    db.commit()
+
+    now = datetime.utcnow()
+    batch = 50000
+    for start in range(0, n_messages, batch):
+        rows = []
+        for _ in range(min(batch, n_messages - start)):
+            rows.append({
+                "id": get_uuid(),
+                "user_id": user_id,
+                "client_id": random.choice(client_ids),
+                "phone": "5550000000",
+                "direction": random.choice(("inbound", "outbound")),
+                "content": "Hola, me interesa el Corolla",
+                "status": "sent",
+                "sent_at": now - timedelta(seconds=random.randint(0, 90 * 86400)),
+            })
+        db.execute(insert(Message), rows)
+        db.commit()
+    return user_id
+
+
+def legacy_dashboard(db, user_id: str):
+    """Replica of the pre-optimization endpoint body, for comparison"""
+    user_tags = db.query(Tag).filter(Tag.user_id == user_id).order_by(Tag.order).all()
+    pipeline = []
+    for tag in user_tags:
+        count = db.query(func.count(ClientTag.client_id)).filter(ClientTag.tag_id == tag.id).scalar()
+        pipeline.append({"tag_id": tag.id, "count": count})
+    db.query(Client).filter(Client.user_id == user_id).count()
+    thirty = datetime.utcnow() - timedelta(days=30)
+    db.query(Message).filter(Message.user_id == user_id, Message.direction == "outbound", Message.sent_at >= thirty).count()
+    db.query(Message).filter(Message.user_id == user_id, Message.direction == "inbound", Message.sent_at >= thirty).count()
+    seven = datetime.utcnow() - timedelta(days=7)
+    daily = db.query(
+        func.date(Message.sent_at).label("date"),
+        func.sum(case((Message.direction == "outbound", 1), else_=0)).label("sent"),
+        func.sum(case((Message.direction == "inbound", 1), else_=0)).label("received"),
+    ).filter(Message.user_id == user_id, Message.sent_at >= seven).group_by(func.date(Message.sent_at)).all()
+    for i in range(7):
+        day = (datetime.utcnow() - timedelta(days=6 - i)).date()
+        next((s for s in daily if s.date == day), None)
+    return pipeline
+
+
+def timed(label: str, fn, repeat: int = 5):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"{label:<10} median {samples[len(samples) // 2]:9.2f} ms   min {samples[0]:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/bench_dashboard.db")
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine(f"sqlite:///{args.db}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    t0 = time.perf_counter()
+    user_id = seed(db, args.messages)
+    print(f"Seeded {args.messages:,} messages in {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    rollup_rows = rebuild_daily_stats(db, user_id)
+    print(f"Rebuilt {rollup_rows} rollup rows in {time.perf_counter() - t0:.1f}s")
+
+    timed("legacy", lambda: legacy_dashboard(db, user_id))
+    timed("rollup", lambda: build_dashboard_metrics(db, user_id))
+
+    dashboard_cache.set(user_id, build_dashboard_metrics(db, user_id))
+    timed("cached", lambda: dashboard_cache.get(user_id), repeat=1000)
+
+    db.close()
+    os.remove(args.db)
+
+
+if __name__ == "__main__":
+    main()
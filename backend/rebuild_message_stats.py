@@ -0,0 +1,32 @@
+"""
+Rebuild the message_daily_stats rollup table from message history.
+Run after restoring a backup or if rollups ever drift from `messages`.
+
+Usage:
+    python rebuild_message_stats.py            # all users
+    python rebuild_message_stats.py <user_id>  # single user
+"""
+import sys
+sys.path.insert(0, '.')
+
+from app.db.session import engine, SessionLocal
+from app.models import MessageDailyStat
+from app.services.message_stats import rebuild_daily_stats
+
+def rebuild(user_id: str = None):
+    MessageDailyStat.__table__.create(bind=engine, checkfirst=True)
+    
+    db = SessionLocal()
+    try:
+        scope = f"user {user_id}" if user_id else "all users"
+        print(f"[Rollup] Rebuilding message_daily_stats for {scope}...")
+        rows = rebuild_daily_stats(db, user_id)
+        print(f"[Rollup] ✅ Done. {rows} rollup rows written.")
+    except Exception as e:
+        print(f"[Rollup] Rebuild failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    rebuild(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,36 @@
+"""Shared fixtures: a fresh in-memory database per test, and a seller + buyer + sales clone seed"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.models import Client, SalesClone, User
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def seed_clone(db):
+    """seed_clone("x") adds user u-x, client c-x and returns the user's SalesClone"""
+    def seed(suffix, client_name="Buyer", phone="5551234567"):
+        db.add(User(id=f"u-{suffix}", email=f"{suffix}@example.com", password_hash="x", name="Seller"))
+        db.add(Client(id=f"c-{suffix}", user_id=f"u-{suffix}", name=client_name, phone=phone))
+        clone = SalesClone(user_id=f"u-{suffix}")
+        db.add(clone)
+        db.commit()
+        return clone
+    return seed
@@ -0,0 +1,114 @@
+import json
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.utils import sales_agent
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSession = sessionmaker(bind=engine, autoflush=False)
+Base.metadata.create_all(bind=engine)
+
+
+def _tool_call(call_id, name, **args):
+    return SimpleNamespace(id=call_id, type="function", function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+
+def _completion(content=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def _slow_tools(delays):
+    def run_tool(func_name, func_args, session_factory, client_id, user_id):
+        time.sleep(delays[func_args["key"]])
+        return f"{func_name}:{func_args['key']}", None
+    return run_tool
+
+
+def test_round_runs_in_parallel_and_keeps_call_order(monkeypatch):
+    monkeypatch.setattr(sales_agent, "_run_tool", _slow_tools({"a": 0.3, "b": 0.1, "c": 0.2}))
+    calls = [
+        _tool_call("1", "calculate_payment", key="a"),
+        _tool_call("2", "calculate_payment", key="b"),
+        _tool_call("3", "check_calendar", key="c"),
+    ]
+
+    started = time.perf_counter()
+    messages, media = sales_agent._execute_tool_calls(calls, TestingSession, "c1", "u1")
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.5  # Serial would be 0.6s
+    assert [m["tool_call_id"] for m in messages] == ["1", "2", "3"]
+    assert [m["content"] for m in messages] == ["calculate_payment:a", "calculate_payment:b", "check_calendar:c"]
+    assert media is None
+
+
+def test_slow_tool_times_out_without_holding_the_round(monkeypatch):
+    monkeypatch.setattr(sales_agent, "_run_tool", _slow_tools({"slow": 1.0, "fast": 0.0}))
+    monkeypatch.setitem(sales_agent.TOOL_TIMEOUTS, "check_calendar", 0.2)
+    calls = [_tool_call("1", "check_calendar", key="slow"), _tool_call("2", "calculate_payment", key="fast")]
+    broken = SimpleNamespace(id="3", type="function", function=SimpleNamespace(name="check_calendar", arguments="{oops"))
+
+    started = time.perf_counter()
+    messages, _ = sales_agent._execute_tool_calls(calls + [broken], TestingSession, "c1", "u1")
+    assert time.perf_counter() - started < 0.6
+
+    assert json.loads(messages[0]["content"])["status"] == "timeout"
+    assert messages[1]["content"] == "calculate_payment:fast"
+    assert json.loads(messages[2]["content"])["status"] == "error"
+
+
+def test_multi_round_tool_loop(monkeypatch):
+    replies = [
+        _completion(tool_calls=[_tool_call("1", "check_calendar")]),
+        _completion(tool_calls=[_tool_call("2", "calculate_payment", model_name="Corolla", plan_type="finance")]),
+        _completion("Tengo mañana a las 10am y el Corolla te queda en $389/mes."),
+    ]
+    seen = []
+
+    def fake_chat(**kwargs):
+        seen.append(kwargs)
+        return replies.pop(0)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+    monkeypatch.setattr(sales_agent.CalendarService, "check_calendar", staticmethod(lambda: "Mañana 10am libre"))
+
+    usage = {}
+    db = TestingSession()
+    text, media, _ = sales_agent._call_openai_with_tools(
+        "system", "Qué horario tienes y cuánto sale el Corolla?", None, db=db, client_id="c1", user_id="u1", usage=usage
+    )
+    db.close()
+
+    assert text.startswith("Tengo mañana")
+    assert usage["llm_calls"] == 3 and usage["tools"] == ["check_calendar", "calculate_payment"]
+    # Rounds after the first may still use tools; results are threaded back in order
+    assert "tools" in seen[1] and "tools" in seen[2]
+    tool_results = [m for m in seen[2]["messages"] if isinstance(m, dict) and m.get("role") == "tool"]
+    assert [m["tool_call_id"] for m in tool_results] == ["1", "2"]
+
+
+def test_last_round_is_forced_to_answer(monkeypatch):
+    monkeypatch.setattr(sales_agent, "MAX_TOOL_ROUNDS", 1)
+    replies = [_completion(tool_calls=[_tool_call("1", "check_calendar")]), _completion("Mañana a las 10am")]
+    seen = []
+
+    def fake_chat(**kwargs):
+        seen.append(kwargs)
+        return replies.pop(0)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+    monkeypatch.setattr(sales_agent.CalendarService, "check_calendar", staticmethod(lambda: "Mañana 10am libre"))
+
+    db = TestingSession()
+    text, _, _ = sales_agent._call_openai_with_tools("system", "Horarios?", None, db=db, client_id="c1", user_id="u1")
+    db.close()
+    assert text == "Mañana a las 10am"
+    assert "tools" not in seen[1]
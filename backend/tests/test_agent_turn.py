@@ -0,0 +1,126 @@
+import json
+from types import SimpleNamespace
+
+from app.models import AgentTurnMetric, ClientMemory
+from app.services import memory_service, memory_worker
+from app.services.agent_metrics import summarize_turns
+from app.utils import sales_agent
+
+
+def _completion(content=None, tool_calls=None):
+    message = SimpleNamespace(content=content, tool_calls=tool_calls)
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=20, total_tokens=120)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def _tool_call():
+    function = SimpleNamespace(name="check_calendar", arguments="{}")
+    return SimpleNamespace(id="call_1", type="function", function=function)
+
+
+def _setup(monkeypatch, mode, replies):
+    calls = []
+
+    def fake_chat(**kwargs):
+        is_extraction = "Extraes información" in kwargs["messages"][0]["content"]
+        calls.append("extract" if is_extraction else "agent")
+        if is_extraction:
+            return _completion(json.dumps({"budget_monthly": 300}))
+        return replies.pop(0)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "AGENT_MODE", mode)
+    monkeypatch.setattr(sales_agent, "MEMORY_ASYNC", False)
+    monkeypatch.setattr(sales_agent, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+    monkeypatch.setattr(memory_service, "chat_completion", fake_chat)
+    monkeypatch.setattr(sales_agent.CalendarService, "check_calendar", staticmethod(lambda: "Mañana 10am libre"))
+    return calls
+
+
+def test_unified_turn_is_one_call_and_updates_memory(monkeypatch, db, seed_clone):
+    answer = json.dumps({"reply": "¡Perfecto! ¿Lease o financiado?", "memory": {"budget_monthly": 450, "objection": None}})
+    calls = _setup(monkeypatch, "unified", [_completion(answer)])
+    clone = seed_clone("unified")
+
+    result = sales_agent.process_message_with_agent(db, clone, "c-unified", "Quiero pagar 450 al mes")
+    assert result["response"] == "¡Perfecto! ¿Lease o financiado?"
+    assert result["agent_mode"] == "unified"
+    assert calls == ["agent"]
+
+    memory = db.query(ClientMemory).filter(ClientMemory.client_id == "c-unified").one()
+    db.refresh(memory)
+    assert memory.preferred_budget_monthly == 450
+
+    metric = db.query(AgentTurnMetric).filter(AgentTurnMetric.client_id == "c-unified").one()
+    assert (metric.mode, metric.llm_calls, metric.total_tokens, metric.memory_llm_calls) == ("unified", 1, 120, 0)
+
+
+def test_unified_turn_with_tools_and_non_json_fallback(monkeypatch, db, seed_clone):
+    replies = [_completion(tool_calls=[_tool_call()]), _completion("Tengo mañana a las 10am")]
+    calls = _setup(monkeypatch, "unified", replies)
+    clone = seed_clone("tools")
+
+    result = sales_agent.process_message_with_agent(db, clone, "c-tools", "Qué horarios tienes?")
+    # Not JSON: sent as-is, and the worker falls back to its own extraction
+    assert result["response"] == "Tengo mañana a las 10am"
+    assert calls == ["agent", "agent", "extract"]
+
+    metric = db.query(AgentTurnMetric).filter(AgentTurnMetric.client_id == "c-tools").one()
+    db.refresh(metric)
+    assert (metric.llm_calls, metric.tool_calls, metric.memory_llm_calls, metric.memory_tokens) == (2, 1, 1, 120)
+
+
+def test_classic_turn_metrics_are_comparable(monkeypatch, db, seed_clone):
+    calls = _setup(monkeypatch, "classic", [_completion("Hola, ¿qué modelo buscas?")])
+    clone = seed_clone("classic")
+
+    sales_agent.process_message_with_agent(db, clone, "c-classic", "Hola")
+    assert calls == ["agent", "extract"]
+    summary = summarize_turns(db, "u-classic")
+    assert summary["modes"]["classic"]["turns"] == 1
+    assert summary["modes"]["classic"]["avg_llm_calls"] == 2
+    assert summary["modes"]["classic"]["avg_tokens"] == 240
+    assert memory_worker.wait_for_client("c-classic")
+
+
+def test_prompt_prefix_is_stable_across_turns(monkeypatch, db, seed_clone):
+    seen = []
+
+    def fake_chat(**kwargs):
+        seen.append(kwargs)
+        usage = SimpleNamespace(
+            prompt_tokens=2000, completion_tokens=30, total_tokens=2030,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=1536 if len(seen) > 1 else 0)
+        )
+        answer = json.dumps({"reply": f"Respuesta {len(seen)}", "memory": {}})
+        message = SimpleNamespace(content=answer, tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    _setup(monkeypatch, "unified", [])
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+    clone = seed_clone("prefix")
+
+    history = []
+    for text in ("Hola", "Busco un RAV4", "Puedo dar 3000 de enganche"):
+        result = sales_agent.process_message_with_agent(db, clone, "c-prefix", text, list(history))
+        history += [{"role": "buyer", "text": text}, {"role": "clone", "text": result["response"]}]
+
+    first, last = seen[0]["messages"], seen[-1]["messages"]
+    # Static system prompt, then the earlier turns unchanged: a shared prefix
+    assert first[0] == last[0]
+    assert [m["content"] for m in last[1:5]] == ["Hola", "Respuesta 1", "Busco un RAV4", "Respuesta 2"]
+    # Per-turn context sits right before the buyer message
+    assert last[-2]["role"] == "system" and "ESTADO DE LA CONVERSACIÓN" in last[-2]["content"]
+    assert "ESTADO DE LA CONVERSACIÓN" not in last[0]["content"]
+    assert seen[0]["prompt_cache_key"] == "ray:u-prefix"
+
+    summary = summarize_turns(db, "u-prefix")["modes"]["unified"]
+    assert summary["cached_token_rate"] == round(2 * 1536 / 6000, 3)
+
+
+def test_volatile_context_time_is_coarse():
+    from datetime import datetime
+    a = sales_agent.build_volatile_context("MEMORIA", {}, datetime(2026, 3, 2, 15, 4, 59))
+    b = sales_agent.build_volatile_context("MEMORIA", {}, datetime(2026, 3, 2, 15, 58, 1))
+    assert a == b and "2026-03-02 15:00" in a
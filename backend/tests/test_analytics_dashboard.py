@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, Tag, ClientTag, Message, get_uuid
+from app.routers.analytics import build_dashboard_metrics
+from app.utils.cache import TTLCache, dashboard_cache, invalidate_dashboard
+from app.services.message_stats import StatsBatch, record_message, rebuild_daily_stats, get_daily_totals
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _seed(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    won = Tag(id=get_uuid(), user_id=user_id, name="Compró", order=1)
+    empty = Tag(id=get_uuid(), user_id=user_id, name="Perdido", order=2)
+    db.add_all([won, empty])
+    clients = [Client(id=get_uuid(), user_id=user_id, name=f"C{i}", phone=f"555{i}") for i in range(4)]
+    db.add_all(clients)
+    db.flush()
+    db.add(ClientTag(id=get_uuid(), client_id=clients[0].id, tag_id=won.id))
+
+    now = datetime.utcnow()
+    for direction, age_days in [("outbound", 0), ("outbound", 1), ("inbound", 1), ("inbound", 20), ("inbound", 45)]:
+        db.add(Message(
+            id=get_uuid(), user_id=user_id, client_id=clients[0].id, phone="555",
+            direction=direction, content="hola", sent_at=now - timedelta(days=age_days)
+        ))
+    db.commit()
+    rebuild_daily_stats(db, user_id)
+    return user_id
+
+
+def test_dashboard_counts():
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    data = build_dashboard_metrics(db, user_id)
+
+    assert [p["tag_name"] for p in data["pipeline"]] == ["Compró", "Perdido"]
+    assert [p["count"] for p in data["pipeline"]] == [1, 0]
+    assert data["total_clients"] == 4
+    assert data["messages"] == {"sent_30d": 2, "received_30d": 2, "total": 4}
+    assert len(data["activity_chart"]) == 7
+    today = data["activity_chart"][-1]
+    assert today["date"] == datetime.utcnow().strftime("%Y-%m-%d")
+    assert today["sent"] == 1
+    assert data["conversion_rate"] == 25.0
+    db.close()
+
+
+def test_incremental_rollup_matches_rebuild():
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+    record_message(db, user_id, "inbound")
+    record_message(db, user_id, "outbound", ai_generated=True)
+    db.add(Message(id=get_uuid(), user_id=user_id, phone="555", direction="inbound", content="x"))
+    db.add(Message(id=get_uuid(), user_id=user_id, phone="555", direction="outbound", content="y", ai_generated=True))
+    db.commit()
+
+    since = (datetime.utcnow() - timedelta(days=60)).date()
+    incremental = {(str(r.day), r.sent, r.received) for r in get_daily_totals(db, user_id, since)}
+    rebuild_daily_stats(db, user_id)
+    rebuilt = {(str(r.day), r.sent, r.received) for r in get_daily_totals(db, user_id, since)}
+    assert incremental == rebuilt
+    db.close()
+
+
+def test_dashboard_cache_invalidation():
+    dashboard_cache.set("user-1", {"total_clients": 1})
+    assert dashboard_cache.get("user-1") == {"total_clients": 1}
+    invalidate_dashboard("user-1")
+    assert dashboard_cache.get("user-1") is None
+
+
+def test_ttl_cache_expiry():
+    cache = TTLCache(ttl_seconds=0)
+    cache.set("k", "v")
+    assert cache.get("k") is None
+
+
+def test_rebuild_keeps_bulk_send_counts():
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+    stats = StatsBatch(db)
+    for _ in range(3):
+        stats.add(user_id, "outbound")
+    stats.flush()
+
+    since = (datetime.utcnow() - timedelta(days=60)).date()
+    before = {(str(r.day), r.sent, r.received) for r in get_daily_totals(db, user_id, since)}
+    rebuild_daily_stats(db, user_id)
+    rebuild_daily_stats(db, user_id)  # Idempotent
+    after = {(str(r.day), r.sent, r.received) for r in get_daily_totals(db, user_id, since)}
+    assert before == after
+    today = datetime.utcnow().date().isoformat()
+    assert any(day == today and sent == 4 for day, sent, _ in after)  # 1 message row + 3 bulk
+    db.close()
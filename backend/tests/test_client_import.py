@@ -0,0 +1,194 @@
+import io
+import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, get_uuid
+from app.services import client_import
+from app.services.client_import import import_clients_file
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+MAPPING = {"name": "Nombre", "phone": "Telefono", "email": "Correo", "car_year": "Año", "notes": "Notas", "birth_date": "Cumple"}
+
+CSV = """Nombre,Telefono,Correo,Año,Notas,Cumple
+Ana Lopez,(555) 123-4567,ana@new.com,2021,Quiere SUV,1990-05-01
+Beto,555-000-1111,,2019.0,,
+Sin Telefono,,,,,
+Corto,123,,,,
+Carla,+1 555 222 3333,carla@x.com,abc,,no es fecha
+Carla Final,+1 555 222 3333,,,,
+"""
+
+
+def _seed(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    db.add(Client(id=get_uuid(), user_id=user_id, name="Ana", phone="5551234567", email="ana@old.com", notes="VIP"))
+    db.commit()
+    return user_id
+
+
+def test_chunked_import_splits_inserts_and_updates():
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    stats = import_clients_file(db, user_id, io.BytesIO(CSV.encode()), ".csv", mapping=MAPPING, chunk_rows=2)
+
+    assert stats.as_dict() == {"parsed": 6, "inserted": 2, "updated": 1, "skipped": 3, "error_count": 4, "imported_count": 3}
+    assert stats.errors == [
+        "Row 4: Missing phone", "Row 5: Invalid phone",
+        "Row 6: Invalid car_year 'abc'", "Row 6: Invalid birth_date 'no es fecha'",
+    ]
+    clients = {c.phone: c for c in db.query(Client).filter(Client.user_id == user_id).all()}
+    assert len(clients) == 3
+
+    ana = clients["5551234567"]
+    assert ana.name == "Ana Lopez"
+    assert ana.email == "ana@new.com"
+    assert ana.car_year == 2021
+    assert ana.notes.startswith("VIP\n[") and ana.notes.endswith("Quiere SUV")
+    assert ana.birth_date == datetime.date(1990, 5, 1)
+
+    beto = clients["5550001111"]
+    assert beto.car_year == 2019 and beto.status == "imported" and beto.email is None
+
+    # Last row for a duplicated phone wins
+    assert clients["+15552223333"].name == "Carla Final"
+
+    # Re-importing the same file only counts real changes
+    again = import_clients_file(db, user_id, io.BytesIO(CSV.encode()), ".csv", mapping=MAPPING)
+    assert again.inserted == 0 and again.updated == 0
+    db.close()
+
+
+def test_mapping_fallback_without_ai(monkeypatch):
+    monkeypatch.setattr(client_import, "map_columns_with_ai", lambda headers: {"phone": "Not A Header"})
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    stats = import_clients_file(db, user_id, io.BytesIO(b"nombre,telefono\nLuis,5559998888\n"), ".csv")
+    assert stats.inserted == 1
+
+    empty = import_clients_file(db, user_id, io.BytesIO(b""), ".csv")
+    assert empty.errors == ["File is empty"]
+    db.close()
+
+
+def test_background_job_progress_and_error_file(tmp_path, monkeypatch):
+    from app.models import ImportJob
+    from app.services import import_jobs
+
+    monkeypatch.setattr(import_jobs, "IMPORT_JOBS_DIR", tmp_path)
+    monkeypatch.setattr(client_import, "map_columns_with_ai", lambda headers: MAPPING)
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    job = import_jobs.create_job(db, user_id, "clientes.csv", ".csv")
+    with open(job.file_path, "wb") as f:
+        f.write(CSV.encode())
+    job_id = job.id
+    db.close()
+
+    import_jobs.run_import_job(job_id, session_factory=TestingSessionLocal)
+
+    db = TestingSessionLocal()
+    data = import_jobs.job_to_dict(db.get(ImportJob, job_id))
+    assert data["status"] == "completed"
+    assert (data["parsed"], data["inserted"], data["updated"], data["skipped"]) == (6, 2, 1, 3)
+    assert data["error_count"] == 4 and data["has_error_file"]
+
+    with open(db.get(ImportJob, job_id).error_file_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[:3] == ["row,error", "4,Missing phone", "5,Invalid phone"]
+    assert not (tmp_path / f"{job_id}.csv").exists()
+    db.close()
+
+
+def test_resume_claims_each_job_once(tmp_path, monkeypatch):
+    from app.models import ImportJob
+    from app.services import import_jobs
+
+    monkeypatch.setattr(import_jobs, "IMPORT_JOBS_DIR", tmp_path)
+    submitted = []
+    monkeypatch.setattr(import_jobs, "submit_job", lambda job_id, session_factory: submitted.append(job_id))
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    stale, live = (import_jobs.create_job(db, user_id, f"{name}.csv", ".csv") for name in ("stale", "live"))
+    for job in (stale, live):
+        open(job.file_path, "wb").close()
+        job.status = "running"
+    stale.started_at = live.started_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    stale.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=import_jobs.IMPORT_JOB_LEASE_SECONDS + 60)
+    live.heartbeat_at = datetime.datetime.utcnow()  # Worker still reporting progress
+    db.commit()
+    stale_id = stale.id
+    db.close()
+
+    # Two workers (re)starting: the job with an expired lease is re-queued, the live one left alone
+    assert import_jobs.resume_pending_jobs(TestingSessionLocal) == 1
+    assert import_jobs.resume_pending_jobs(TestingSessionLocal) == 1  # Still queued: submitted again...
+    monkeypatch.setattr(import_jobs, "import_clients_file", lambda *args, **kwargs: None)
+    import_jobs.run_import_job(stale_id, session_factory=TestingSessionLocal)
+    claims = []
+    monkeypatch.setattr(import_jobs, "import_clients_file", lambda *args, **kwargs: claims.append(args))
+    import_jobs.run_import_job(stale_id, session_factory=TestingSessionLocal)  # ...but only claimed once
+    assert submitted == [stale_id, stale_id] and claims == []
+
+
+def test_column_mapping_synonyms_then_cached_ai(monkeypatch):
+    from app.services.client_import import resolve_column_mapping, match_synonyms
+
+    assert match_synonyms(["Nombre Completo", "Teléfono", "E-mail", "Año", "Notas"]) == {
+        "name": "Nombre Completo", "phone": "Teléfono", "email": "E-mail", "car_year": "Año", "notes": "Notas"
+    }
+
+    calls = []
+
+    def fake_ai(headers):
+        calls.append(headers)
+        return {"name": "Comprador", "phone": "Contacto WA", "car_model": "Unidad"}
+
+    monkeypatch.setattr(client_import, "map_columns_with_ai", fake_ai)
+    db = TestingSessionLocal()
+    user_id = _seed(db)
+
+    first = resolve_column_mapping(["Comprador", "Contacto WA", "Unidad"], db, user_id)
+    assert first == {"name": "Comprador", "phone": "Contacto WA", "car_model": "Unidad"}
+
+    # Same layout with different spelling/order: served from the cache
+    again = resolve_column_mapping(["UNIDAD", "contacto wa", "Comprador "], db, user_id)
+    assert again == {"name": "Comprador ", "phone": "contacto wa", "car_model": "UNIDAD"}
+    assert len(calls) == 1
+
+    # Synonym-resolvable layouts never reach the LLM
+    resolve_column_mapping(["Nombre", "Celular"], db, user_id)
+    assert len(calls) == 1
+    db.close()
+
+
+def test_vectorized_cleansing():
+    from app.services.client_import import parse_date_column, parse_int_column, prepare_chunk
+    import pandas as pd
+
+    dates = parse_date_column(pd.Series(["2023-01-05", "02/03/2021", "25/12/2020", "Jan 7 2022", "", "nope"]))
+    assert [d.date() if pd.notna(d) else None for d in dates] == [
+        datetime.date(2023, 1, 5), datetime.date(2021, 2, 3), datetime.date(2020, 12, 25),
+        datetime.date(2022, 1, 7), None, None
+    ]
+    # Time-zone aware and naive values in one chunk: both parse
+    mixed = parse_date_column(pd.Series(["May 1, 1990", "1990-05-01T10:00:00Z", "nope"]))
+    assert mixed.tolist()[:2] == [pd.Timestamp(1990, 5, 1), pd.Timestamp(1990, 5, 1, 10)] and pd.isna(mixed[2])
+    assert parse_int_column(pd.Series(["2019", "2019.7", "x", ""])).tolist()[:2] == [2019, 2019]
+
+    chunk = pd.DataFrame({"N": ["A", "B"], "T": ["555-123-4567", "555 765 4321"], "Y": ["1850", "2020"]})
+    rows, issues = prepare_chunk(chunk, {"name": "N", "phone": "T", "car_year": "Y"})
+    assert rows["phone"].tolist() == ["5551234567", "5557654321"]
+    assert rows["car_year"].tolist() == [None, 2020]
+    assert issues.tolist() == ["car_year out of range '1850'"]
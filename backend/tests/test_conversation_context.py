@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base
+from app.models import Client, ConversationState, Message, User
+from app.services import conversation_context
+from app.services.conversation_context import count_tokens, history_tokens, load_history, pack_history
+from app.utils import sales_agent
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSession = sessionmaker(bind=engine, autoflush=False)
+Base.metadata.create_all(bind=engine)
+
+
+def _seed_chat(db, suffix, count):
+    db.add(User(id=f"u-{suffix}", email=f"{suffix}@example.com", password_hash="x", name="Seller"))
+    db.add(Client(id=f"c-{suffix}", user_id=f"u-{suffix}", name="Buyer", phone="5551234567"))
+    start = datetime(2026, 1, 1, 10, 0)
+    messages = []
+    for i in range(count):
+        msg = Message(
+            user_id=f"u-{suffix}", client_id=f"c-{suffix}", phone="5551234567",
+            direction="inbound" if i % 2 == 0 else "outbound",
+            content=f"mensaje numero {i} sobre el corolla", sent_at=start + timedelta(minutes=i)
+        )
+        db.add(msg)
+        messages.append(msg)
+    db.commit()
+    return messages
+
+
+def test_pack_history_keeps_newest_within_budget():
+    history = [{"role": "buyer", "text": f"mensaje {i} " * 10} for i in range(20)]
+    history.append({"role": "buyer", "text": "texto pegado " * 500})
+
+    packed = pack_history(history, budget=200, max_message_tokens=50)
+    assert history_tokens(packed) <= 200
+    assert packed[-1]["text"].endswith("[…]") and count_tokens(packed[-1]["text"]) <= 52
+    assert packed[0]["text"] != history[0]["text"]  # Oldest left out
+    assert pack_history([], budget=200) == []
+
+
+def test_load_history_excludes_current_message():
+    db = TestingSession()
+    messages = _seed_chat(db, "window", 30)
+
+    window = load_history(db, "c-window", exclude_message_id=messages[-1].id, budget=120)
+    assert window.messages[-1]["text"] == "mensaje numero 28 sobre el corolla"
+    assert window.messages[-1]["role"] == "buyer"
+    assert window.dropped == 29 - len(window.messages) and window.dropped > 0
+    assert window.tokens <= 120
+    assert window.cutoff == messages[29 - len(window.messages)].sent_at
+    db.close()
+
+
+def test_older_turns_are_summarized_into_the_context(monkeypatch):
+    db = TestingSession()
+    messages = _seed_chat(db, "summary", 20)
+    db.add(ConversationState(client_id="c-summary", user_id="u-summary", stage="OFFER_BUILD"))
+    db.commit()
+    seen = []
+
+    def fake_chat(**kwargs):
+        seen.append(kwargs["messages"][1]["content"])
+        message = SimpleNamespace(content="Busca un Corolla a 450/mes, tiene ITIN.", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    monkeypatch.setattr(conversation_context, "llm_available", lambda: True)
+    monkeypatch.setattr(conversation_context, "chat_completion", fake_chat)
+
+    cutoff = messages[12].sent_at
+    assert conversation_context.summarize_older_turns("c-summary", cutoff, TestingSession)
+    assert "mensaje numero 11" in seen[0] and "mensaje numero 12" not in seen[0]
+
+    state = db.query(ConversationState).filter(ConversationState.client_id == "c-summary").one()
+    db.refresh(state)
+    assert state.conversation_summary == "Busca un Corolla a 450/mes, tiene ITIN."
+    assert state.summary_until.replace(tzinfo=None) == messages[11].sent_at
+    # Nothing new before the cutoff: no second call
+    assert not conversation_context.summarize_older_turns("c-summary", cutoff, TestingSession)
+    assert len(seen) == 1
+
+    context = sales_agent.build_volatile_context("", {"stage": "OFFER_BUILD", "conversation_summary": state.conversation_summary})
+    assert "RESUMEN DE LA CONVERSACIÓN ANTERIOR" in context and "450/mes" in context
+    assert "RESUMEN DE LA CONVERSACIÓN" not in sales_agent.build_volatile_context("", {"stage": "INTAKE"})
+    db.close()
+
+
+def test_encoding_loads_on_first_count(monkeypatch):
+    import importlib
+    import sys
+    import types
+
+    loads = []
+    fake = types.ModuleType("tiktoken")
+    fake.get_encoding = lambda name: loads.append(name) or SimpleNamespace(encode=lambda text: text.split())
+    monkeypatch.setitem(sys.modules, "tiktoken", fake)
+    try:
+        module = importlib.reload(conversation_context)
+        assert loads == []
+        assert module.count_tokens("uno dos tres") == 3 and module.count_tokens("cuatro") == 1
+        assert loads == ["o200k_base"]
+    finally:
+        monkeypatch.delitem(sys.modules, "tiktoken")
+        importlib.reload(conversation_context)
@@ -0,0 +1,97 @@
+import csv
+import io
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, Tag, ClientTag, get_uuid
+from app.services import exports
+from app.services.exports import (
+    stream_clients_csv, write_columnar_export, ANALYTICS_CLIENT_FIELDS, BACKUP_CLIENT_FIELDS
+)
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _seed(n_clients=3):
+    db = TestingSessionLocal()
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    hot = Tag(id=get_uuid(), user_id=user_id, name="Interesado")
+    won = Tag(id=get_uuid(), user_id=user_id, name="Compró")
+    db.add_all([hot, won])
+    clients = [
+        Client(id=get_uuid(), user_id=user_id, name=f"Cliente {i}", phone=f"555{i:04d}", notes="linea 1\nlinea 2")
+        for i in range(n_clients)
+    ]
+    db.add_all(clients)
+    db.flush()
+    db.add(ClientTag(id=get_uuid(), client_id=clients[0].id, tag_id=hot.id))
+    db.add(ClientTag(id=get_uuid(), client_id=clients[0].id, tag_id=won.id))
+    db.commit()
+    client_ids = [c.id for c in clients]
+    db.close()
+    return user_id, client_ids
+
+
+def test_export_with_aggregated_tags():
+    user_id, client_ids = _seed()
+
+    body = "".join(stream_clients_csv(user_id, ANALYTICS_CLIENT_FIELDS, include_tags=True, session_factory=TestingSessionLocal))
+    rows = list(csv.DictReader(io.StringIO(body)))
+
+    assert len(rows) == 3
+    by_id = {r["ID"]: r for r in rows}
+    assert set(by_id[client_ids[0]]["Tags"].split(", ")) == {"Interesado", "Compró"}
+    assert by_id[client_ids[1]]["Tags"] == ""
+    assert by_id[client_ids[0]]["Notes"] == "linea 1 linea 2"
+
+
+def test_backup_export_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(exports, "CSV_CHUNK_CHARS", 256)
+    user_id, _ = _seed(n_clients=50)
+
+    chunks = list(stream_clients_csv(user_id, BACKUP_CLIENT_FIELDS, session_factory=TestingSessionLocal))
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+
+    assert len(chunks) > 1
+    assert rows[0][:4] == ["ID", "Name", "Last Name", "Phone"]
+    assert len(rows) == 51
+
+
+def test_parquet_export_with_column_selection():
+    pq = pytest.importorskip("pyarrow.parquet")
+    user_id, client_ids = _seed(n_clients=25)
+    db = TestingSessionLocal()
+
+    sink = io.BytesIO()
+    rows = write_columnar_export(db, user_id, "clients", "parquet", sink, columns="id, name,created_at", batch_size=10)
+    db.close()
+
+    table = pq.read_table(io.BytesIO(sink.getvalue()))
+    assert rows == 25
+    assert table.column_names == ["id", "name", "created_at"]
+    assert sorted(table.column("id").to_pylist()) == sorted(client_ids)
+
+
+def test_arrow_export_and_validation():
+    pa = pytest.importorskip("pyarrow")
+    user_id, _ = _seed()
+    db = TestingSessionLocal()
+
+    sink = io.BytesIO()
+    write_columnar_export(db, user_id, "conversation_states", "arrow", sink, compression="lz4")
+    table = pa.ipc.open_file(io.BytesIO(sink.getvalue())).read_all()
+    assert table.num_rows == 0
+    assert "stage" in table.column_names
+
+    with pytest.raises(ValueError):
+        write_columnar_export(db, user_id, "clients", "parquet", io.BytesIO(), columns="password_hash")
+    with pytest.raises(ValueError):
+        write_columnar_export(db, user_id, "users", "parquet", io.BytesIO())
+    db.close()
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, ConversationState, ConversationStageEvent, get_uuid
+from app.services.funnel_analytics import get_funnel, get_cohorts
+from app.utils.agent_tools import update_conversation_state
+from app.utils.cache import analytics_cache
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _seed(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    clients = [Client(id=get_uuid(), user_id=user_id, name=f"C{i}", phone=f"555{i}") for i in range(4)]
+    db.add_all(clients)
+    db.commit()
+
+    start = datetime.utcnow() - timedelta(days=3)
+    paths = [
+        ["INTAKE", "CREDIT_PROFILE", "DEAL_TYPE", "APPOINTMENT"],
+        ["INTAKE", "CREDIT_PROFILE"],
+        ["INTAKE"],
+    ]
+    for client, path in zip(clients, paths):
+        db.add(ConversationState(id=get_uuid(), client_id=client.id, user_id=user_id, stage=path[-1]))
+        for step, stage in enumerate(path):
+            db.add(ConversationStageEvent(
+                user_id=user_id, client_id=client.id, stage=stage,
+                from_stage=path[step - 1] if step else None,
+                entered_at=start + timedelta(hours=10 * step)
+            ))
+    # Legacy conversation without events still counts at its current stage
+    db.add(ConversationState(id=get_uuid(), client_id=clients[3].id, user_id=user_id, stage="DEAL_TYPE"))
+    db.commit()
+    return user_id, [c.id for c in clients]
+
+
+def test_funnel_reached_conversion_and_time_in_stage():
+    db = TestingSessionLocal()
+    user_id, _ = _seed(db)
+
+    data = get_funnel(db, user_id)
+    stages = {s["stage"]: s for s in data["stages"]}
+
+    assert data["total_conversations"] == 4
+    assert [stages[s]["reached"] for s in ("INTAKE", "CREDIT_PROFILE", "DEAL_TYPE", "OFFER_BUILD", "APPOINTMENT", "WRAP")] == [4, 3, 2, 1, 1, 0]
+    assert stages["INTAKE"]["conversion_to_next"] == 75.0
+    assert stages["CREDIT_PROFILE"]["current"] == 1
+    assert stages["INTAKE"]["hours_in_stage"]["median"] == 10.0
+    assert stages["INTAKE"]["hours_in_stage"]["completed"] == 2
+    assert stages["WRAP"]["conversion_to_next"] is None
+    db.close()
+
+
+def test_cohorts_and_cache_invalidation_on_stage_change():
+    db = TestingSessionLocal()
+    user_id, client_ids = _seed(db)
+
+    cohorts = get_cohorts(db, user_id, weeks=4)["cohorts"]
+    assert len(cohorts) == 4
+    assert sum(c["leads"] for c in cohorts) == 4
+    assert sum(c["reached"]["APPOINTMENT"] for c in cohorts) == 1
+
+    before = get_funnel(db, user_id)
+    assert analytics_cache.get((user_id, "funnel", None)) is not None
+
+    update_conversation_state(db, client_ids[2], user_id, stage="APPOINTMENT")
+    assert analytics_cache.get((user_id, "funnel", None)) is None
+    assert analytics_cache.get((user_id, "cohorts", 4)) is None
+
+    after = {s["stage"]: s["reached"] for s in get_funnel(db, user_id)["stages"]}
+    assert after["APPOINTMENT"] == 2
+    assert before["stages"][0]["reached"] == 4
+    db.close()
+
+
+def test_empty_account_gets_zero_funnel_and_empty_cohorts():
+    db = TestingSessionLocal()
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    db.commit()
+
+    funnel = get_funnel(db, user_id)
+    assert funnel["total_conversations"] == 0 and funnel["overall_conversion"] == 0.0
+    assert all(stage["reached"] == 0 for stage in funnel["stages"])
+    assert get_funnel(db, user_id, days=7)["total_conversations"] == 0
+
+    cohorts = get_cohorts(db, user_id, weeks=4)["cohorts"]
+    assert len(cohorts) == 4 and all(c["leads"] == 0 for c in cohorts)
+
+    # Leads but no conversations yet
+    analytics_cache.invalidate_where(lambda key: key[0] == user_id)
+    db.add(Client(id=get_uuid(), user_id=user_id, name="Nuevo", phone="5550"))
+    db.commit()
+    cohorts = get_cohorts(db, user_id, weeks=4)["cohorts"]
+    assert cohorts[-1]["leads"] == 1 and cohorts[-1]["reached"]["INTAKE"] == 0
+    db.close()
@@ -0,0 +1,96 @@
+import asyncio
+import io
+import os
+import pytest
+from app.services import image_variants
+from app.services.image_variants import evict_variants, variant_url
+
+BASE = "https://api.example.com"
+
+
+def test_variant_urls(monkeypatch):
+    monkeypatch.setenv("BACKEND_PUBLIC_URL", BASE)
+    monkeypatch.setattr(image_variants, "Image", object())
+
+    own = f"{BASE}/files/media/{'a' * 64}.png"
+    assert variant_url(own) == f"{BASE}/files/media/variants/whatsapp/{'a' * 64}.png"
+    assert variant_url(own, "thumbnail").endswith("/variants/thumbnail/" + "a" * 64 + ".png")
+    assert variant_url(own, "original") == own
+    assert variant_url(f"{BASE}/files/media/{'b' * 64}.pdf") == f"{BASE}/files/media/{'b' * 64}.pdf"
+
+    catalog = "https://images.unsplash.com/photo-1?w=800"
+    assert variant_url(catalog) == f"{BASE}/files/image-proxy/whatsapp?url=https%3A%2F%2Fimages.unsplash.com%2Fphoto-1%3Fw%3D800"
+    assert variant_url("https://evil.example.org/x.jpg") == "https://evil.example.org/x.jpg"
+
+    # Without Pillow nothing is rewritten
+    monkeypatch.setattr(image_variants, "Image", None)
+    assert variant_url(own) == own
+
+
+def test_lru_eviction(tmp_path):
+    for i, name in enumerate(["old", "mid", "new"]):
+        path = tmp_path / f"{name}.whatsapp.jpg"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (1000 + i, 1000 + i))
+    # A cache hit refreshes the oldest entry
+    image_variants._cached(tmp_path / "old.whatsapp.jpg")
+
+    assert evict_variants(tmp_path, max_bytes=200) == 100
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.whatsapp.jpg", "old.whatsapp.jpg"]
+
+
+def test_render_strips_exif_and_resizes(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(image_variants, "VARIANTS_DIR", tmp_path / "variants")
+
+    photo = Image.new("RGB", (4000, 3000), (200, 10, 10))
+    exif = photo.getexif()
+    exif[0x010F] = "PhoneMaker"
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", exif=exif)
+    (tmp_path / f"{'c' * 64}.jpg").write_bytes(buf.getvalue())
+
+    path = asyncio.run(image_variants.local_variant(f"{'c' * 64}.jpg", "whatsapp", tmp_path))
+    with Image.open(path) as out:
+        assert max(out.size) == 1600 and not out.getexif()
+    assert path.stat().st_size < len(buf.getvalue())
+
+
+def test_download_rechecks_every_redirect(monkeypatch):
+    class FakeResponse:
+        def __init__(self, location=None, body=b""):
+            self.headers = {"location": location} if location else {}
+            self.is_redirect, self.body = location is not None, body
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            self.close()
+
+        def close(self):
+            pass
+
+        def raise_for_status(self):
+            pass
+
+        def iter_content(self, size):
+            yield self.body
+
+    routes = {
+        "https://images.unsplash.com/a.jpg": FakeResponse(location="/b.jpg"),
+        "https://images.unsplash.com/b.jpg": FakeResponse(body=b"jpeg"),
+        "https://images.unsplash.com/evil.jpg": FakeResponse(location="http://169.254.169.254/latest"),
+    }
+    fetched = []
+
+    def fake_get(url, **kwargs):
+        assert kwargs["allow_redirects"] is False
+        fetched.append(url)
+        return routes[url]
+
+    monkeypatch.setattr(image_variants.requests, "get", fake_get)
+    assert image_variants._download("https://images.unsplash.com/a.jpg") == b"jpeg"
+    with pytest.raises(ValueError):
+        image_variants._download("https://images.unsplash.com/evil.jpg")
+    assert "http://169.254.169.254/latest" not in fetched
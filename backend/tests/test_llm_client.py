@@ -0,0 +1,51 @@
+import httpx
+import pytest
+from openai import OpenAI
+from app.services import llm_client
+
+COMPLETION = {
+    "id": "c1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Hola"}}],
+}
+
+
+def _client_with(responses, seen):
+    def handler(request):
+        seen.append(request)
+        status = responses.pop(0)
+        if status == 200:
+            return httpx.Response(200, json=COMPLETION)
+        return httpx.Response(status, headers={"retry-after": "0"}, json={"error": {"message": "busy"}})
+
+    return OpenAI(api_key="test", max_retries=0, http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+
+
+def test_retries_429_and_5xx_then_succeeds(monkeypatch):
+    seen = []
+    monkeypatch.setattr(llm_client, "_client", _client_with([429, 503, 200], seen))
+
+    res = llm_client.chat_completion(messages=[{"role": "user", "content": "hola"}])
+    assert res.choices[0].message.content == "Hola"
+    assert len(seen) == 3
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    seen = []
+    monkeypatch.setattr(llm_client, "_client", _client_with([400, 200], seen))
+    with pytest.raises(Exception):
+        llm_client.chat_completion(messages=[{"role": "user", "content": "hola"}])
+    assert len(seen) == 1
+
+    # Gives up after LLM_MAX_RETRIES retries
+    seen.clear()
+    monkeypatch.setattr(llm_client, "LLM_MAX_RETRIES", 1)
+    monkeypatch.setattr(llm_client, "_client", _client_with([500, 500, 200], seen))
+    with pytest.raises(Exception):
+        llm_client.chat_completion(messages=[{"role": "user", "content": "hola"}])
+    assert len(seen) == 2
+
+
+def test_client_is_shared(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(llm_client, "_client", None)
+    assert llm_client.get_client() is llm_client.get_client()
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from app.models import AgentTurnMetric
+from app.services import llm_client
+from app.services.llm_providers import ReplayMiss, ReplayProvider, StubProvider
+from app.utils import sales_agent
+
+PAYMENT_QUESTION = [{"role": "user", "content": "Cuánto sale el Corolla al mes?"}]
+
+
+def test_stub_scripts_tool_calls_then_replies(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_client, "_provider", StubProvider())
+    assert llm_client.llm_available()  # No key needed
+
+    first = llm_client.chat_completion(messages=PAYMENT_QUESTION, tools=sales_agent.RAY_TOOLS, tool_choice="auto")
+    call = first.choices[0].message.tool_calls[0]
+    assert call.function.name == "calculate_payment"
+    assert json.loads(call.function.arguments)["model_name"] == "Corolla LE"
+
+    tool_result = {"role": "tool", "tool_call_id": call.id, "content": "$389/mes"}
+    second = llm_client.chat_completion(
+        messages=PAYMENT_QUESTION + [first.choices[0].message, tool_result],
+        tools=sales_agent.RAY_TOOLS, response_format={"type": "json_object"}
+    )
+    answer = json.loads(second.choices[0].message.content)
+    assert answer["reply"].startswith("El Corolla LE") and answer["memory"]["plan_preference"] == "finance"
+    assert second.usage.total_tokens > 0
+
+    # Forced tool choice is honoured, embeddings are deterministic
+    forced = llm_client.chat_completion(
+        messages=[{"role": "user", "content": "hola"}], tools=sales_agent.RAY_TOOLS,
+        tool_choice={"type": "function", "function": {"name": "check_calendar"}}
+    )
+    assert forced.choices[0].message.tool_calls[0].function.name == "check_calendar"
+    assert llm_client.embed_texts(["hola corolla"]) == llm_client.embed_texts(["corolla hola"])
+
+
+def test_agent_turn_runs_offline_on_the_stub(monkeypatch, db, seed_clone):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setattr(llm_client, "_provider", StubProvider())
+    monkeypatch.setattr(sales_agent, "AGENT_MODE", "unified")
+    monkeypatch.setattr(sales_agent, "MEMORY_ASYNC", False)
+    monkeypatch.setattr(sales_agent, "RESPONSE_CACHE_ENABLED", False)
+
+    clone = seed_clone("stub")
+
+    result = sales_agent.process_message_with_agent(db, clone, "c-stub", "Cuánto sale el Corolla al mes?")
+    assert result["response"].startswith("El Corolla LE te queda")
+    assert result["usage"]["tools"] == ["calculate_payment"] and result["usage"]["llm_calls"] == 2
+
+    metric = db.query(AgentTurnMetric).filter(AgentTurnMetric.client_id == "c-stub").one()
+    assert (metric.mode, metric.llm_calls, metric.tool_calls) == ("unified", 2, 1)
+
+
+def test_replay_serves_recorded_answers(tmp_path):
+    path = str(tmp_path / "replay.jsonl")
+    recorder = ReplayProvider(path, recorder=StubProvider())
+    recorded = recorder.chat(model="gpt-4o-mini", messages=PAYMENT_QUESTION, tools=sales_agent.RAY_TOOLS)
+    recorder.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "hola"}])
+    recorder.embed(["hola"], "text-embedding-3-small")
+
+    replay = ReplayProvider(path)
+    # Matched by request, not by order
+    hello = replay.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "hola"}])
+    assert hello.choices[0].message.content == StubProvider().reply
+    again = replay.chat(model="gpt-4o-mini", messages=PAYMENT_QUESTION, tools=sales_agent.RAY_TOOLS)
+    assert again.choices[0].message.tool_calls[0].function.arguments == \
+        recorded.choices[0].message.tool_calls[0].function.arguments
+    assert again.usage.total_tokens == recorded.usage.total_tokens
+    assert replay.embed(["hola"], "text-embedding-3-small") == StubProvider().embed(["hola"], "x")
+    assert replay.stats == {"matched": 3, "fallbacks": 0, "misses": 0}
+
+    strict = ReplayProvider(path, strict=True)
+    with pytest.raises(ReplayMiss):
+        strict.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "otra cosa"}])
+    # Not strict: a changed prompt takes the next unused recording
+    loose = ReplayProvider(path)
+    assert loose.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": "otra cosa"}]).choices[0].message.tool_calls
+    assert loose.stats["fallbacks"] == 1 and strict.stats["misses"] == 1
@@ -0,0 +1,61 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.utils.media_response import media_file_response
+
+SHA = "ab" * 32
+
+
+def _client(tmp_path):
+    app = FastAPI()
+
+    @app.api_route("/media/{name}", methods=["GET", "HEAD"])
+    def media(name: str, request: Request):
+        return media_file_response(request, tmp_path / name, "video/mp4")
+
+    return TestClient(app)
+
+
+def test_full_conditional_and_cache_headers(tmp_path):
+    (tmp_path / f"{SHA}.mp4").write_bytes(b"0123456789" * 100)
+    (tmp_path / "legacy.mp4").write_bytes(b"old")
+    client = _client(tmp_path)
+
+    res = client.get(f"/media/{SHA}.mp4")
+    assert res.status_code == 200 and len(res.content) == 1000
+    assert res.headers["content-length"] == "1000"
+    assert res.headers["etag"] == f'"{SHA}"'
+    assert "immutable" in res.headers["cache-control"]
+    assert res.headers["accept-ranges"] == "bytes"
+
+    assert client.get(f"/media/{SHA}.mp4", headers={"If-None-Match": f'W/"x", "{SHA}"'}).status_code == 304
+    since = client.get(f"/media/{SHA}.mp4", headers={"If-Modified-Since": res.headers["last-modified"]})
+    assert since.status_code == 304 and since.content == b""
+
+    legacy = client.get("/media/legacy.mp4")
+    assert legacy.headers["cache-control"] == "public, no-cache" and legacy.content == b"old"
+
+    head = client.head(f"/media/{SHA}.mp4")
+    assert head.status_code == 200 and head.headers["content-length"] == "1000" and head.content == b""
+
+
+def test_byte_ranges(tmp_path):
+    (tmp_path / f"{SHA}.mp4").write_bytes(bytes(range(256)) * 4)
+    client = _client(tmp_path)
+    url = f"/media/{SHA}.mp4"
+
+    part = client.get(url, headers={"Range": "bytes=10-19"})
+    assert part.status_code == 206 and part.content == bytes(range(10, 20))
+    assert part.headers["content-range"] == "bytes 10-19/1024" and part.headers["content-length"] == "10"
+
+    assert client.get(url, headers={"Range": "bytes=1000-"}).content == (bytes(range(256)) * 4)[1000:]
+    assert client.get(url, headers={"Range": "bytes=-4"}).content == bytes([252, 253, 254, 255])
+
+    bad = client.get(url, headers={"Range": "bytes=5000-"})
+    assert bad.status_code == 416 and bad.headers["content-range"] == "bytes */1024"
+
+    # Multiple ranges are ignored (full body); a stale If-Range resends everything
+    assert client.get(url, headers={"Range": "bytes=0-1,5-6"}).status_code == 200
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and len(stale.content) == 1024
+    fresh = client.get(url, headers={"Range": "bytes=0-9", "If-Range": f'"{SHA}"'})
+    assert fresh.status_code == 206
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import os
+from datetime import datetime, timedelta
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, Message, MediaAsset, MediaUpload, get_uuid
+from app.services import media_retention, media_store
+from app.services.media_store import store_upload, MediaQuotaExceeded
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _user(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    db.commit()
+    return user_id
+
+
+def _store(db, user_id, data, name, directory):
+    asset, _ = asyncio.run(store_upload(db, user_id, UploadFile(file=io.BytesIO(data), filename=name),
+                                        "application/pdf", "document", directory))
+    return asset
+
+
+def test_sweeper_keeps_referenced_and_reclaims_the_rest(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_retention, "MEDIA_SWEEP_BATCH", 1)
+    monkeypatch.setattr(media_retention, "MEDIA_SWEEP_PAUSE_SECONDS", 0)
+    monkeypatch.setattr(media_store, "MEDIA_QUOTA_BYTES", 0)
+    db = TestingSessionLocal()
+    user_id = _user(db)
+
+    sent = _store(db, user_id, b"sent brochure", "a.pdf", tmp_path)
+    abandoned = _store(db, user_id, b"abandoned upload", "b.pdf", tmp_path)
+    fresh = _store(db, user_id, b"just uploaded", "c.pdf", tmp_path)
+
+    client = Client(id=get_uuid(), user_id=user_id, name="Ana", phone="5551234567")
+    db.add(client)
+    db.add(Message(user_id=user_id, client_id=client.id, phone=client.phone, direction="outbound", content="",
+                   media_url=f"https://api.example.com/files/media/{sent.filename}"))
+    old = datetime.utcnow() - timedelta(days=10)
+    for asset in (sent, abandoned):
+        asset.last_uploaded_at = old
+    db.commit()
+
+    legacy = tmp_path / "1f0c-legacy-uuid.jpg"
+    legacy.write_bytes(b"x" * 50)
+    os.utime(legacy, (old.timestamp(), old.timestamp()))
+    (tmp_path / ".tmp").mkdir(exist_ok=True)
+    part = tmp_path / ".tmp" / "dead.part"
+    part.write_bytes(b"y" * 7)
+    os.utime(part, (old.timestamp(), old.timestamp()))
+
+    dry = media_retention.sweep_media(tmp_path, TestingSessionLocal, dry_run=True)
+    assert dry["assets_deleted"] == 1 and (tmp_path / abandoned.filename).exists()
+
+    report = media_retention.sweep_media(tmp_path, TestingSessionLocal)
+    assert report["assets_deleted"] == 1
+    assert report["orphan_files_deleted"] == 1 and report["temp_files_deleted"] == 1
+    assert report["bytes_reclaimed"] == len(b"abandoned upload") + 50 + 7
+
+    assert (tmp_path / sent.filename).exists() and (tmp_path / fresh.filename).exists()
+    assert not (tmp_path / abandoned.filename).exists() and not legacy.exists()
+    check = TestingSessionLocal()
+    assert {a.filename for a in check.query(MediaAsset)} == {sent.filename, fresh.filename}
+    assert check.query(MediaUpload).count() == 2
+    check.close()
+    db.close()
+
+
+def test_sweeper_rechecks_candidates_before_deleting(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_retention, "MEDIA_SWEEP_BATCH", 1)
+    monkeypatch.setattr(media_retention, "MEDIA_SWEEP_PAUSE_SECONDS", 0)
+    monkeypatch.setattr(media_store, "MEDIA_QUOTA_BYTES", 0)
+    db = TestingSessionLocal()
+    user_id = _user(db)
+    client = Client(id=get_uuid(), user_id=user_id, name="Ana", phone="5551234567")
+    db.add(client)
+    reused = _store(db, user_id, b"uploaded again", "a.pdf", tmp_path)
+    sent = _store(db, user_id, b"sent during the sweep", "b.pdf", tmp_path)
+    stale = _store(db, user_id, b"really abandoned", "c.pdf", tmp_path)
+    for asset in (reused, sent, stale):
+        asset.last_uploaded_at = datetime.utcnow() - timedelta(days=10)
+    db.commit()
+    kept, gone = (reused.filename, sent.filename), stale.filename
+
+    # Between the candidate scan and the batches: a dedupe hit and a new message
+    batches = media_retention._batches
+
+    def busy_batches(items):
+        if len(items) != 3:  # only the asset candidates, not the orphan/temp passes
+            yield from batches(items)
+            return
+        _store(db, user_id, b"uploaded again", "again.pdf", tmp_path)
+        db.add(Message(user_id=user_id, client_id=client.id, phone=client.phone, direction="outbound",
+                       content="", media_url=f"https://api.example.com/files/media/{kept[1]}"))
+        db.commit()
+        yield from batches(items)
+
+    monkeypatch.setattr(media_retention, "_batches", busy_batches)
+    report = media_retention.sweep_media(tmp_path, TestingSessionLocal)
+    assert report["assets_deleted"] == 1
+    assert all((tmp_path / name).exists() for name in kept) and not (tmp_path / gone).exists()
+    db.close()
+
+
+def test_quota_blocks_new_bytes_and_sweeps_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_retention, "MEDIA_SWEEP_PAUSE_SECONDS", 0)
+    monkeypatch.setattr(media_store, "MEDIA_QUOTA_BYTES", 20)
+    db = TestingSessionLocal()
+    user_id = _user(db)
+
+    first = _store(db, user_id, b"a" * 15, "a.pdf", tmp_path)
+    with pytest.raises(MediaQuotaExceeded):
+        _store(db, user_id, b"b" * 10, "b.pdf", tmp_path)
+    assert not list((tmp_path / ".tmp").iterdir())
+
+    # Re-sending what is already stored never counts against the quota
+    assert _store(db, user_id, b"a" * 15, "again.pdf", tmp_path).id == first.id
+
+    # Same bytes also uploaded by a user within quota
+    other_user = _user(db)
+    shared = _store(db, other_user, b"s" * 5, "shared.pdf", tmp_path)
+    assert _store(db, user_id, b"s" * 5, "shared.pdf", tmp_path).id == shared.id
+
+    # Over quota (e.g. quota lowered): unreferenced media older than an hour goes without the grace period
+    monkeypatch.setattr(media_store, "MEDIA_QUOTA_BYTES", 10)
+    filename = first.filename
+    for asset_id in (first.id, shared.id):
+        db.get(MediaAsset, asset_id).last_uploaded_at = datetime.utcnow() - timedelta(hours=2)
+    db.commit()
+    report = media_retention.sweep_media(tmp_path, TestingSessionLocal)
+    assert report["over_quota_users"] >= 1 and not (tmp_path / filename).exists()
+    # ...but not what another tenant within quota still has
+    assert (tmp_path / shared.filename).exists()
+    assert media_store.user_storage_bytes(db, user_id) == 5
+    db.close()
+
+
+def test_media_filename_from_url():
+    f = media_retention.media_filename_from_url
+    assert f("https://x/files/media/abc.jpg?v=1") == "abc.jpg"
+    assert f("https://x/files/media/variants/whatsapp/abc.jpg") == "abc.jpg"
+    assert f("https://images.unsplash.com/photo.jpg") is None
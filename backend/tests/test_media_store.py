@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import io
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, MediaAsset, get_uuid
+from app.services.media_store import store_upload, get_media_stats, stored_name
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _user(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    db.commit()
+    return user_id
+
+
+def _upload(data: bytes, name: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=name)
+
+
+def test_reupload_is_deduplicated(tmp_path):
+    db = TestingSessionLocal()
+    seller_a, seller_b = _user(db), _user(db)
+    brochure = b"%PDF-1.4 brochure" * 1000
+    sha = hashlib.sha256(brochure).hexdigest()
+
+    first, hit = asyncio.run(store_upload(db, seller_a, _upload(brochure, "Folleto.PDF"), "application/pdf", "document", tmp_path))
+    assert not hit and first.filename == f"{stored_name(sha)}.pdf" and first.sha256 == sha
+    assert sha not in first.filename and first.size_bytes == len(brochure)
+
+    again, hit = asyncio.run(store_upload(db, seller_b, _upload(brochure, "copia.pdf"), "application/pdf", "document", tmp_path))
+    assert hit and again.id == first.id and again.upload_count == 2
+
+    other, hit = asyncio.run(store_upload(db, seller_a, _upload(b"\x89PNG car", "car.png"), "image/png", "image", tmp_path))
+    assert not hit
+
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_file()) == sorted([first.filename, other.filename])
+    assert not list((tmp_path / ".tmp").iterdir())
+
+    stats = get_media_stats(db)
+    assert stats["assets"] == 2 and stats["uploads"] == 3 and stats["dedupe_hits"] == 1
+    assert stats["stored_bytes"] == len(brochure) + 8
+    assert stats["bytes_saved"] == len(brochure)
+    assert stats["dedupe_hit_rate"] == round(1 / 3, 4)
+    # Per user only their own re-uploads count, not the match with seller A's file
+    assert get_media_stats(db, seller_b)["dedupe_hit_rate"] == 0.0
+    assert get_media_stats(db, seller_b)["stored_bytes"] == len(brochure)
+    asyncio.run(store_upload(db, seller_b, _upload(brochure, "otra.pdf"), "application/pdf", "document", tmp_path))
+    mine = get_media_stats(db, seller_b)
+    assert (mine["assets"], mine["uploads"], mine["dedupe_hits"], mine["bytes_saved"]) == (1, 2, 1, len(brochure))
+
+    # File deleted from disk: the next upload writes it again instead of pointing at nothing
+    (tmp_path / first.filename).unlink()
+    restored, hit = asyncio.run(store_upload(db, seller_a, _upload(brochure, "x.pdf"), "application/pdf", "document", tmp_path))
+    assert not hit and (tmp_path / restored.filename).exists()
+    assert db.query(MediaAsset).count() == 2
+    db.close()
+
+
+def test_media_status_only_for_the_uploader(tmp_path):
+    from fastapi import HTTPException
+    from app.routers.files import media_status
+
+    db = TestingSessionLocal()
+    owner, stranger = _user(db), _user(db)
+    asset, _ = asyncio.run(store_upload(db, owner, _upload(b"price list", "p.pdf"), "application/pdf", "document", tmp_path))
+    assert media_status(asset.filename, db=db, current_user=db.get(User, owner))["status"] == "ready"
+    with pytest.raises(HTTPException) as denied:
+        media_status(asset.filename, db=db, current_user=db.get(User, stranger))
+    assert denied.value.status_code == 404
+    db.close()
+
+
+def test_webm_converts_off_loop_with_capped_pool(tmp_path, monkeypatch):
+    from app.services import media_jobs
+
+    running, peak = [0], [0]
+
+    class FakeFfmpeg:
+        def __init__(self, args):
+            self.args, self.returncode = args, None
+
+        async def communicate(self):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.05)
+            running[0] -= 1
+            assert self.args[-1].endswith(".part.mp4")  # Never the public name
+            if b"broken" in open(self.args[2], "rb").read():
+                with open(self.args[-1], "wb") as f:
+                    f.write(b"half")
+                self.returncode = 1
+                return b"", b"Invalid data found"
+            with open(self.args[-1], "wb") as f:
+                f.write(b"mp4 audio")
+            self.returncode = 0
+            return b"", b""
+
+    async def fake_exec(*args, **kwargs):
+        return FakeFfmpeg(args)
+
+    monkeypatch.setattr(media_jobs.shutil, "which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(media_jobs.asyncio, "create_subprocess_exec", fake_exec)
+    monkeypatch.setattr(media_jobs, "MEDIA_WORKERS", 2)
+    db = TestingSessionLocal()
+    user_id = _user(db)
+
+    async def scenario():
+        media_jobs._slots = None
+        notes = [b"voice note %d" % i for i in range(5)] + [b"broken note"]
+        results = [
+            await store_upload(db, user_id, _upload(data, "nota.webm"), "audio/webm", "audio", tmp_path, TestingSessionLocal)
+            for data in notes
+        ]
+        # Upload returns before conversion: public name is the future MP4
+        assert all(a.status == "processing" and a.filename.endswith(".mp4") for a, _ in results)
+        await asyncio.gather(*(t for t in asyncio.all_tasks() if t is not asyncio.current_task()))
+        return results
+
+    results = asyncio.run(scenario())
+    assert peak[0] == 2
+
+    check = TestingSessionLocal()
+    ok = check.query(MediaAsset).filter(MediaAsset.filename == results[0][0].filename).one()
+    assert ok.status == "ready" and ok.source_filename is None and ok.size_bytes == len(b"mp4 audio")
+    assert not (tmp_path / ok.filename.replace(".mp4", ".webm")).exists()
+
+    failed = check.query(MediaAsset).filter(MediaAsset.filename == results[-1][0].filename).one()
+    assert failed.status == "failed" and (tmp_path / failed.source_filename).exists()
+    assert not (tmp_path / failed.filename).exists() and not list(tmp_path.glob("*.part.mp4"))
+    check.close()
+    db.close()
@@ -0,0 +1,58 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from app.models import ClientMemory
+from app.services import memory_service, memory_worker
+from app.utils import sales_agent
+
+
+def _completion(content):
+    message = SimpleNamespace(content=content, tool_calls=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_reply_returns_before_extraction_and_next_turn_sees_it(monkeypatch, db, seed_clone):
+    release = threading.Event()
+
+    def fake_chat(**kwargs):
+        if kwargs.get("response_format"):
+            release.wait(5)  # Slow insight extraction
+            return _completion(json.dumps({"budget_monthly": 450}))
+        return _completion("¡Claro! Te ayudo con eso.")
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+    monkeypatch.setattr(memory_service, "chat_completion", fake_chat)
+    monkeypatch.setattr(sales_agent, "MEMORY_ASYNC", True)
+    monkeypatch.setattr(sales_agent, "AGENT_MODE", "classic")  # Separate extraction call
+    monkeypatch.setattr(sales_agent, "RESPONSE_CACHE_ENABLED", False)
+
+    clone = seed_clone("worker")
+
+    result = sales_agent.process_message_with_agent(db, clone, "c-worker", "Puedo pagar 450 al mes")
+    assert result["response"] == "¡Claro! Te ayudo con eso."
+    assert result["memory_updated"] is False
+    assert result["timings"]["reply_ms"] >= 0
+    # Reply is out while extraction is still blocked
+    assert memory_worker.wait_for_client("c-worker", timeout=0.05) is False
+
+    release.set()
+    # Next turn waits for the queued update before reading memory
+    sales_agent.process_message_with_agent(db, clone, "c-worker", "Y con qué enganche?")
+    db.expire_all()
+    memory = db.query(ClientMemory).filter(ClientMemory.client_id == "c-worker").one()
+    assert memory.preferred_budget_monthly == 450
+    assert memory_worker.wait_for_client("c-worker", timeout=5)
+
+
+def test_updates_for_one_client_run_in_order(monkeypatch):
+    seen = []
+    monkeypatch.setattr(
+        memory_worker, "apply_memory_update",
+        lambda client_id, message, *args: seen.append(message)
+    )
+    for i in range(20):
+        memory_worker.submit_memory_update("c2", f"msg {i}")
+    assert memory_worker.wait_for_client("c2", timeout=5)
+    assert seen == [f"msg {i}" for i in range(20)]
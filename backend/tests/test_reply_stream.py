@@ -0,0 +1,128 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from app.models import AgentTurnMetric
+from app.services.llm_client import collect_stream
+from app.services.reply_stream import JsonReplyExtractor, ReplyStream, SentenceChunker
+from app.utils import sales_agent
+
+REPLY = (
+    "¡Claro! El Corolla LE 2025 te queda en $389.50 al mes con 1.9% APR. "
+    "Eso es con $2,000 de down y 36 meses.\n\n"
+    "¿Quieres que te agende una prueba de manejo? 🚗"
+)
+
+
+def _feed_in_pieces(feed, text, size=7):
+    return [out for i in range(0, len(text), size) for out in [feed(text[i:i + size])]]
+
+
+def test_chunker_cuts_at_sentences_not_decimals():
+    chunker = SentenceChunker(first_chars=20, chars=200)
+    chunks = [c for piece in _feed_in_pieces(chunker.feed, REPLY) for c in piece]
+    tail = chunker.flush()
+
+    assert chunks[0] == "¡Claro! El Corolla LE 2025 te queda en $389.50 al mes con 1.9% APR."
+    assert chunks[1] == "Eso es con $2,000 de down y 36 meses."  # Paragraph break
+    assert tail == "¿Quieres que te agende una prueba de manejo? 🚗"
+
+
+def test_extractor_decodes_reply_across_deltas():
+    answer = json.dumps({"reply": REPLY + ' "ok" \\ fin', "memory": {"budget_monthly": 389}})
+    extractor = JsonReplyExtractor()
+    assert "".join(_feed_in_pieces(extractor.feed, answer, size=3)) == REPLY + ' "ok" \\ fin'
+    assert extractor.feed('{"reply": "otra"}') == ""  # Done after the closing quote
+
+
+def test_collect_stream_assembles_tool_calls():
+    def chunk(content=None, tool_calls=None, finish=None, usage=None):
+        delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish)], usage=usage)
+
+    def call(index, id=None, name=None, arguments=None):
+        return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+    texts = []
+    completion = collect_stream([
+        chunk(tool_calls=[call(0, "c1", "calculate_payment", '{"model_')]),
+        chunk(tool_calls=[call(0, arguments='name": "Corolla"}'), call(1, "c2", "check_calendar", "{}")]),
+        chunk(finish="tool_calls"),
+        SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15)),
+    ], texts.append)
+
+    message = completion.choices[0].message
+    assert texts == [] and message.content is None
+    assert [(c.id, c.function.name) for c in message.tool_calls] == [("c1", "calculate_payment"), ("c2", "check_calendar")]
+    assert json.loads(message.tool_calls[0].function.arguments) == {"model_name": "Corolla"}
+    assert completion.usage.total_tokens == 15
+
+
+def test_agent_streams_reply_in_chunks(monkeypatch, db, seed_clone):
+    answer = json.dumps({"reply": REPLY, "memory": {"budget_monthly": 389}})
+    events, senders = [], set()
+
+    def send(text):
+        senders.add(threading.current_thread().name)
+        events.append(f"send:{text}")
+
+    def fake_stream(on_text, **kwargs):
+        assert events == ["presence:composing"]  # Typing indicator before the model answers
+        for i in range(0, len(answer), 5):
+            on_text(answer[i:i + 5])
+        message = SimpleNamespace(content=answer, tool_calls=None)
+        usage = SimpleNamespace(prompt_tokens=900, completion_tokens=80, total_tokens=980)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "AGENT_MODE", "unified")
+    monkeypatch.setattr(sales_agent, "MEMORY_ASYNC", False)
+    monkeypatch.setattr(sales_agent, "RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr(sales_agent, "chat_completion_stream", fake_stream)
+
+    clone = seed_clone("stream")
+
+    stream = ReplyStream(send=send, presence=lambda state: events.append(f"presence:{state}"))
+    result = sales_agent.process_message_with_agent(db, clone, "c-stream", "Cuánto sale el Corolla?", reply_stream=stream)
+
+    sent = [e[5:] for e in events if e.startswith("send:")]
+    assert result["response"] == REPLY and "\n\n".join(sent) == REPLY.replace(" Eso", "\n\nEso")
+    assert result["delivered"] == sent and len(sent) == 3
+    # Sends leave the thread holding the LLM slot; presence only at start and end
+    assert senders and threading.current_thread().name not in senders
+    assert [e for e in events if e.startswith("presence:")] == ["presence:composing", "presence:paused"]
+    assert events[-1] == "presence:paused"
+
+    metric = db.query(AgentTurnMetric).filter(AgentTurnMetric.client_id == "c-stream").one()
+    assert metric.first_message_ms is not None and metric.first_message_ms <= metric.reply_ms
+    assert result["timings"]["first_message_ms"] == metric.first_message_ms
+
+
+def test_unstreamed_reply_is_sent_at_finish():
+    sent = []
+    stream = ReplyStream(send=sent.append)
+    stream.begin(structured=True)
+    stream.on_text("No es JSON")  # Extractor finds no "reply": nothing goes out yet
+    assert sent == []
+    # Short replies stay one message
+    assert stream.finish("Hubo un error procesando tu solicitud. Intenta de nuevo.") == [
+        "Hubo un error procesando tu solicitud. Intenta de nuevo."
+    ]
+
+
+def test_slow_sender_keeps_order_and_finish_waits():
+    release, sent = threading.Event(), []
+
+    def slow_send(text):
+        release.wait(2)
+        sent.append(text)
+
+    stream = ReplyStream(send=slow_send)
+    stream.begin()
+    stream.on_text(REPLY[:80])  # First chunk queued, still being sent
+    assert sent == []
+    release.set()
+    # Stream broke off: only what was generated goes out, not the whole reply again
+    assert stream.finish("Otra respuesta distinta.") == sent == [
+        "¡Claro! El Corolla LE 2025 te queda en $389.50 al mes con 1.9% APR.", "Eso es con $"
+    ]
@@ -0,0 +1,127 @@
+import json
+import zlib
+from types import SimpleNamespace
+
+from app.models import AgentTurnMetric, Client
+from app.services.response_cache import ResponseCache, cache_scope, cacheable_reply, normalize_message
+from app.utils import sales_agent
+
+
+def bag_of_words(texts):
+    """Deterministic stand-in for the embeddings API"""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * 64
+        for word in text.split():
+            vector[zlib.crc32(word.encode()) % 64] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+USAGE = {"llm_calls": 2, "total_tokens": 2400, "tools": ["calculate_payment"]}
+SCOPE = "OFFER_BUILD|corolla|finance|2||new|v1"
+
+
+def test_exact_match_after_normalization():
+    cache = ResponseCache(embed=bag_of_words)
+    miss = cache.lookup("u1", SCOPE, "¿Aceptan ITIN?")
+    assert miss is not None and miss.entry is None
+    cache.store(miss, "Sí, trabajamos con ITIN.", USAGE, {"document_type": "itin"})
+
+    hit = cache.lookup("u1", SCOPE, "aceptan   itin")
+    assert hit.kind == "exact" and hit.entry.reply == "Sí, trabajamos con ITIN."
+    assert hit.entry.insights == {"document_type": "itin"}
+    # Other scope (different stage/slots) or other dealer: no hit
+    assert cache.lookup("u1", "INTAKE||||new|v1", "aceptan itin").entry is None
+    assert cache.lookup("u2", SCOPE, "aceptan itin").entry is None
+    # Too short to mean anything without the history
+    assert cache.lookup("u1", SCOPE, "ok") is None
+    assert normalize_message("¿Cuánto sale el Corolla?") == "cuanto sale el corolla"
+
+
+def test_semantic_match_respects_threshold():
+    embedded = []
+    cache = ResponseCache(embed=lambda texts: embedded.extend(texts) or bag_of_words(texts), similarity=0.8)
+    miss = cache.lookup("u1", SCOPE, "cuanto sale el corolla al mes")
+    assert embedded == []  # Empty scope: nothing to compare, no embeddings call
+    cache.store(miss, "El Corolla LE te queda en $389/mes.", USAGE).result()  # Vector added off the reply path
+    assert embedded == ["cuanto sale el corolla al mes"]
+
+    hit = cache.lookup("u1", SCOPE, "cuanto sale al mes el corolla")
+    assert hit.kind == "semantic" and hit.similarity > 0.99
+    assert hit.entry.reply == "El Corolla LE te queda en $389/mes."
+    assert cache.lookup("u1", SCOPE, "tienen fotos de la rav4 hibrida").entry is None
+
+    stats = cache.stats_for("u1")
+    assert (stats["lookups"], stats["hits"], stats["semantic_hits"]) == (3, 1, 1)
+    assert stats["llm_calls_saved"] == 2 and stats["tokens_saved"] == 2400
+    assert stats["hit_rate"] == round(1 / 3, 3)
+
+
+def test_invalidation_and_size_limit():
+    cache = ResponseCache(embed=bag_of_words, max_entries=3)
+    for i in range(5):
+        cache.store(cache.lookup("u1", SCOPE, f"pregunta numero {i} sobre el carro"), f"respuesta {i}", USAGE)
+    assert cache.stats_for("u1")["entries"] == 3
+    assert cache.lookup("u1", SCOPE, "pregunta numero 4 sobre el carro").kind == "exact"
+
+    cache.invalidate_user("u1")
+    assert cache.lookup("u1", SCOPE, "pregunta numero 4 sobre el carro").entry is None
+    assert cache.stats_for("u1")["invalidations"] == 1
+
+
+def test_only_self_contained_replies_are_cacheable():
+    assert cacheable_reply(USAGE, None, "El Corolla sale en $389/mes")
+    assert not cacheable_reply(USAGE, {"url": "x"}, "Aquí tienes las fotos")
+    assert not cacheable_reply({"llm_calls": 2, "tools": ["schedule_appointment"]}, None, "Agendado")
+    assert not cacheable_reply(USAGE, None, "Claro Pedro, te queda en $389", ["Pedro", "Pérez"])
+    assert cacheable_reply(USAGE, None, "Nos vemos mañana", ["Ana"])  # Whole words only
+
+    memory = SimpleNamespace(credit_score_mentioned=700, preferred_plan="lease", document_type=None)
+    state = {"stage": "OFFER_BUILD", "vehicle_interest": "Corolla"}
+    assert cache_scope(state, memory).startswith("OFFER_BUILD|corolla|lease|2||new|")
+    # Replies that build on a conversation are only shared by identical histories
+    history = [{"role": "seller", "text": "¡Hola! Tenemos Corolla 2025 en oferta."}]
+    other = [{"role": "buyer", "text": "Tengo mal crédito"}] + history
+    assert cache_scope(state, memory, history) == cache_scope(state, memory, list(history))
+    assert cache_scope(state, memory, history) not in (cache_scope(state, memory), cache_scope(state, memory, other))
+    assert cache_scope({**state, "conversation_summary": "Busca lease"}, memory, history) != cache_scope(state, memory, history)
+
+
+def test_agent_serves_repeated_question_from_cache(monkeypatch, db, seed_clone):
+    calls = []
+
+    def fake_chat(**kwargs):
+        calls.append(kwargs)
+        answer = json.dumps({"reply": "Sí, aceptamos ITIN y pasaporte.", "memory": {"document_type": "itin"}})
+        message = SimpleNamespace(content=answer, tool_calls=None)
+        usage = SimpleNamespace(prompt_tokens=2000, completion_tokens=40, total_tokens=2040)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    cache = ResponseCache(embed=bag_of_words)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(sales_agent, "AGENT_MODE", "unified")
+    monkeypatch.setattr(sales_agent, "MEMORY_ASYNC", False)
+    monkeypatch.setattr(sales_agent, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(sales_agent, "response_cache", cache)
+    monkeypatch.setattr(sales_agent, "chat_completion", fake_chat)
+
+    clone = seed_clone("cache", client_name="Ana Gómez", phone="5551")
+    db.add(Client(id="c-cache-b", user_id="u-cache", name="Luis Soto", phone="5552"))
+    db.commit()
+
+    first = sales_agent.process_message_with_agent(db, clone, "c-cache", "¿Aceptan ITIN?")
+    second = sales_agent.process_message_with_agent(db, clone, "c-cache-b", "aceptan itin??")
+    assert len(calls) == 1
+    assert second["response"] == first["response"] and second["agent_mode"] == "cache"
+
+    metric = db.query(AgentTurnMetric).filter(AgentTurnMetric.client_id == "c-cache-b").one()
+    assert (metric.mode, metric.llm_calls) == ("cache", 0)
+    assert cache.stats_for("u-cache")["llm_calls_saved"] == 1
+
+    # Different history, or an appointment request (forced tool call): no cached reply
+    history = [{"role": "buyer", "text": "Hola"}, {"role": "seller", "text": "¡Hola Luis!"}]
+    sales_agent.process_message_with_agent(db, clone, "c-cache-b", "¿Aceptan ITIN?", conversation_history=history)
+    lookups = cache.stats_for("u-cache")["lookups"]
+    sales_agent.process_message_with_agent(db, clone, "c-cache", "aceptan itin? nos vemos mañana")
+    assert len(calls) == 3 and cache.stats_for("u-cache")["lookups"] == lookups
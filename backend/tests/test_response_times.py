@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.base import Base
+from app.models import User, Client, ClientMemory, get_uuid
+from app.services import response_times
+from app.services.response_times import (
+    RESPONDER_AUTOMATION, record_response, get_response_time_report, sketch_add, sketch_quantile
+)
+
+engine = create_engine(
+    "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base.metadata.create_all(bind=engine)
+
+
+def _seed(db):
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    client = Client(id=get_uuid(), user_id=user_id, name="Lead", phone="5551234")
+    db.add(client)
+    db.add(ClientMemory(id=get_uuid(), client_id=client.id, user_id=user_id))
+    db.commit()
+    return user_id, client
+
+
+def test_reply_latency_pairs_turns():
+    db = TestingSessionLocal()
+    user_id, client = _seed(db)
+    t0 = datetime.utcnow()
+
+    # Lead writes twice; first AI reply 2 min after the FIRST unanswered message
+    assert record_response(db, client, "inbound", sent_at=t0) is None
+    assert record_response(db, client, "inbound", sent_at=t0 + timedelta(minutes=1)) is None
+    assert record_response(db, client, "outbound", ai_generated=True, sent_at=t0 + timedelta(minutes=2)) == 120
+    # Follow-up from us in the same turn is not a reply
+    assert record_response(db, client, "outbound", sent_at=t0 + timedelta(minutes=3)) is None
+    # Lead answers 10 min after our turn started
+    assert record_response(db, client, "inbound", sent_at=t0 + timedelta(minutes=12)) == 600
+    # Human replies 30 min later
+    assert record_response(db, client, "outbound", sent_at=t0 + timedelta(minutes=42)) == 1800
+    db.commit()
+
+    report = get_response_time_report(db, user_id)
+    assert report["first_response"]["count"] == 1
+    assert report["first_response"]["avg_minutes"] == 2.0
+    assert report["ai_reply"]["count"] == 1
+    assert report["human_reply"]["avg_minutes"] == 30.0
+    assert report["client_reply"]["count"] == 1
+    assert report["ai_speedup"] == 15.0
+
+    per_client = get_response_time_report(db, user_id, client.id)
+    assert per_client["scope"] == "client"
+    assert per_client["human_reply"]["count"] == 1
+
+    memory = db.query(ClientMemory).filter(ClientMemory.client_id == client.id).first()
+    assert memory.avg_response_time_minutes == 10
+    assert memory.response_speed == "fast"
+    db.close()
+
+
+def test_automation_sends_and_failures(monkeypatch):
+    db = TestingSessionLocal()
+    user_id, client = _seed(db)
+    t0 = datetime.utcnow()
+
+    record_response(db, client, "inbound", sent_at=t0)
+    assert record_response(db, client, "outbound", sent_at=t0 + timedelta(minutes=5), responder=RESPONDER_AUTOMATION) == 300
+    db.commit()
+    report = get_response_time_report(db, user_id)
+    assert report["automation_reply"]["count"] == 1 and report["human_reply"]["count"] == 0
+
+    # A failing stat update is rolled back to its savepoint; the caller's session still commits
+    def broken(*args, **kwargs):
+        raise RuntimeError("stat table locked")
+
+    monkeypatch.setattr(response_times, "_update_stat", broken)
+    record_response(db, client, "inbound", sent_at=t0 + timedelta(minutes=6))
+    memory = db.query(ClientMemory).filter(ClientMemory.client_id == client.id).one()
+    memory.personal_notes = "still writable"
+    db.commit()
+    assert db.query(ClientMemory.personal_notes).filter(ClientMemory.client_id == client.id).scalar() == "still writable"
+    assert get_response_time_report(db, user_id)["automation_reply"]["count"] == 1
+    db.close()
+
+
+def test_sketch_quantiles():
+    hist = None
+    for seconds in [30] * 50 + [3000] * 50:
+        hist = sketch_add(hist, seconds)
+
+    assert sum(hist) == 100
+    assert 20 <= sketch_quantile(hist, 0.25) <= 30
+    assert 2700 <= sketch_quantile(hist, 0.9) <= 3600
+    assert sketch_quantile(None, 0.5) is None
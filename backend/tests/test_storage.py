@@ -0,0 +1,139 @@
+import asyncio
+import io
+from app.services import storage as storage_module
+from app.services.storage import LocalStorage, S3Storage, set_storage
+
+
+class NotFound(Exception):
+    def __init__(self):
+        super().__init__("Not Found")
+        self.response = {"Error": {"Code": "404"}}
+
+
+class FakeS3:
+    """In-process stand-in for an S3-compatible server (MinIO-style), boto3 client surface"""
+
+    def __init__(self):
+        self.objects, self.uploads, self.calls = {}, {}, []
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.calls.append("put_object")
+        self.objects[(Bucket, Key)] = (Body.read(), ContentType)
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None):
+        self.calls.append("create_multipart_upload")
+        upload_id = f"up-{len(self.uploads)}"
+        self.uploads[upload_id] = ({}, ContentType)
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.calls.append("upload_part")
+        self.uploads[UploadId][0][PartNumber] = Body
+        return {"ETag": f'"part{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts, content_type = self.uploads.pop(UploadId)
+        body = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+        self.objects[(Bucket, Key)] = (body, content_type)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+    def head_object(self, Bucket, Key):
+        self.calls.append("head_object")
+        if (Bucket, Key) not in self.objects:
+            raise NotFound()
+        body, content_type = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(body), "ETag": '"e"', "ContentType": content_type}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + 2]
+        return {
+            "Contents": [{"Key": k, "Size": len(self.objects[(Bucket, k)][0])} for k in page],
+            "IsTruncated": start + 2 < len(keys),
+            "NextContinuationToken": str(start + 2),
+        }
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://minio.local/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def test_s3_multipart_presign_and_metadata_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, "MULTIPART_THRESHOLD_BYTES", 10)
+    monkeypatch.setattr(storage_module, "MULTIPART_PART_BYTES", 4)
+    fake = FakeS3()
+    s3 = S3Storage("media-bucket", client=fake, prefix="media/")
+
+    small, big = tmp_path / "small.jpg", tmp_path / "big.mp4"
+    small.write_bytes(b"tiny")
+    big.write_bytes(b"0123456789abcdef!")
+
+    s3.save_file("a.jpg", small, "image/jpeg")
+    s3.save_file("b.mp4", big, "video/mp4")
+    assert fake.objects[("media-bucket", "media/b.mp4")] == (b"0123456789abcdef!", "video/mp4")
+    assert fake.calls.count("upload_part") == 5 and not fake.uploads
+
+    # Metadata cache: repeated checks (hits and misses) cost one HEAD each
+    assert s3.exists("a.jpg") and s3.exists("a.jpg")
+    assert not s3.exists("zzz.jpg") and not s3.exists("zzz.jpg")
+    assert fake.calls.count("head_object") == 2
+    s3.delete("a.jpg")
+    assert not s3.exists("a.jpg")
+
+    # "Not found" expires quickly: an object another replica uploads shows up
+    monkeypatch.setattr(storage_module, "MISSING_TTL_SECONDS", 0)
+    assert not s3.exists("late.jpg")
+    fake.objects[("media-bucket", "media/late.jpg")] = (b"late", "image/jpeg")
+    assert s3.exists("late.jpg")
+
+    assert s3.url("b.mp4", expires=60) == "https://minio.local/media-bucket/media/b.mp4?X-Amz-Expires=60"
+    s3.save_file("c.pdf", small)
+    assert [o.key for o in s3.list_objects()] == ["b.mp4", "c.pdf", "late.jpg"]
+
+    s3.download("b.mp4", tmp_path / "copy.mp4")
+    assert (tmp_path / "copy.mp4").read_bytes() == b"0123456789abcdef!"
+
+
+def test_media_upload_goes_to_configured_backend(tmp_path):
+    from fastapi import UploadFile
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.db.base import Base
+    from app.models import User, get_uuid
+    from app.services.media_store import store_upload
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autoflush=False, bind=engine)()
+    user_id = get_uuid()
+    db.add(User(id=user_id, email=f"{user_id}@example.com", password_hash="x", name="Dealer"))
+    db.commit()
+
+    fake = FakeS3()
+    set_storage(S3Storage("bucket", client=fake, prefix=""))
+    try:
+        asset, _ = asyncio.run(store_upload(db, user_id, UploadFile(file=io.BytesIO(b"pdf bytes"), filename="f.pdf"),
+                                            "application/pdf", "document", tmp_path))
+        assert fake.objects[("bucket", asset.filename)] == (b"pdf bytes", "application/pdf")
+
+        # Working copy lost (redeploy): the object in storage still dedupes
+        (tmp_path / asset.filename).unlink()
+        _, hit = asyncio.run(store_upload(db, user_id, UploadFile(file=io.BytesIO(b"pdf bytes"), filename="g.pdf"),
+                                          "application/pdf", "document", tmp_path))
+        assert hit
+    finally:
+        set_storage(None)
+        db.close()
+
+    local = LocalStorage(tmp_path)
+    (tmp_path / "x.bin").write_bytes(b"12")
+    assert local.stat("x.bin").size == 2 and local.url("x.bin") is None
@@ -226,6 +226,14 @@ class BaileysClient {
         }
     }
 
+    async sendPresence(phone, state = 'composing') {
+        // composing = "escribiendo...", paused = clear it
+        if (!this.sock || this.state !== 'open') {
+            throw new Error(`WhatsApp no está conectado (State: ${this.state})`);
+        }
+        await this.sock.sendPresenceUpdate(state, this.formatPhone(phone));
+    }
+
     async sendMedia(phone, mediaUrl, mediaType, caption = '', options = {}) {
         if (!this.sock || this.state !== 'open') {
             throw new Error('WhatsApp no está conectado');
@@ -280,6 +280,27 @@ app.post('/api/whatsapp/send', async (req, res) => {
     }
 });
 
+// ============================================
+// PRESENCIA ("escribiendo..." mientras la IA genera)
+// ============================================
+app.post('/api/whatsapp/presence', async (req, res) => {
+    const { userId, phoneNumber, state } = req.body;
+    const presence = ['composing', 'paused', 'available', 'unavailable'].includes(state) ? state : 'composing';
+
+    const client = clients.get(userId);
+    if (!client || client.getState() !== 'open') {
+        return res.status(409).json({ status: 'error', message: 'No open session for this user' });
+    }
+
+    try {
+        await client.sendPresence(phoneNumber, presence);
+        res.json({ status: 'ok', state: presence });
+    } catch (error) {
+        console.error('[Presence] Error:', error.message);
+        res.status(500).json({ status: 'error', message: error.message });
+    }
+});
+
 // ============================================
 // ENVIAR MEDIA (Imagen, Video, Documento)
 // ============================================